@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+Measures diff time of the vendored diff_match_patch, against its
+specialization for bytes, over the README examples scaled to larger files.
+
+Each example pair (e.g. test-bytes1 and test-bytes2) is repeated at spread
+offsets of the same random content, so that both files are mostly equal,
+as in patched binaries.
+
+Both implementations run with the same timeout (by default, none), so that
+they do the same work. The specialization can place some edits differently,
+so when diffs differ, their edit lengths are compared instead.
+
+Usage:
+    ./bench_hexdiff.py --sizes 1 10
+"""
+
+from vendor.bin_diff_match_patch import diff_match_patch, diff_match_patch_bytes
+import argparse
+import os
+import random
+import time
+
+EXAMPLES = [
+    ("test-bytes1", "test-bytes2"),
+    ("test-bytes1", "test-bytes2-added"),
+]
+
+IMPLEMENTATIONS = {
+    "original": diff_match_patch,
+    "bytes": diff_match_patch_bytes,
+}
+
+
+def read_example(filename):
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), filename), "rb") as f:
+        return f.read()
+
+
+def generate_pair(base, derivative, size, count, seed=0):
+    """Random content of about `size` bytes, where `count` spread regions
+    are `base` in the first file and `derivative` in the second file."""
+    rng = random.Random(seed)
+    gap = max(size // count - len(base), 0)
+    c1 = bytearray()
+    c2 = bytearray()
+    for _ in range(count):
+        context = rng.randbytes(gap)
+        c1 += context + base
+        c2 += context + derivative
+    return (bytes(c1), bytes(c2))
+
+
+def measure(implementation, c1, c2, timeout=0):
+    dmp = IMPLEMENTATIONS[implementation]()
+    dmp.Diff_Timeout = timeout
+    start = time.perf_counter()
+    diff = dmp.diff_main(c1, c2)
+    diff_time = time.perf_counter() - start
+    return (diff, diff_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        type=float,
+        default=[1, 10],
+        help="input sizes in MB",
+    )
+    parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        default=16,
+        help="number of regions where each example pair differs",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=0,
+        help="seconds after which both implementations stop refining changes, or 0 for no limit",
+    )
+    parsed_args = parser.parse_args()
+
+    print(f"{'example':<32} {'size (MB)':>10} {'original (s)':>13} {'bytes (s)':>10} {'speedup':>8}")
+    for size in parsed_args.sizes:
+        for example in EXAMPLES:
+            (c1, c2) = generate_pair(
+                *map(read_example, example), int(size * 2 ** 20), parsed_args.count
+            )
+            (original_diff, original_time) = measure(
+                "original", c1, c2, parsed_args.timeout
+            )
+            (bytes_diff, bytes_time) = measure("bytes", c1, c2, parsed_args.timeout)
+            name = " -> ".join(example)
+            print(
+                f"{name:<32} {size:>10} {original_time:>13.3f} {bytes_time:>10.3f} "
+                f"{original_time / bytes_time:>7.1f}x"
+            )
+            if bytes_diff != original_diff:
+                dmp = diff_match_patch()
+                if parsed_args.timeout > 0 and max(original_time, bytes_time) > parsed_args.timeout:
+                    print("  stopped at the timeout, with less refined changes")
+                elif dmp.diff_levenshtein(bytes_diff) == dmp.diff_levenshtein(original_diff):
+                    print("  edits placed differently, with the same edit length")
+                else:
+                    print("  changes differ from the original")
@@ -6,16 +6,62 @@ Diffs two binary files.
 For the older version that first converted file bytes to hex
 before applying the diff, see ./hexdiff.bin2hex.py
 
+For large files, both can be split in content-defined chunks, where only
+chunks that are not found in both files are diffed.
+
+Files of the same length where few bytes differ (e.g. patched snapshots)
+are compared byte by byte, instead of searching for insertions and removals.
+
+Regions between aligned chunks or moves are independent, so they can be
+diffed in parallel by several processes.
+
+Blocks of the derivative found elsewhere in the base file (e.g. relocated
+sections) can be reported as moves, instead of removals and additions.
+
 TODO:
-- To workaround bad performance when comparing large files, split them by chunks, then compare chunks
 - Other formats (e.g. hexdump, disasm...)
 """
 
 import argparse
-from vendor.bin_diff_match_patch import diff_match_patch
-import gc
+from bisect import bisect_left
+import collections
+from vendor.bin_diff_match_patch import diff_match_patch_bytes
+import difflib
+import hashlib
+import itertools
+import multiprocessing
+import random
 import sys
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Random values added to the rolling hash of content-defined chunks for
+# each byte. Fixed, so that the same content is always split the same way.
+GEAR = random.Random(0).sample(range(2 ** 32), 256)
+
+# Maximum ratio of differing bytes for files of the same length to be
+# compared byte by byte. Above it, bytes were more likely shifted than
+# patched in place.
+IN_PLACE_MAX_RATIO = 1 / 16
+
+# Bytes compared at a time, to bound memory used for large files.
+IN_PLACE_BLOCK_SIZE = 2 ** 24
+
+# Bytes hashed at a time when splitting content-defined chunks, to bound
+# memory used for large files.
+CHUNK_BLOCK_SIZE = 2 ** 22
+
+# Size of content-defined chunks aligned before diffing regions in
+# parallel, when no other alignment was requested.
+JOBS_CHUNK_SIZE = 2 ** 16
+
+# Regions diffed or waiting to be output for each process, so that
+# processes are kept busy without holding all regions in memory.
+PENDING_REGIONS_PER_JOB = 4
+
 try:
     import colorama
 
@@ -53,24 +99,427 @@ except ImportError:
         return str(text)
 
 
-def diff_bytes(c1, c2):
-    dmp = diff_match_patch()
+def diff_bytes(c1, c2, timeout=None):
+    dmp = diff_match_patch_bytes()
+    if timeout is not None:
+        dmp.Diff_Timeout = timeout
     diff = dmp.diff_main(c1, c2)
     dmp.diff_cleanupSemantic(diff)
 
     return diff
 
 
+def diff_in_place(c1, c2, max_ratio=IN_PLACE_MAX_RATIO):
+    """Returns the same kind of diff as `diff_bytes()` for files of the same
+    length, where each run of differing bytes is a removal followed by an
+    addition at the same offset.
+
+    Returns None if lengths differ, numpy is not available, or more than
+    `max_ratio` of bytes differ. Otherwise, differing bytes are found before
+    returning, and changes are yielded as they are sliced from both files.
+    """
+    if np is None or len(c1) != len(c2):
+        return None
+    values1 = np.frombuffer(c1, dtype=np.uint8)
+    values2 = np.frombuffer(c2, dtype=np.uint8)
+    max_changed = max_ratio * len(c1)
+    changed = 0
+    edges = []
+    is_previous_changed = False
+    for start in range(0, len(c1), IN_PLACE_BLOCK_SIZE):
+        end = start + IN_PLACE_BLOCK_SIZE
+        is_changed = values1[start:end] != values2[start:end]
+        changed += np.count_nonzero(is_changed)
+        if changed > max_changed:
+            return None
+        if is_changed[0] != is_previous_changed:
+            edges.append(start)
+        edges.extend((np.flatnonzero(is_changed[1:] != is_changed[:-1]) + start + 1).tolist())
+        is_previous_changed = is_changed[-1]
+    if is_previous_changed:
+        edges.append(len(c1))
+    return _in_place_changes(c1, c2, edges)
+
+
+def _in_place_changes(c1, c2, edges):
+    end = 0
+    for start, next_end in zip(edges[::2], edges[1::2]):
+        if start > end:
+            yield (0, c1[end:start])
+        yield (-1, c1[start:next_end])
+        yield (1, c2[start:next_end])
+        end = next_end
+    if end < len(c1):
+        yield (0, c1[end:])
+
+
+def chunk_boundaries(content, chunk_size):
+    """Returns the end offsets of content-defined chunks of `content`, of
+    about `chunk_size` bytes (rounded down to a power of 2).
+
+    Chunks are cut after bytes where the low bits of a rolling hash (Gear
+    hash, where each byte shifts the hash and adds a random value) are zero,
+    so that boundaries only depend on the last bytes, and are found again
+    after insertions or removals. Chunks are kept between a quarter and 4
+    times `chunk_size`.
+
+    References:
+    - Xia, Wen et al. "FastCDC: a Fast and Efficient Content-Defined Chunking Approach for Data Deduplication." - USENIX ATC, 2016.
+    """
+    bits = max(chunk_size.bit_length() - 1, 1)
+    min_size = max(chunk_size // 4, 1)
+    max_size = chunk_size * 4
+    boundaries = []
+    start = 0
+    candidates = _chunk_candidates(content, bits)
+    for i in itertools.chain(candidates, [len(content) - 1]):
+        while i + 1 - start > max_size:
+            start += max_size
+            boundaries.append(start)
+        if i + 1 - start >= min_size or i + 1 == len(content):
+            start = i + 1
+            boundaries.append(start)
+    return boundaries
+
+
+def _chunk_candidates(content, bits):
+    """Yields offsets of bytes where the low `bits` bits of the rolling hash
+    are zero.
+
+    With numpy, hashes are computed for a block of bytes at a time. The low
+    bits of the hash only depend on the last `bits` bytes, so each block
+    starts with that many bytes of the previous one.
+    """
+    mask = (1 << bits) - 1
+    if np is None:
+        h = 0
+        for i, x in enumerate(content):
+            h = ((h << 1) + GEAR[x]) & mask
+            if h == 0:
+                yield i
+        return
+
+    gear_values = np.array(GEAR, dtype=np.uint32)
+    view = memoryview(content)
+    for start in range(0, len(content), CHUNK_BLOCK_SIZE):
+        block_start = max(start - (bits - 1), 0)
+        block = view[block_start : start + CHUNK_BLOCK_SIZE]
+        values = np.frombuffer(block, dtype=np.uint8)
+        gear = gear_values[values]
+        hashes = gear.copy()
+        for j in range(1, min(bits, len(values))):
+            hashes[j:] += gear[:-j] << np.uint32(j)
+        skipped = start - block_start
+        is_candidate = (hashes[skipped:] & np.uint32(mask)) == 0
+        yield from (np.flatnonzero(is_candidate) + start).tolist()
+
+
+def diff_chunks(c1, c2, chunk_size, jobs=1, timeout=None):
+    """Yields the same changes as `diff_bytes()`, where both contents are
+    split in content-defined chunks, which are aligned by their digest, then
+    only unaligned chunks are diffed."""
+    return join_changes(
+        diff_regions(_chunks_changes(c1, c2, chunk_size), jobs, timeout)
+    )
+
+
+def _chunks_changes(c1, c2, chunk_size):
+    chunks = []
+    digests = []
+    for c in (c1, c2):
+        start = 0
+        c_chunks = []
+        for end in chunk_boundaries(c, chunk_size):
+            c_chunks.append((start, end))
+            start = end
+        chunks.append(c_chunks)
+        digests.append(
+            [hashlib.blake2b(c[start:end], digest_size=16).digest() for start, end in c_chunks]
+        )
+
+    matcher = difflib.SequenceMatcher(None, digests[0], digests[1], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        start1 = chunks[0][i1][0] if i1 < i2 else None
+        end1 = chunks[0][i2 - 1][1] if i1 < i2 else None
+        start2 = chunks[1][j1][0] if j1 < j2 else None
+        end2 = chunks[1][j2 - 1][1] if j1 < j2 else None
+        if tag == "equal":
+            region_diff = [(0, c1[start1:end1])]
+        elif tag == "delete":
+            region_diff = [(-1, c1[start1:end1])]
+        elif tag == "insert":
+            region_diff = [(1, c2[start2:end2])]
+        else:
+            region_diff = [(None, c1[start1:end1], c2[start2:end2])]
+        yield from region_diff
+
+
+def diff_regions(changes, jobs=1, timeout=None):
+    """Yields changes, where each region to diff, given as a change
+    `(None, bytes1, bytes2)`, is replaced by the changes of `diff_bytes()`.
+
+    With more than one job, regions are diffed in a pool of processes, each
+    region with its own timeout, while changes are still yielded in order.
+    """
+    if jobs <= 1:
+        for change in changes:
+            if change[0] is None:
+                yield from diff_bytes(change[1], change[2], timeout)
+            else:
+                yield change
+        return
+
+    with multiprocessing.Pool(jobs) as pool:
+        pending = collections.deque()
+        for change in changes:
+            if change[0] is None:
+                pending.append(
+                    pool.apply_async(diff_bytes, (change[1], change[2], timeout))
+                )
+            else:
+                pending.append([change])
+            while len(pending) > jobs * PENDING_REGIONS_PER_JOB:
+                yield from _pending_changes(pending.popleft())
+        while pending:
+            yield from _pending_changes(pending.popleft())
+
+
+def _pending_changes(pending_changes):
+    if isinstance(pending_changes, list):
+        return pending_changes
+    return pending_changes.get()
+
+
+def join_changes(changes):
+    """Yields changes, joining consecutive equal bytes and skipping empty
+    changes."""
+    equal_chunks = []
+    for change in changes:
+        if len(change[1]) == 0:
+            continue
+        if change[0] == 0:
+            equal_chunks.append(change[1])
+            continue
+        if equal_chunks:
+            yield (0, b"".join(equal_chunks))
+            equal_chunks = []
+        yield change
+    if equal_chunks:
+        yield (0, b"".join(equal_chunks))
+
+
+def _common_length(c1, i, c2, j, limit=None, reverse=False):
+    """Returns the length of common bytes of c1 and c2 starting at i and j,
+    or ending before them if `reverse`, up to `limit` bytes."""
+    if limit is None:
+        limit = min(len(c1) - i, len(c2) - j)
+    length = 0
+    step = 64
+    while length < limit:
+        n = min(step, limit - length)
+        if reverse:
+            x = c1[i - length - n : i - length][::-1]
+            y = c2[j - length - n : j - length][::-1]
+        else:
+            x = c1[i + length : i + length + n]
+            y = c2[j + length : j + length + n]
+        if x != y:
+            k = 0
+            while x[k] == y[k]:
+                k += 1
+            return length + k
+        length += n
+        step *= 2
+    return length
+
+
+def _weak_hashes(values, starts, block_size):
+    """Returns the rsync rolling checksums of blocks starting at the given
+    positions, computed from prefix sums instead of rolling.
+
+    Sums can overflow, but only their low 16 bits are kept.
+    """
+    sums = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    weighted = np.concatenate(
+        ([0], np.cumsum(values * np.arange(len(values), dtype=np.int64)))
+    )
+    ends = starts + block_size
+    a = sums[ends] - sums[starts]
+    b = block_size * a - (weighted[ends] - weighted[starts] - starts * a)
+    return (a & 0xFFFF) | ((b & 0xFFFF) << 16)
+
+
+def find_copies(c1, c2, block_size):
+    """Returns tuples `(start2, end2, start1)` for regions of c2 that are
+    found in c1 at `start1`, in increasing order of `start2`.
+
+    As in rsync, blocks of c1 at multiples of `block_size` are indexed by a
+    rolling checksum, which is compared with the checksum at each offset of
+    c2. Matched blocks are then extended byte by byte in both directions
+    (as in bsdiff).
+
+    References:
+    - Tridgell, Andrew; Mackerras, Paul. "The rsync algorithm." - Technical Report TR-CS-96-05, 1996.
+    """
+    if np is None:
+        raise RuntimeError("Move detection requires numpy.")
+    if len(c1) < block_size or len(c2) < block_size:
+        return []
+    values1 = np.frombuffer(c1, dtype=np.uint8)
+    values2 = np.frombuffer(c2, dtype=np.uint8)
+    starts1 = np.arange(0, len(c1) - block_size + 1, block_size)
+    hashes1 = _weak_hashes(values1, starts1, block_size)
+    blocks = {}
+    for h, start1 in zip(hashes1.tolist(), starts1.tolist()):
+        blocks.setdefault(h, []).append(start1)
+    hashes2 = _weak_hashes(
+        values2, np.arange(len(c2) - block_size + 1), block_size
+    )
+    candidates = np.flatnonzero(np.isin(hashes2, hashes1))
+    hashes2 = hashes2[candidates].tolist()
+    candidates = candidates.tolist()
+
+    copies = []
+    end2 = 0
+    i = 0
+    while i < len(candidates):
+        start2 = candidates[i]
+        # Prefer continuing in the same order as the previous copy.
+        starts1 = blocks[hashes2[i]]
+        if copies:
+            expected = copies[-1][2] + (start2 - copies[-1][0])
+            starts1 = [expected] + starts1
+        for start1 in starts1:
+            if c1[start1 : start1 + block_size] != c2[start2 : start2 + block_size]:
+                continue
+            back = _common_length(
+                c1, start1, c2, start2, min(start1, start2 - end2), reverse=True
+            )
+            forward = _common_length(c1, start1 + block_size, c2, start2 + block_size)
+            end2 = start2 + block_size + forward
+            copies.append((start2 - back, end2, start1 - back))
+            i = bisect_left(candidates, end2, i)
+            break
+        else:
+            i += 1
+    return copies
+
+
+def _increasing_copies(copies):
+    """Returns the indexes of the longest subsequence of copies with
+    increasing and non-overlapping regions in c1 (i.e. not moved)."""
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(copies)
+    for n, (_, _, start1) in enumerate(copies):
+        k = bisect_left(tails, start1)
+        if k > 0:
+            previous[n] = tail_indexes[k - 1]
+        if k == len(tails):
+            tails.append(start1)
+            tail_indexes.append(n)
+        else:
+            tails[k] = start1
+            tail_indexes[k] = n
+    indexes = []
+    n = tail_indexes[-1] if tail_indexes else -1
+    while n >= 0:
+        indexes.append(n)
+        n = previous[n]
+    indexes.reverse()
+
+    kept = []
+    end1 = 0
+    for n in indexes:
+        (start2, end2, start1) = copies[n]
+        if start1 >= end1:
+            kept.append(n)
+            end1 = start1 + end2 - start2
+    return kept
+
+
+def diff_moves(c1, c2, block_size, jobs=1, timeout=None):
+    """Yields the same changes as `diff_bytes()`, where regions of c2 found
+    at an earlier or later position in c1 are moves.
+
+    A moved region is an addition `(2, bytes, start1)` in c2, and its
+    source is a removal `(-2, bytes, start2)` in c1, if it is not part of
+    other copies. Only the remaining regions between copies are diffed.
+    """
+    return join_changes(
+        diff_regions(_moves_changes(c1, c2, block_size), jobs, timeout)
+    )
+
+
+def _moves_changes(c1, c2, block_size):
+    copies = find_copies(c1, c2, block_size)
+    anchors = _increasing_copies(copies)
+    anchor_set = set(anchors)
+    moves = [copies[n] for n in range(len(copies)) if n not in anchor_set]
+    sources = sorted((start1, start1 + end2 - start2, start2) for start2, end2, start1 in moves)
+    source_starts = [x[0] for x in sources]
+
+    (pos1, pos2) = (0, 0)
+    move_i = 0
+    for start2, end2, start1 in [copies[n] for n in anchors] + [(len(c2), len(c2), len(c1))]:
+        # Regions of c2 between anchors, in order.
+        pieces2 = []
+        while move_i < len(moves) and moves[move_i][0] < start2:
+            (move_start2, move_end2, move_start1) = moves[move_i]
+            pieces2.append((1, c2[pos2:move_start2]))
+            pieces2.append((2, c2[move_start2:move_end2], move_start1))
+            pos2 = move_end2
+            move_i += 1
+        pieces2.append((1, c2[pos2:start2]))
+
+        # Regions of c1 between anchors, in order.
+        pieces1 = []
+        k = max(bisect_left(source_starts, pos1) - 1, 0)
+        while k < len(sources) and sources[k][0] < start1:
+            (source_start1, source_end1, source_start2) = sources[k]
+            k += 1
+            if source_start1 < pos1 or source_end1 > start1:
+                continue
+            pieces1.append((-1, c1[pos1:source_start1]))
+            pieces1.append((-2, c1[source_start1:source_end1], source_start2))
+            pos1 = source_end1
+        pieces1.append((-1, c1[pos1:start1]))
+
+        pieces1 = [x for x in pieces1 if len(x[1]) > 0]
+        pieces2 = [x for x in pieces2 if len(x[1]) > 0]
+        (i, j) = (0, 0)
+        while i < len(pieces1) or j < len(pieces2):
+            if i < len(pieces1) and (pieces1[i][0] == -2 or j == len(pieces2)):
+                yield pieces1[i]
+                i += 1
+            elif j < len(pieces2) and (pieces2[j][0] == 2 or i == len(pieces1)):
+                yield pieces2[j]
+                j += 1
+            else:
+                yield (None, pieces1[i][1], pieces2[j][1])
+                i += 1
+                j += 1
+
+        yield (0, c2[start2:end2])
+        (pos1, pos2) = (start1 + end2 - start2, end2)
+
+
 def print_unified_format(elements, parsed_args, just_len, display_len):
-    print(highlight_filename(f"--- {parsed_args.base}"))
-    print(highlight_filename(f"+++ {parsed_args.derivative}"))
+    for line in format_unified(elements, parsed_args, just_len, display_len):
+        print(line)
+
+
+def format_unified(elements, parsed_args, just_len, display_len):
+    """Yields output lines for each element of `unified_format()`."""
+    yield highlight_filename(f"--- {parsed_args.base}")
+    yield highlight_filename(f"+++ {parsed_args.derivative}")
 
     change_symbol = None
     base_offset = 0
     next_base_offset = 0
     offset = 0
     next_offset = 0
-    for change_type, change_symbol, base_offset, offset, chunk_bin in elements:
+    for change_type, change_symbol, base_offset, offset, chunk_bin, *moved in elements:
         line = change_symbol
         if base_offset != offset:
             line += f"{hex(base_offset // 2).rjust(just_len)},"
@@ -78,7 +527,9 @@ def print_unified_format(elements, parsed_args, just_len, display_len):
             line += "".rjust(just_len + 1)
         line += f"{hex(offset // 2).rjust(just_len)}: "
 
-        if (change_type == 0 or parsed_args.all_diffs) and len(chunk_bin) > display_len:
+        if (
+            change_type in (0, -2, 2) or parsed_args.all_diffs
+        ) and len(chunk_bin) > display_len:
             # Ommit middle bytes when outputting large differences.
             # Prefer displaying more start bytes than end bytes, as relevant
             # info is more likely to be at start (e.g. metadata, headers...).
@@ -95,18 +546,24 @@ def print_unified_format(elements, parsed_args, just_len, display_len):
             if not parsed_args.only_hex:
                 output_bytes += f" -> {chunk_bin}"
         line += output_bytes
-
-        if change_type == 1:
-            print(highlight_addition(line))
-        elif change_type == -1:
-            print(highlight_removal(line))
+        if change_type == 2:
+            line += f" (moved from {hex(moved[0])})"
+        elif change_type == -2:
+            line += f" (moved to {hex(moved[0])})"
+
+        if change_type > 0:
+            yield highlight_addition(line)
+        elif change_type < 0:
+            yield highlight_removal(line)
         else:
-            print(line)
+            yield line
 
 
 def unified_format(diff):
-    elements = []
-
+    """Yields a tuple `(change_type, change_symbol, base_offset, offset,
+    chunk_bin)` for each change of a diff, followed by any other fields of
+    the change (e.g. the other offset of moves). Offsets are doubled, as in
+    hex-encoded bytes."""
     change_symbol = None
     base_offset = 0
     next_base_offset = 0
@@ -116,10 +573,10 @@ def unified_format(diff):
         change_type = pair[0]
         chunk_bin = pair[1]
         chunk_len = len(chunk_bin) * 2
-        if change_type == -1:
+        if change_type < 0:
             change_symbol = "-"
             next_base_offset += chunk_len
-        elif change_type == 1:
+        elif change_type > 0:
             change_symbol = "+"
             next_offset += chunk_len
         elif change_type == 0:
@@ -129,14 +586,12 @@ def unified_format(diff):
             offset = next_offset
             next_offset += chunk_len
 
-        elements.append((change_type, change_symbol, base_offset, offset, chunk_bin))
+        yield (change_type, change_symbol, base_offset, offset, chunk_bin) + tuple(pair[2:])
 
         if change_type == 0:
             offset = next_offset
             base_offset = next_base_offset
 
-    return elements
-
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -152,6 +607,13 @@ if __name__ == "__main__":
         action="store_true",
         help="align offsets in justified columns (as many as the number of compared files); only applies when diffs include added/removed bytes, since the next changesets will occur on distinct offsets",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=f"number of processes diffing regions between aligned chunks or moves in parallel (without -m or -s, files are aligned in content-defined chunks of about {JOBS_CHUNK_SIZE} bytes)",
+    )
     parser.add_argument(
         "-l",
         "--length",
@@ -159,6 +621,27 @@ if __name__ == "__main__":
         default=80,
         help="maximum display length used in output chunks",
     )
+    alignment = parser.add_mutually_exclusive_group()
+    alignment.add_argument(
+        "-m",
+        "--moves",
+        type=int,
+        metavar="BLOCK_SIZE",
+        help="report regions of at least this many bytes (e.g. 64) that moved, instead of diffing them as removals and additions (requires numpy)",
+    )
+    alignment.add_argument(
+        "-s",
+        "--chunk-size",
+        type=int,
+        help="split files in content-defined chunks of about this many bytes (e.g. 65536), then only diff chunks not found in both files, for large files",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=1.0,
+        help="seconds after which diffing a region (or both files) stops refining changes, or 0 for no limit",
+    )
     parser.add_argument(
         "-x",
         "--only-hex",
@@ -174,15 +657,21 @@ if __name__ == "__main__":
     with open(filename_old, "rb") as f1, open(filename_new, "rb") as f2:
         c1 = f1.read()
         c2 = f2.read()
-    diff = diff_bytes(c1, c2)
+    jobs = parsed_args.jobs
+    timeout = parsed_args.timeout
+    if parsed_args.moves:
+        diff = diff_moves(c1, c2, parsed_args.moves, jobs, timeout)
+    elif parsed_args.chunk_size:
+        diff = diff_chunks(c1, c2, parsed_args.chunk_size, jobs, timeout)
+    else:
+        diff = diff_in_place(c1, c2)
+        if diff is None and jobs > 1:
+            diff = diff_chunks(c1, c2, JOBS_CHUNK_SIZE, jobs, timeout)
+        elif diff is None:
+            diff = diff_bytes(c1, c2, timeout)
     just_len = max(len(hex(len(c1))), len(hex(len(c2))))
-    del c1
-    del c2
-    gc.collect()
 
+    # Changes are formatted and output while the diff is produced.
     elements = unified_format(diff)
-    del diff
-    gc.collect()
-
     display_len = parsed_args.length
     print_unified_format(elements, parsed_args, just_len, display_len)
@@ -1,66 +1,317 @@
 #!/usr/bin/env python3
 
-from hexdiff import diff_bytes, isolate_bytes, unified_format
+from hexdiff import (
+    chunk_boundaries,
+    diff_bytes,
+    diff_chunks,
+    diff_in_place,
+    diff_moves,
+    format_unified,
+    unified_format,
+)
+import argparse
+import hexdiff
+import itertools
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
 import unittest
+import unittest.mock
+from vendor.bin_diff_match_patch import diff_match_patch, diff_match_patch_bytes
+
+HEXDIFF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hexdiff.py")
+
+
+def rebuild(diff):
+    """Returns the base and derivative contents described by a diff."""
+    c1 = []
+    c2 = []
+    for change_type, chunk_bin, *_ in diff:
+        if change_type <= 0:
+            c1.append(chunk_bin)
+        if change_type >= 0:
+            c2.append(chunk_bin)
+    return (b"".join(c1), b"".join(c2))
+
+
+def rebuild_output(output):
+    """Returns the base and derivative contents described by the output of
+    hexdiff.py with only hex bytes, none of them omitted."""
+    c1 = []
+    c2 = []
+    output = re.sub(rb"\x1b\[[0-9;]*m", b"", output).decode("ascii")
+    for line in output.splitlines()[2:]:
+        (offsets, chunk_hex) = line[1:].split(": ", 1)
+        chunk_bin = bytes.fromhex(chunk_hex.split(" ")[0])
+        if line[0] == " ":
+            # Offsets of equal bytes are their position in both contents.
+            (base_offset, _, offset) = offsets.strip().rpartition(",")
+            assert int(base_offset or offset, 16) == len(b"".join(c1))
+            assert int(offset, 16) == len(b"".join(c2))
+        if line[0] in " -":
+            c1.append(chunk_bin)
+        if line[0] in " +":
+            c2.append(chunk_bin)
+    return (b"".join(c1), b"".join(c2))
+
+
+def random_edits(rng, content, count):
+    """Returns content with random insertions, removals and replacements."""
+    content = bytearray(content)
+    for _ in range(count):
+        start = rng.randrange(len(content) + 1)
+        length = rng.randint(1, 64)
+        edit = rng.choice(["insert", "remove", "replace"])
+        if edit != "insert":
+            del content[start : start + length]
+        if edit != "remove":
+            content[start:start] = rng.randbytes(length)
+    return bytes(content)
 
 
 class Tests(unittest.TestCase):
     def test_no_diff(self):
         c1 = b"ab\n"
         c2 = c1[:]
-        expected_diff = [(0, "61620a")]
-        expected_isolated_diff = expected_diff[:]
+        expected_diff = [(0, b"ab\n")]
         expected_offsets = [0]
-        self.assertDiffs(
-            c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-        )
+        self.assertDiffs(c1, c2, expected_diff, expected_offsets)
 
     def test_add_1(self):
         c1 = b"aa\n"
         c2 = b"aba\n"
-        expected_diff = [(0, "616"), (1, "26"), (0, "10a")]
-        expected_isolated_diff = [(0, "61"), (1, "62"), (0, "610a")]
+        expected_diff = [(0, b"a"), (1, b"b"), (0, b"a\n")]
         expected_offsets = [0, 1, 2]
-        self.assertDiffs(
-            c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-        )
+        self.assertDiffs(c1, c2, expected_diff, expected_offsets)
 
     def test_sub_1(self):
         c1 = b"aab\n"
         c2 = b"ab\n"
-        expected_diff = [(0, "616"), (-1, "16"), (0, "20a")]
-        expected_isolated_diff = [(0, "61"), (-1, "61"), (0, "620a")]
-        expected_offsets = [0, 1, 1]
-        self.assertDiffs(
-            c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-        )
+        expected_diff = [(-1, b"a"), (0, b"ab\n")]
+        expected_offsets = [0, 0]
+        self.assertDiffs(c1, c2, expected_diff, expected_offsets)
 
     def test_subadd_1_same_len(self):
         c1 = b"ab\n"
         c2 = b"ac\n"
-        expected_diff = [(0, "616"), (-1, "2"), (1, "3"), (0, "0a")]
-        expected_isolated_diff = [(0, "61"), (-1, "62"), (1, "63"), (0, "0a")]
+        expected_diff = [(0, b"a"), (-1, b"b"), (1, b"c"), (0, b"\n")]
         expected_offsets = [0, 1, 1, 2]
-        self.assertDiffs(
-            c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-        )
+        self.assertDiffs(c1, c2, expected_diff, expected_offsets)
 
     def test_many_diffs(self):
         c1 = b"abaababbbbbb"
         c2 = b"acaacacc"
-        expected_diff = [(0, '616'), (-1, '2'), (1, '3'), (0, '61616'), (-1, '2'), (1, '3'), (0, '616'), (-1, '26262626262'), (1, '363')]
-        expected_isolated_diff = [(0, '61'), (-1, '62'), (1, '63'), (0, '6161'), (-1, '62'), (1, '63'), (0, '61'), (-1, '626262626262'), (1, '6363')]
-        expected_offsets = [0, 1, 1, 2, 4, 4, 5, 6, 6]
-        self.assertDiffs(
-            c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-        )
+        expected_diff = [(0, b"a"), (-1, b"b"), (1, b"c"), (0, b"aa"), (-1, b"babbbbbb"), (1, b"cacc")]
+        expected_offsets = [0, 1, 1, 2, 4, 4]
+        self.assertDiffs(c1, c2, expected_diff, expected_offsets)
 
-    def assertDiffs(
-        self, c1, c2, expected_diff, expected_isolated_diff, expected_offsets
-    ):
+    def assertDiffs(self, c1, c2, expected_diff, expected_offsets):
         diff = diff_bytes(c1, c2)
         self.assertListEqual(diff, expected_diff)
-        isolated_diff = isolate_bytes(diff)
-        self.assertListEqual(isolated_diff, expected_isolated_diff)
-        offsets = list(map(lambda x: x[3] // 2, unified_format(isolated_diff)))  # Extract derivative byte offsets, converted from hex offsets
+        self.assertEqual(rebuild(diff), (c1, c2))
+        offsets = list(map(lambda x: x[3] // 2, unified_format(diff)))  # Extract derivative byte offsets, converted from hex offsets
         self.assertListEqual(offsets, expected_offsets)
+
+    def test_chunk_boundaries(self):
+        rng = random.Random(0)
+        content = rng.randbytes(20000)
+        for chunk_size in [1, 16, 1024]:
+            boundaries = chunk_boundaries(content, chunk_size)
+            self.assertEqual(boundaries[-1], len(content))
+            sizes = [end - start for start, end in zip([0] + boundaries, boundaries)]
+            self.assertLessEqual(max(sizes), chunk_size * 4)
+            with unittest.mock.patch.object(hexdiff, "np", None):
+                self.assertListEqual(chunk_boundaries(content, chunk_size), boundaries)
+            # Hashed in blocks shorter than the bytes each hash depends on.
+            for block_size in [1, 7, 1000]:
+                with unittest.mock.patch.object(hexdiff, "CHUNK_BLOCK_SIZE", block_size):
+                    self.assertListEqual(
+                        chunk_boundaries(content, chunk_size), boundaries
+                    )
+
+    def test_diff_chunks(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            c1 = rng.randbytes(rng.randint(0, 5000))
+            c2 = random_edits(rng, c1, rng.randint(0, 5))
+            for chunk_size in [16, 256]:
+                diff = list(diff_chunks(c1, c2, chunk_size))
+                self.assertEqual(rebuild(diff), (c1, c2))
+                # Changes are joined, without empty ones.
+                self.assertTrue(all(len(x[1]) > 0 for x in diff))
+                self.assertFalse(
+                    any(x[0] == y[0] == 0 for x, y in zip(diff, diff[1:]))
+                )
+
+    @unittest.skipIf(hexdiff.np is None, "requires numpy")
+    def test_diff_moves(self):
+        rng = random.Random(0)
+        blocks = [rng.randbytes(300) for _ in range(6)]
+        c1 = b"".join(blocks)
+        # Last block moved to the start, with other edits.
+        c2 = random_edits(rng, b"".join(blocks[-1:] + blocks[:-1]), 3)
+        diff = list(diff_moves(c1, c2, 64))
+        self.assertEqual(rebuild(diff), (c1, c2))
+        self.assertIn(2, [x[0] for x in diff])
+        self.assertIn(-2, [x[0] for x in diff])
+
+        for _ in range(20):
+            blocks = [rng.randbytes(rng.randint(0, 500)) for _ in range(6)]
+            c1 = b"".join(blocks)
+            rng.shuffle(blocks)
+            c2 = random_edits(rng, b"".join(blocks), rng.randint(0, 5))
+            for block_size in [16, 64]:
+                diff = list(diff_moves(c1, c2, block_size))
+                self.assertEqual(rebuild(diff), (c1, c2))
+                for change_type, chunk_bin, *moved in diff:
+                    # Moved bytes are found at the other offset.
+                    if change_type == 2:
+                        other = c1[moved[0] : moved[0] + len(chunk_bin)]
+                        self.assertEqual(other, chunk_bin)
+                    elif change_type == -2:
+                        other = c2[moved[0] : moved[0] + len(chunk_bin)]
+                        self.assertEqual(other, chunk_bin)
+
+    def test_moves_or_chunks(self):
+        result = subprocess.run(
+            [sys.executable, HEXDIFF_PATH, "-m", "64", "-s", "1024", "a", "b"],
+            capture_output=True,
+        )
+        self.assertEqual(result.returncode, 2)
+        self.assertIn(b"not allowed with", result.stderr)
+
+    @unittest.skipIf(hexdiff.np is None, "requires numpy")
+    def test_diff_in_place(self):
+        rng = random.Random(0)
+        c1 = rng.randbytes(1000)
+        c2 = bytearray(c1)
+        # Changes at both ends and across blocks.
+        for start in [0, 5, 6, 30, 62, 500, 998]:
+            c2[start : start + 2] = rng.randbytes(2)
+        c2 = bytes(c2)
+        for block_size in [1, 7, 32, 4096]:
+            with unittest.mock.patch.object(hexdiff, "IN_PLACE_BLOCK_SIZE", block_size):
+                diff = list(diff_in_place(c1, c2))
+            self.assertEqual(rebuild(diff), (c1, c2))
+            for x, y in zip(diff, diff[1:]):
+                if x[0] == -1:
+                    self.assertEqual(y[0], 1)
+                    self.assertEqual(len(x[1]), len(y[1]))
+                self.assertNotEqual(x[0], y[0])
+
+        self.assertListEqual(list(diff_in_place(c1, c1)), [(0, c1)])
+        self.assertEqual(diff_in_place(c1, c2[1:]), None)
+        self.assertEqual(diff_in_place(c1, rng.randbytes(1000)), None)
+        with unittest.mock.patch.object(hexdiff, "np", None):
+            self.assertEqual(diff_in_place(c1, c2), None)
+
+    def test_output(self):
+        rng = random.Random(0)
+        blocks = [rng.randbytes(300) for _ in range(6)]
+        c1 = b"".join(blocks)
+        c2 = random_edits(rng, b"".join(blocks[-1:] + blocks[:-1]), 3)
+        c2_in_place = bytearray(c1)
+        c2_in_place[100:104] = b"\0\1\2\3"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = []
+            contents = [("c1", c1), ("c2", c2), ("c2_in_place", c2_in_place)]
+            for name, content in contents:
+                filenames.append(os.path.join(tmp_dir, name))
+                with open(filenames[-1], "wb") as f:
+                    f.write(content)
+            for args, filename2, content2 in [
+                ([], filenames[1], c2),
+                ([], filenames[2], c2_in_place),
+                (["-s", "64"], filenames[1], c2),
+                (["-m", "64"], filenames[1], c2),
+            ]:
+                output = subprocess.check_output(
+                    [sys.executable, HEXDIFF_PATH, "-x", "-l", "100000"]
+                    + args
+                    + [filenames[0], filename2]
+                )
+                self.assertEqual(rebuild_output(output), (c1, content2))
+
+    def test_output_streamed(self):
+        rng = random.Random(0)
+        c1 = rng.randbytes(20000)
+        c2 = random_edits(rng, c1, 20)
+        parsed_args = argparse.Namespace(
+            base="c1", derivative="c2", columns=False, all_diffs=True, only_hex=True
+        )
+        diff = list(diff_chunks(c1, c2, 64))
+        lines = list(format_unified(unified_format(diff), parsed_args, 8, 80))
+        with unittest.mock.patch.object(
+            hexdiff, "diff_bytes", side_effect=diff_bytes
+        ) as mock_diff_bytes:
+            streamed_lines = format_unified(
+                unified_format(diff_chunks(c1, c2, 64)), parsed_args, 8, 80
+            )
+            # The first lines are output before the last regions are diffed.
+            self.assertListEqual([next(streamed_lines) for _ in range(4)], lines[:4])
+            calls = mock_diff_bytes.call_count
+            self.assertListEqual(list(streamed_lines), lines[4:])
+            self.assertLess(calls, mock_diff_bytes.call_count)
+
+    def test_jobs(self):
+        rng = random.Random(0)
+        c1 = rng.randbytes(20000)
+        c2 = random_edits(rng, c1, 20)
+        with unittest.mock.patch.object(hexdiff, "PENDING_REGIONS_PER_JOB", 1):
+            diff = list(diff_chunks(c1, c2, 64, jobs=2))
+            self.assertListEqual(diff, list(diff_chunks(c1, c2, 64)))
+            self.assertEqual(rebuild(diff), (c1, c2))
+            if hexdiff.np is not None:
+                diff = list(diff_moves(c1, c2, 64, jobs=2))
+                self.assertListEqual(diff, list(diff_moves(c1, c2, 64)))
+                self.assertEqual(rebuild(diff), (c1, c2))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = [os.path.join(tmp_dir, name) for name in ["c1", "c2"]]
+            for filename, content in zip(filenames, [c1, c2]):
+                with open(filename, "wb") as f:
+                    f.write(content)
+            # Aligned in chunks when no other alignment is given.
+            output = subprocess.check_output(
+                [sys.executable, HEXDIFF_PATH, "-x", "-l", "100000", "-j", "2"]
+                + filenames
+            )
+            self.assertEqual(rebuild_output(output), (c1, c2))
+
+    def test_diff_match_patch_bytes(self):
+        contents = []
+        for filename in ["test-bytes1", "test-bytes2", "test-bytes2-added"]:
+            with open(filename, "rb") as f:
+                contents.append(f.read())
+        for c1, c2 in itertools.permutations(contents, 2):
+            dmp = diff_match_patch()
+            expected_diff = dmp.diff_main(c1, c2)
+            dmp.diff_cleanupSemantic(expected_diff)
+            self.assertListEqual(diff_bytes(c1, c2), expected_diff)
+
+        # Edits can be placed differently, with the same edit length.
+        rng = random.Random(0)
+        for _ in range(200):
+            alphabet = rng.choice([b"ab", b"abcd", bytes(range(256))])
+            c1 = bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+            if rng.random() < 0.8:
+                c2 = random_edits(rng, c1, rng.randint(0, 6))
+            else:
+                c2 = bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+            dmp = diff_match_patch()
+            dmp.Diff_Timeout = 0
+            expected_diff = dmp.diff_main(c1, c2)
+            dmp_bytes = diff_match_patch_bytes()
+            dmp_bytes.Diff_Timeout = 0
+            # Diagonals of the bisect are reallocated.
+            dmp_bytes.BISECT_DIAGONALS = 2
+            diff = dmp_bytes.diff_main(c1, c2)
+            self.assertEqual(rebuild(diff), (c1, c2))
+            self.assertEqual(
+                dmp_bytes.diff_levenshtein(diff), dmp.diff_levenshtein(expected_diff)
+            )
+            dmp_bytes.diff_cleanupSemantic(diff)
+            self.assertEqual(rebuild(diff), (c1, c2))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+Measures build time and peak memory of the indexes available to lrs.py,
+each in a new process (see `suffix_trees.isolated`). Indexes that time out
+or run out of memory are reported as failed, with exit status 1.
+
+Usage:
+    ./bench_lrs_engines.py --sizes 1 10 100 --engines stree sa
+"""
+
+from aggregables.sequences.lrs import ENGINES
+from aggregables.sequences.suffix_trees.suffix_trees import isolated
+import argparse
+import random
+import sys
+import time
+
+
+def generate_corpus(size, seed=0):
+    """Reproducible input with both random and repeated regions,
+    similar to a binary with padding and duplicated code."""
+    rng = random.Random(seed)
+    blocks = [rng.randbytes(rng.randint(16, 4096)) for _ in range(64)]
+    corpus = bytearray()
+    while len(corpus) < size:
+        r = rng.random()
+        if r < 0.5:
+            corpus += rng.randbytes(rng.randint(16, 4096))
+        elif r < 0.9:
+            corpus += rng.choice(blocks)
+        else:
+            corpus += b"\x00" * rng.randint(16, 4096)
+    return bytes(corpus[:size])
+
+
+def measure(engine, size):
+    content = generate_corpus(size)
+    start = time.perf_counter()
+    index = ENGINES[engine](content)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    index.lrs()
+    lrs_time = time.perf_counter() - start
+    return {
+        "engine": engine,
+        "size_mb": size / 2 ** 20,
+        "build_s": round(build_time, 3),
+        "lrs_s": round(lrs_time, 3),
+        "peak_rss_mb": isolated.peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-e",
+        "--engines",
+        nargs="+",
+        default=list(ENGINES.keys()),
+        choices=ENGINES.keys(),
+        help="indexes to measure",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        type=float,
+        default=[1, 10, 100],
+        help="input sizes in MB",
+    )
+    isolated.add_arguments(parser, 2)
+    parsed_args = parser.parse_args()
+    isolated.run_if_requested(
+        parsed_args, lambda engine, size: measure(engine, int(size))
+    )
+
+    failures = 0
+    print(f"{'engine':<12} {'size (MB)':>10} {'build (s)':>10} {'lrs (s)':>10} {'peak RSS (MB)':>14}")
+    for size in parsed_args.sizes:
+        for engine in parsed_args.engines:
+            (result, error) = isolated.measure_isolated(
+                "aggregables.sequences.bench_lrs_engines",
+                [engine, int(size * 2 ** 20)],
+                parsed_args.timeout,
+            )
+            if error is not None:
+                print(f"{engine:<12} {size:>10} {error:>10}")
+                failures += 1
+                continue
+            print(
+                f"{engine:<12} {result['size_mb']:>10} {result['build_s']:>10} "
+                f"{result['lrs_s']:>10} {result['peak_rss_mb']:>14}"
+            )
+    if failures > 0:
+        sys.exit(1)
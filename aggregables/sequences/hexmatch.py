@@ -2,9 +2,64 @@
 
 import argparse
 import binascii
+import collections
+import dbm
+import glob
+import heapq
+import itertools
+import mmap
+import multiprocessing
+import os
 import re
 import subprocess
 import sys
+import tempfile
+
+from aggregables.sequences.needles import prepare_variants
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from aggregables.sequences.suffix_trees.suffix_trees import STree
+except ImportError:
+    STree = None
+
+try:
+    from aggregables.sequences.suffix_array import open_index
+    from aggregables.sequences.ngram_index import open_index as open_ngram_index
+except ImportError:
+    open_index = None
+    open_ngram_index = None
+
+try:
+    import r2pipe
+except ImportError:
+    r2pipe = None
+
+# Bytes matched at a time when reading the file in blocks.
+BLOCK_SIZE = 2 ** 24
+
+# Matches formatted at a time, sharing a batch of disassembly.
+FORMAT_BATCH_SIZE = 4096
+
+# Matches sent at a time by a worker process, and batches of matches queued
+# for each file, so that results of files searched in parallel are bounded.
+RESULT_BATCH_SIZE = 4096
+RESULT_QUEUE_SIZE = 4
+
+# Disassembly of matched bytes, shared across runs.
+DISASSEMBLY_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "aggregables",
+    "hexmatch-disassembly",
+)
+
+# Line printed by radare2 after the disassembly of each byte string, when
+# several of them are disassembled by one process.
+DISASSEMBLY_DELIMITER = "--- hexmatch ---"
 
 try:
     import colorama
@@ -77,34 +132,721 @@ def clean_needle(needle, is_regex):
     return raw_bytes
 
 
-def match(data, needle, is_regex):
+def match(data, needle, is_regex, is_count=False):
     try:
         clean_needle = needle if is_regex else re.escape(needle)
+        if is_count:
+            return sum(1 for _ in re.finditer(clean_needle, data))
         return [(x.start(), x.end()) for x in re.finditer(clean_needle, data)]
     except Exception as e:
         raise RuntimeError(f"Bad match with needle={needle}", e)
 
 
-def match_index_based(data, needle):
-    match_i = 0
-    indexes = [ord(x) - ord(needle[0]) for x in needle[1:]]
+def match_variants(data, needles, end=None, offset=0, ends=None, is_count=False):
+    """Returns offsets of each needle, as `match()` would, with a single scan
+    over data. When only counting, returns the number of matches of each
+    needle instead.
+
+    A lookahead for all needles finds every position where any of them
+    starts. At those positions, needles are looked up by each of their
+    distinct lengths.
+
+    When data is a block of a larger input, only matches starting before
+    `end` are returned, `offset` is the position of the block in the input,
+    and `ends` keeps the end of the last match of each needle between blocks.
+    """
+    (by_length, lengths, pattern) = prepare_variants(tuple(needles))
+
+    offsets = {needle: 0 if is_count else [] for needle in needles}
+    if ends is None:
+        ends = {}
+    for m in pattern.finditer(data):
+        start = m.start()
+        if end is not None and start >= end:
+            break
+        for length in lengths:
+            needle = bytes(data[start : start + length])
+            # Non-overlapping for each needle, like `re.finditer()`.
+            if needle in by_length[length] and offset + start >= ends.get(needle, 0):
+                if is_count:
+                    offsets[needle] += 1
+                else:
+                    offsets[needle].append((offset + start, offset + start + length))
+                ends[needle] = offset + start + length
+    return [offsets[needle] for needle in needles]
+
+
+def window_value(window, padding, endianness):
+    """Returns the integer read from a window of bytes, where each byte is
+    preceded by `padding` null bytes (before reversing for little-endian),
+    or `None` if padding bytes are not null."""
+    step = padding + 1
+    if endianness == "be":
+        (value_bytes, offset) = (window[padding::step], padding)
+    else:
+        (value_bytes, offset) = (window[::step], 0)
+    if any(x != 0 for j, x in enumerate(window) if j % step != offset):
+        return None
+    return int.from_bytes(value_bytes, "big" if endianness == "be" else "little")
+
+
+def window_values(values, count, width, padding, endianness):
+    """Returns the integers read from the first `count` windows of a uint8
+    array, as `window_value()` would, and whether their padding bytes are
+    null (or `None` if there is no padding)."""
+    if padding == 0 and width in (1, 2, 4, 8):
+        # Unaligned view, where windows overlap with a stride of 1 byte.
+        dtype = np.dtype(f"{'>' if endianness == 'be' else '<'}u{width}")
+        return (np.ndarray((count,), dtype, values, 0, (1,)), None)
+
+    dtype = np.uint16 if width <= 2 else np.uint32 if width <= 4 else np.uint64
+    step = padding + 1
+    result = np.zeros(count, dtype)
+    valid = np.ones(count, bool)
+    for position in range(width * step):
+        window_bytes = values[position : position + count]
+        if position % step != (padding if endianness == "be" else 0):
+            valid &= window_bytes == 0
+            continue
+        j = position // step
+        shift = 8 * (width - 1 - j if endianness == "be" else j)
+        result |= window_bytes.astype(dtype) << dtype(shift)
+    return (result, valid)
+
+
+def match_ranges(data, variants, end=None, offset=0, ends=None, is_count=False):
+    """Returns offsets (or the number of matches) of each variant off by a
+    range of values (see `needle_ranges()`), as `match_variants()` would for
+    all of its values together, for needles of up to 8 bytes.
+
+    Windows of data are read as integers and tested for membership in the
+    interval of values of each variant, keyed by endianness, padding and
+    bounds, in a single pass, instead of searching each value. Matches are
+    non-overlapping for each value.
+    """
+    width = min(len(needle) for _, _, needle in variants)
+    groups = {}
+    for n, (i, e, needle) in enumerate(variants):
+        padding = _variant_padding(variants, needle)
+        value = window_value(needle, padding, e)
+        groups.setdefault((e, padding, value + i.start, value + i.stop - 1), []).append(n)
+
+    variants_offsets = [0 if is_count else [] for _ in variants]
+    if ends is None:
+        ends = {}
+    values = np.frombuffer(data, dtype=np.uint8)
+    for (e, padding, lo, hi), ns in groups.items():
+        length = width * (padding + 1)
+        count = len(data) - length + 1
+        if end is not None:
+            count = min(count, end)
+        if count < 1:
+            continue
+        (window_ints, valid) = window_values(values, count, width, padding, e)
+        in_range = (window_ints >= lo) & (window_ints <= hi)
+        if valid is not None:
+            in_range &= valid
+        for start in np.flatnonzero(in_range).tolist():
+            key = (e, padding, int(window_ints[start]))
+            # Non-overlapping for each value, like `re.finditer()`.
+            if offset + start < ends.get(key, 0):
+                continue
+            ends[key] = offset + start + length
+            for n in ns:
+                if is_count:
+                    variants_offsets[n] += 1
+                else:
+                    variants_offsets[n].append((offset + start, offset + start + length))
+    return variants_offsets
+
+
+def match_tree(st, needles):
     offsets = []
+    for needle, positions in zip(needles, st.find_many(needles)):
+        # Non-overlapping, like `re.finditer()`.
+        needle_offsets = []
+        end = 0
+        for x in sorted(positions):
+            if x >= end:
+                end = x + len(needle)
+                needle_offsets.append((x, end))
+        offsets.append(needle_offsets)
+    return offsets
+
+
+def padded_needle(raw_bytes, endianness, padding):
+    """Returns the needle where each byte is preceded by `padding` null
+    bytes, reversed for little-endian."""
+    needle = b"".join([padding * b"\x00" + bytes([x]) for x in raw_bytes])
+    if endianness == "le":
+        needle = needle[::-1]
+    return needle
+
+
+def needle_variants(raw_bytes, endianness, k, padding):
+    """Returns a tuple `(i, e, needle)` for each value off by `i` in
+    [-k..k] (when it fits in the same length), endianness `e` and number of
+    null bytes preceding each byte in [0..padding)."""
+    variants = []
+    raw_len = len(raw_bytes)
+    for i in range(-k, k + 1, 1):
+        if not 0 <= int.from_bytes(raw_bytes, "big") + i < 256 ** raw_len:
+            continue
+        for e in endianness:
+            for p in range(padding):
+                needle = int.from_bytes(raw_bytes, "big") + i
+                variants.append((i, e, padded_needle(needle.to_bytes(raw_len, "big"), e, p)))
+    return variants
+
+
+def needle_ranges(raw_bytes, endianness, k, padding):
+    """Returns a tuple `(range(lo, hi), e, needle)` for each endianness `e`
+    and number of null bytes preceding each byte in [0..padding), which
+    stands for the variants of `needle_variants()` off by `i` in the range,
+    without enumerating them. The needle itself is not off."""
+    value = int.from_bytes(raw_bytes, "big")
+    offsets = range(max(-k, -value), min(k, 256 ** len(raw_bytes) - 1 - value) + 1)
+    return [
+        (offsets, e, padded_needle(raw_bytes, e, p))
+        for e in endianness
+        for p in range(padding)
+    ]
+
+
+def _variant_padding(variants, needle):
+    # Variants of the same needle without padding are the shortest.
+    width = min(len(x) for _, _, x in variants)
+    return len(needle) // width - 1 if width > 0 else 0
+
+
+def expand_variants(variants):
+    """Returns the variants `(i, e, needle)` of each variant off by a range
+    of values, as `needle_variants()` would, with other variants as is, and
+    the index of the variant each of them comes from (or `None` if there are
+    no ranges)."""
+    if not any(isinstance(i, range) for i, _, _ in variants):
+        return (variants, None)
+    expanded = []
+    origins = []
+    for n, (i, e, needle) in enumerate(variants):
+        if not isinstance(i, range):
+            expanded.append((i, e, needle))
+            origins.append(n)
+            continue
+        padding = _variant_padding(variants, needle)
+        value = window_value(needle, padding, e)
+        width = len(needle) // (padding + 1)
+        for j in i:
+            raw_bytes = (value + j).to_bytes(width, "big")
+            expanded.append((j, e, padded_needle(raw_bytes, e, padding)))
+            origins.append(n)
+    return (expanded, origins)
+
+
+def _fold_offsets(variants_offsets, origins, count, is_count):
+    """Returns offsets (or the number of matches) of expanded variants,
+    merged by the variant they come from."""
+    by_variant = [[] for _ in range(count)]
+    for n, offsets in zip(origins, variants_offsets):
+        by_variant[n].append(offsets)
+    if is_count:
+        return [sum(x) for x in by_variant]
+    return [list(heapq.merge(*x)) for x in by_variant]
+
+
+def matched_variant(variants, n, matched_bytes):
+    """Returns the variant `(i, e, needle)` of `needle_variants()` matched
+    by the bytes, where `i` is recovered from their value if variant `n` is
+    off by a range of values."""
+    (i, e, needle) = variants[n]
+    if not isinstance(i, range):
+        return (i, e, needle)
+    padding = _variant_padding(variants, needle)
+    i = window_value(matched_bytes, padding, e) - window_value(needle, padding, e)
+    return (i, e, matched_bytes)
+
+
+def index_based_pattern(needle, padding=0, endianness="be"):
+    """Returns the alphabet index of each character in the needle, preceded
+    by `padding` null bytes, which are `None`."""
+    pattern = []
+    for x in needle:
+        pattern += [None] * padding + [ord(x)]
+    if endianness == "le":
+        pattern.reverse()
+    return pattern
+
+
+def match_index_based(data, pattern):
+    """Returns offsets where the differences between bytes are the same as
+    between alphabet indexes in the pattern, and padding bytes are null.
+
+    Matches may overlap. With numpy, byte differences are computed once for
+    the whole data, then candidate offsets are filtered by each difference
+    in the pattern.
+    """
+    symbols = [(j, x) for j, x in enumerate(pattern) if x is not None]
+    paddings = [j for j, x in enumerate(pattern) if x is None]
+    count = len(data) - len(pattern) + 1
+    if len(symbols) < 2 or count < 1:
+        return []
+    differences = [
+        (j0, j1, x1 - x0) for (j0, x0), (j1, x1) in zip(symbols, symbols[1:])
+    ]
+    if any(abs(difference) > 0xFF for _, _, difference in differences):
+        return []
+
+    if np is None:
+        offsets = [
+            i
+            for i in range(count)
+            if all(data[i + j1] - data[i + j0] == d for j0, j1, d in differences)
+            and all(data[i + j] == 0 for j in paddings)
+        ]
+    else:
+        values = np.frombuffer(data, dtype=np.uint8)
+        by_distance = {}
+        offsets = None
+        for j0, j1, difference in differences:
+            distance = j1 - j0
+            if distance not in by_distance:
+                by_distance[distance] = (
+                    values[distance:].astype(np.int16) - values[:-distance]
+                )
+            deltas = by_distance[distance]
+            if offsets is None:
+                offsets = np.flatnonzero(deltas[j0 : j0 + count] == difference)
+            else:
+                offsets = offsets[deltas[offsets + j0] == difference]
+        for j in paddings:
+            offsets = offsets[values[offsets + j] == 0]
+        offsets = offsets.tolist()
+    return [(x, x + len(pattern)) for x in offsets]
+
+
+def map_file(f):
+    """Returns the contents of a file, memory-mapped if possible (i.e. not
+    for empty files, pipes or stdin), otherwise read into memory."""
     try:
-        for i in range(len(data) - len(indexes)):
-            candidate = bytearray(data[i : i + len(indexes) + 1])
-            for j in range(len(indexes)):
-                if candidate[j + 1] - candidate[0] == indexes[j]:
-                    match_i += 1
-                    if match_i == len(indexes):
-                        offsets.append(i)
-                        match_i = 0
-                        break
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return f.read()
+
+
+def read_blocks(f, block_size, overlap):
+    """Yields tuples `(offset, block, end)`, where `block` starts at `offset`
+    in the file and ends up to `overlap` bytes after `end`, so that needles
+    of length up to `overlap + 1` starting before `end` are complete in the
+    block. Needles starting after `end` are matched in the next block.
+
+    Regular files are memory-mapped, and blocks are views without copies.
+    Otherwise, the file is read as a stream.
+    """
+    try:
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        data = None
+    if data is not None:
+        for offset in range(0, len(data), block_size):
+            block = data[offset : offset + block_size + overlap]
+            yield (offset, block, min(block_size, len(block)))
+        return
+
+    offset = 0
+    block = f.read(block_size + overlap)
+    while len(block) == block_size + overlap:
+        yield (offset, block, block_size)
+        offset += block_size
+        block = block[block_size:] + f.read(block_size)
+    yield (offset, block, len(block))
+
+
+class Disassembler:
+    """Disassembles byte strings in the given architectures (format=rasm2)
+    and number of bits (or the default of each architecture), memoized by
+    architecture, bits and bytes in an on-disk cache.
+
+    Byte strings missing from the cache are disassembled by a single radare2
+    process, either kept open with r2pipe, or otherwise run once for each
+    architecture with a script of `pad` commands, since `rasm2` can't
+    delimit the disassembly of several byte strings.
+    """
+
+    def __init__(self, archs, cache_filename=DISASSEMBLY_CACHE, bits=None):
+        self.archs = archs
+        self.bits = bits
+        self.r2p = None
+        self.cache = {}
+        if archs and cache_filename:
+            try:
+                os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+                self.cache = dbm.open(cache_filename, "c")
+            except dbm.error as e:
+                # e.g. locked by another run
+                print(f"Not caching disassembly due to error: {e}", file=sys.stderr)
+
+    def _cache_key(self, arch, x):
+        target = arch if self.bits is None else f"{arch}:{self.bits}"
+        return f"{target}:{binascii.hexlify(x).decode('ascii')}"
+
+    def disassemble(self, matches):
+        """Returns a dict of `(arch, matched_bytes)` to disassembly, for
+        each distinct matched bytes in each architecture."""
+        disassembly = {}
+        for arch in self.archs:
+            missing = []
+            for x in sorted(set(matches)):
+                key = self._cache_key(arch, x)
+                if key in self.cache:
+                    disassembly[(arch, x)] = self.cache[key].decode("latin-1")
                 else:
-                    match_i = 0
-                    break
-        return [(x, x + len(needle)) for x in offsets]
-    except Exception as e:
-        raise RuntimeError(f"Bad match with needle={needle}", e)
+                    missing.append(x)
+            for x, text in zip(missing, self._run(arch, missing)):
+                self.cache[self._cache_key(arch, x)] = text.encode("latin-1")
+                disassembly[(arch, x)] = text
+        return disassembly
+
+    def _run(self, arch, matches):
+        if len(matches) == 0:
+            return []
+        if r2pipe is None:
+            texts = self._run_script(arch, matches)
+        else:
+            if self.r2p is None:
+                self.r2p = r2pipe.open("-")
+            self.r2p.cmd(f"e asm.arch={arch}")
+            if self.bits is not None:
+                self.r2p.cmd(f"e asm.bits={self.bits}")
+            texts = [
+                self.r2p.cmd(f"pad {binascii.hexlify(x).decode('ascii')}")
+                for x in matches
+            ]
+        # Same output as `rasm2`.
+        return [text.rstrip("\n") + "\n" for text in texts]
+
+    def _run_script(self, arch, matches):
+        options = ["-a", arch]
+        if self.bits is not None:
+            options += ["-b", str(self.bits)]
+        with tempfile.NamedTemporaryFile("w", suffix=".r2") as script:
+            for x in matches:
+                script.write(f"pad {binascii.hexlify(x).decode('ascii')}\n")
+                script.write(f"?e {DISASSEMBLY_DELIMITER}\n")
+            script.flush()
+            output = subprocess.check_output(
+                ["radare2", "-N", "-q"] + options + ["-i", script.name, "-"],
+                stderr=subprocess.DEVNULL,
+            ).decode("latin-1")
+        texts = output.split(DISASSEMBLY_DELIMITER + "\n")[: len(matches)]
+        if len(texts) < len(matches):
+            raise RuntimeError(f"Bad disassembly output for arch={arch}: {output}")
+        return texts
+
+    def close(self):
+        if self.r2p is not None:
+            self.r2p.quit()
+        if hasattr(self.cache, "close"):
+            self.cache.close()
+
+
+def _variant_matches(n, offsets):
+    for start, end in offsets:
+        yield (start, n, end)
+
+
+def iter_matches(data, variants_offsets, offset=0):
+    """Yields a tuple `(start, n, matched_bytes)` for each match of each
+    needle variant `n`, in increasing offsets, where `data` starts at
+    `offset` in the file.
+
+    Offsets of each variant are already sorted, so they are merged lazily.
+    """
+    merged = heapq.merge(
+        *[_variant_matches(n, offsets) for n, offsets in enumerate(variants_offsets)]
+    )
+    for start, n, end in merged:
+        yield (start, n, bytes(data[start - offset : end - offset]))
+
+
+def _is_range_search(variants, options):
+    """Whether variants off by a range of values are matched by
+    `match_ranges()`, which needs literal needles of up to 8 bytes."""
+    return (
+        np is not None
+        and not (
+            options.index_based
+            or options.regex
+            or options.tree
+            or options.index
+            or options.ngram_index
+        )
+        and 0 < min(len(needle) for _, _, needle in variants) <= 8
+        and any(isinstance(i, range) and len(i) > 1 for i, _, _ in variants)
+    )
+
+
+def search_file(filename, variants, options):
+    """Yields a tuple `(data, variants_offsets, offset)` for each block of
+    the file, in increasing offsets, where `data` starts at `offset`. When
+    only counting, `variants_offsets` has the number of matches of each
+    variant instead of their offsets.
+
+    Literal needles are matched block by block, other searches need the
+    whole file. Variants off by a range of values are expanded, unless
+    matched by `match_ranges()`.
+    """
+    is_range = _is_range_search(variants, options)
+    (expanded, origins) = (variants, None) if is_range else expand_variants(variants)
+    needles = [needle for _, _, needle in expanded]
+    is_needle_regex = options.regex
+    is_count = options.count
+
+    def fold(variants_offsets):
+        if origins is None:
+            return variants_offsets
+        return _fold_offsets(variants_offsets, origins, len(variants), is_count)
+
+    f = sys.stdin.buffer if filename == "-" else open(filename, "rb")
+    with f:
+        if (
+            options.index_based
+            or is_needle_regex
+            or options.tree
+            or options.index
+            or options.ngram_index
+            or max(len(needle) for needle in needles) == 0
+        ):
+            st = None
+            if options.index and not is_needle_regex:
+                if open_index is None:
+                    raise RuntimeError("Index requires numpy.")
+                st = open_index(filename)
+                data = st.words[0]
+            elif options.ngram_index and not is_needle_regex:
+                if open_ngram_index is None:
+                    raise RuntimeError("N-gram index requires numpy.")
+                st = open_ngram_index(filename)
+                data = st.data
+            else:
+                data = map_file(f)
+
+            if options.index_based:
+                variants_offsets = [
+                    match_index_based(data, pattern) for pattern in needles
+                ]
+            elif st is not None or (options.tree and not is_needle_regex):
+                if st is None:
+                    if STree is None:
+                        raise RuntimeError("Suffix tree requires the aggregables package.")
+                    st = STree.STree(bytes(data))
+                variants_offsets = match_tree(st, needles)
+            else:
+                variants_offsets = [
+                    match(data, needle, is_needle_regex, is_count) for needle in needles
+                ]
+            if is_count and (options.index_based or st is not None):
+                # Offsets are found together for all variants, then counted.
+                variants_offsets = [len(offsets) for offsets in variants_offsets]
+            yield (data, fold(variants_offsets), 0)
+        else:
+            overlap = max(len(needle) for needle in needles) - 1
+            ends = {}
+            for offset, block, end in read_blocks(f, BLOCK_SIZE, overlap):
+                if is_range:
+                    variants_offsets = match_ranges(
+                        block, variants, end, offset, ends, is_count
+                    )
+                else:
+                    variants_offsets = match_variants(
+                        block, needles, end, offset, ends, is_count
+                    )
+                yield (block, fold(variants_offsets), offset)
+
+
+def expand_files(paths):
+    """Yields files in the given paths, where directories are walked
+    recursively and glob patterns are expanded, both in natural order."""
+    for path in paths:
+        if path == "-" or os.path.isfile(path):
+            yield path
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort(key=natural_sort_key)
+                for name in sorted(files, key=natural_sort_key):
+                    yield os.path.join(root, name)
+        else:
+            matched_paths = glob.glob(path, recursive=True)
+            if len(matched_paths) == 0:
+                # Reported when opened.
+                yield path
+            for matched_path in sorted(matched_paths, key=natural_sort_key):
+                if os.path.isdir(matched_path):
+                    yield from expand_files([matched_path])
+                else:
+                    yield matched_path
+
+
+def file_results(filename, variants, options):
+    """Yields, for each block of the file, the number of matches when
+    only counting them, otherwise an iterator of matches."""
+    for data, variants_offsets, offset in search_file(filename, variants, options):
+        if options.count:
+            yield sum(variants_offsets)
+        else:
+            yield iter_matches(data, variants_offsets, offset)
+
+
+_worker_args = None
+
+
+def _init_worker(variants, options, queues):
+    global _worker_args
+    _worker_args = (variants, options, queues)
+    if not (options.regex or options.index_based or _is_range_search(variants, options)):
+        (expanded, _) = expand_variants(variants)
+        prepare_variants(tuple(needle for _, _, needle in expanded))
+
+
+def _batch_matches(matches, size):
+    """Yields lists of at least `size` matches (except the last one),
+    without splitting matches at the same offset."""
+    batch = []
+    for _, group in itertools.groupby(matches, key=lambda match: match[0]):
+        batch.extend(group)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def _search_worker(filename, slot):
+    """Puts results of `file_results()` in the queue of the given slot,
+    with matches in batches, followed by None."""
+    (variants, options, queues) = _worker_args
+    queue = queues[slot]
+    try:
+        for x in file_results(filename, variants, options):
+            if isinstance(x, int):
+                queue.put(x)
+            else:
+                for batch in _batch_matches(x, RESULT_BATCH_SIZE):
+                    queue.put(batch)
+    except OSError as e:
+        print(f"Skipping {filename} due to error: {e}", file=sys.stderr)
+    finally:
+        queue.put(None)
+
+
+def _queued_results(queue):
+    return iter(queue.get, None)
+
+
+def search_files(filenames, variants, options, processes=None):
+    """Yields `(filename, blocks)` for each file, in the given order, where
+    `blocks` are as returned by `file_results()`.
+
+    Several files are searched in parallel by a pool of processes, each
+    preparing needle variants once. Each file in progress has a slot with
+    a bounded queue, where its worker puts results until they are consumed.
+    Stdin is searched in this process, since workers can't read it.
+    """
+    if len(filenames) == 1:
+        yield (filenames[0], file_results(filenames[0], variants, options))
+        return
+    processes = processes or os.cpu_count()
+    queues = [multiprocessing.Queue(RESULT_QUEUE_SIZE) for _ in range(processes)]
+    with multiprocessing.Pool(processes, _init_worker, (variants, options, queues)) as pool:
+        files = iter(filenames)
+        free_slots = list(range(processes))
+        # Tuples `(filename, slot, result)`, in the given order.
+        pending = collections.deque()
+
+        def submit():
+            while len(free_slots) > 0:
+                filename = next(files, None)
+                if filename is None:
+                    return
+                if filename == "-":
+                    pending.append((filename, None, None))
+                    continue
+                slot = free_slots.pop()
+                result = pool.apply_async(_search_worker, (filename, slot))
+                pending.append((filename, slot, result))
+
+        submit()
+        while len(pending) > 0:
+            (filename, slot, result) = pending.popleft()
+            if slot is None:
+                yield (filename, file_results(filename, variants, options))
+                continue
+            blocks = _queued_results(queues[slot])
+            yield (filename, blocks)
+            # Results left unconsumed would be taken as the next file's.
+            for _ in blocks:
+                pass
+            result.get()
+            free_slots.append(slot)
+            submit()
+
+
+def format_match(
+    filename, variant, start, matched_bytes, disassembly, archs, output_encoding
+):
+    (i, e, _) = variant
+    matched_disassembly = ""
+    for arch in archs:
+        matched_disassembly += highlight_secondary(
+            " " + "; ".join(disassembly[(arch, matched_bytes)].split("\n"))
+        )
+    iteration = ""
+    if e != "be" or i != 0:
+        iteration = f"e={e},k={'+' if i > 0 else ''}{i}"
+    return f"{highlight_bold(filename)}:{highlight_primary(start)}({highlight_primary(hex(start))}):{highlight_bold(iteration)}{':' if iteration else ''}{highlight_hex(binascii.hexlify(matched_bytes).decode('ascii'))} {clean_match(matched_bytes, output_encoding)}{matched_disassembly}"
+
+
+def print_matches(filename, matches, variants, disassembler, output_encoding):
+    """Prints matches as they are formatted, in batches which share their
+    disassembly. Returns the number of matches printed.
+
+    Matches are already in increasing offsets, and lines with the same
+    offset are in natural order, so that the output is sorted.
+    """
+    count = 0
+    batch = []
+
+    def flush():
+        disassembly = disassembler.disassemble(
+            [x for group in batch for _, _, x in group]
+        )
+        for group in batch:
+            lines = [
+                format_match(
+                    filename,
+                    matched_variant(variants, n, x),
+                    start,
+                    x,
+                    disassembly,
+                    disassembler.archs,
+                    output_encoding,
+                )
+                for start, n, x in group
+            ]
+            if len(lines) > 1:
+                lines.sort(key=natural_sort_key)
+            for line in lines:
+                print(line)
+        sys.stdout.flush()
+        batch.clear()
+
+    for _, group in itertools.groupby(matches, key=lambda match: match[0]):
+        group = list(group)
+        batch.append(group)
+        count += len(group)
+        if len(batch) >= FORMAT_BATCH_SIZE:
+            flush()
+    flush()
+    return count
 
 
 def clean_match(matched_bytes, output_encoding):
@@ -129,12 +871,24 @@ if __name__ == "__main__":
         action="store_true",
         help="fuzzy match with all heuristics (e.g. endianness, off-by-k...)",
     )
+    parser.add_argument(
+        "-c",
+        "--count",
+        action="store_true",
+        help="only print the number of matches in each file",
+    )
     parser.add_argument(
         "-d",
         "--disassembly_arch",
         type=str,
         help="disassemble matched bytes in the given architecture (format=rasm2)",
     )
+    parser.add_argument(
+        "-b",
+        "--disassembly-bits",
+        type=int,
+        help="number of bits used when disassembling (e.g. 16, 32 or 64, default: as in rasm2)",
+    )
     parser.add_argument(
         "-e",
         "--endianness",
@@ -142,11 +896,17 @@ if __name__ == "__main__":
         choices=["be", "le"],
         help="match with either big (be) or little (le) endianness",
     )
+    parser.add_argument(
+        "-g",
+        "--ngram-index",
+        action="store_true",
+        help="search in an index of the 4-grams of the file, built once in a sidecar file (FILE.ng4) and memory-mapped in later runs, smaller than --index (requires numpy)",
+    )
     parser.add_argument(
         "-i",
         "--index-based",
         action="store_true",
-        help="match by alphabet index differential instead of literal bytes (e.g. 'ACDC' -> [+2, +1, -1] will match b\'\\x00\\x02\\x03\\x02\' and b'\x41\x43\x44\x43')",
+        help="match by alphabet index differential instead of literal bytes (e.g. 'ACDC' -> [+2, +1, -1] will match b\'\\x00\\x02\\x03\\x02\' and b'\x41\x43\x44\x43', combined with -p and -e for e.g. UTF-16 text)",
     )
     parser.add_argument(
         "-k",
@@ -174,7 +934,30 @@ if __name__ == "__main__":
         type=int,
         help="pad each byte in pattern with null bytes, to match candidates up to given length (e.g. `-p 2 0102` matches `\x01\x02` and `\x00\x01\x00\x02`)",
     )
-    parser.add_argument("file", type=str, help="file to search in")
+    parser.add_argument(
+        "-t",
+        "--tree",
+        action="store_true",
+        help="search all needle variants in a suffix tree built once over the file (faster when there are many variants, e.g. with --all)",
+    )
+    parser.add_argument(
+        "-x",
+        "--index",
+        action="store_true",
+        help="search in a suffix array index of the file, built once in a sidecar file (FILE.sa) and memory-mapped in later runs (requires numpy)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of processes used when searching several files (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="+",
+        help="files, directories (searched recursively) or glob patterns to search in (`-` for stdin)",
+    )
     parser.add_argument("needle", type=str, help="byte sequence to search for")
     parsed_args = parser.parse_args()
 
@@ -194,66 +977,45 @@ if __name__ == "__main__":
     disassemble_arch = []
     if parsed_args.disassembly_arch:
         disassemble_arch = [parsed_args.disassembly_arch]
+    disassembler = Disassembler(
+        disassemble_arch, bits=parsed_args.disassembly_bits
+    )
 
     is_needle_regex = parsed_args.regex
     is_index_based = parsed_args.index_based
 
     raw_bytes = clean_needle(parsed_args.needle, is_needle_regex)
 
-    filename = parsed_args.file
-    matched = False
-    with open(filename, "rb") as f:
-        data = f.read()
-
-    results = []
-    for i in range(-k, k + 1, 1):
+    variants = []
+    if is_index_based:
+        if is_needle_regex:
+            raise RuntimeError("TODO: Regex with index based matching is not suported.")
+        # Differences are the same for any off-by-k needle.
         for e in endianness:
             for p in range(padding):
-                raw_len = len(raw_bytes)
-                needle = int.from_bytes(raw_bytes, "big")
-                needle += i
-                needle = bytearray(needle.to_bytes(raw_len, "big"))
-                needle = b"".join([p * b"\x00" + bytes([x]) for x in needle])
-                if e == "le":
-                    needle = needle[::-1]
-                needle = bytes(needle)
-                if is_index_based:
-                    if is_needle_regex:
-                        raise RuntimeError(
-                            "TODO: Regex with index based matching is not suported."
-                        )
-                    offsets = match_index_based(data, parsed_args.needle)
-                else:
-                    offsets = match(data, needle, is_needle_regex)
-                for offset in offsets:
-                    matched_bytes = data[offset[0] : offset[1]]
-                    matched_disassembly = ""
-                    for arch in disassemble_arch:
-                        matched_disassembly += highlight_secondary(
-                            " "
-                            + "; ".join(
-                                subprocess.check_output(
-                                    [
-                                        "rasm2",
-                                        "-a",
-                                        arch,
-                                        "-d",
-                                        binascii.hexlify(matched_bytes).decode("ascii"),
-                                    ]
-                                )
-                                .decode("latin-1")
-                                .split("\n")
-                            )
-                        )
-                    iteration = ""
-                    if e != "be" or i != 0:
-                        iteration = f"e={e},k={'+' if i > 0 else ''}{i}"
-                    results.append(
-                        f"{highlight_bold(filename)}:{highlight_primary(offset[0])}({highlight_primary(hex(offset[0]))}):{highlight_bold(iteration)}{':' if iteration else ''}{highlight_hex(binascii.hexlify(matched_bytes).decode('ascii'))} {clean_match(matched_bytes, parsed_args.output)}{matched_disassembly}"
-                    )
+                variants.append((0, e, index_based_pattern(parsed_args.needle, p, e)))
+    elif is_needle_regex:
+        variants = needle_variants(raw_bytes, endianness, k, padding)
+    else:
+        # Values off by k are expanded only if not matched as a range.
+        variants = needle_ranges(raw_bytes, endianness, k, padding)
 
-    if len(results) < 1:
+    filenames = list(expand_files(parsed_args.files))
+    matched = False
+    for filename, blocks in search_files(
+        filenames, variants, parsed_args, parsed_args.jobs
+    ):
+        if parsed_args.count:
+            count = sum(blocks)
+            print(f"{highlight_bold(filename)}:{highlight_primary(count)}")
+        else:
+            count = 0
+            for matches in blocks:
+                count += print_matches(
+                    filename, matches, variants, disassembler, parsed_args.output
+                )
+        matched = matched or count > 0
+    disassembler.close()
+
+    if not matched:
         sys.exit(1)
-    results = sorted(results, key=natural_sort_key)
-    for result in results:
-        print(result)
@@ -1,18 +1,45 @@
 #!/usr/bin/env python3
 
-from aggregables.sequences.suffix_trees.suffix_trees import STree
-from typing import List, Tuple
+from aggregables.sequences.needles import prepare_variants
+from aggregables.sequences.suffix_trees.suffix_trees import STree, STreeArray
+from typing import Iterator, List, Tuple
+import argparse
+import bisect
+import heapq
 import itertools
+import multiprocessing
+import os
 import re
 import sys
 
+ENGINES = {
+    "stree": STree.STree,
+    # Nodes stored in integer arrays, for inputs that don't fit in memory
+    # as one Python object per node.
+    "stree-array": STreeArray.STreeArray,
+}
+DEFAULT_ENGINE = "stree"
 
-def parse_contents(contents: List[bytes]) -> Tuple[bytes, List[bytes]]:
+try:
+    from aggregables.sequences.suffix_array import SuffixArray, open_index
+
+    ENGINES["sa"] = SuffixArray
+except ImportError:
+    open_index = None
+
+# Chunks are searched by several processes at a time, each of which should
+# keep its index in arrays rather than as one Python object per node.
+DEFAULT_CHUNK_ENGINE = "sa" if "sa" in ENGINES else "stree-array"
+
+
+def parse_contents(
+    contents: List[bytes], engine: str = DEFAULT_ENGINE
+) -> Tuple[bytes, List[bytes]]:
     lrs = b""
     if len(contents) < 1:
         return (lrs, contents)
 
-    st = STree.STree(contents)
+    st = ENGINES[engine](contents)
     if len(contents) == 1:
         lrs = st.lrs()
     elif len(contents) > 1:
@@ -38,34 +65,343 @@ def parse_contents(contents: List[bytes]) -> Tuple[bytes, List[bytes]]:
     return (lrs, new_contents)
 
 
-def compute_lrs(content: bytes, min_len_substrings: int = 2) -> List[bytes]:
-    contents = [content]
+def compute_lrs(
+    content: bytes,
+    min_len_substrings: int = 2,
+    engine: str = DEFAULT_ENGINE,
+    index=None,
+) -> List[Tuple[bytes, int]]:
+    """Returns the longest repeated substring, then repeatedly the longest
+    one left after removing occurrences of previous ones, as if `content`
+    was split on each of them with `parse_contents()`. Each substring is
+    returned with its number of occurrences left (including overlapping
+    ones) when it was taken.
+
+    Instead of building an index for each split, candidates are the
+    maximal repeats of a single index, each with the range of lengths
+    sharing its occurrences. They are taken from a heap ordered by length,
+    and only re-evaluated (i.e. shortened to fit between removed
+    occurrences) when they reach the top.
+
+    A prebuilt `index` over `content` can be given instead of an `engine`.
+    """
     top_substrings = []
     min_len_remaining_string = 10
     max_len_top_substrings = 10
-    is_satisfied = True
-    while is_satisfied:
-        len_contents = 0
-        for content in contents:
-            len_contents += len(content)
-        if len_contents < min_len_remaining_string:
-            is_satisfied = False
+    len_remaining = len(content)
+    if len_remaining < min_len_remaining_string:
+        return top_substrings
+
+    if index is None:
+        index = ENGINES[engine](content)
+    (leaves, intervals) = index.repeats()
+    # Intervals are unique by (lo, hi), so positions are never compared,
+    # and only sorted when first popped, since most intervals never are.
+    heap = [
+        (-depth, lo, parent_depth, hi, None)
+        for depth, parent_depth, lo, hi in intervals
+    ]
+    heapq.heapify(heap)
+
+    def pop() -> Tuple[int, int, int, int, List[int]]:
+        (key, lo, parent_depth, hi, positions) = heapq.heappop(heap)
+        if positions is None:
+            positions = sorted(leaves[lo:hi])
+        return (key, lo, parent_depth, hi, positions)
+
+    # Sorted starts and ends of removed occurrences.
+    removed_starts = []
+    removed_ends = []
+
+    def max_len(pos: int) -> int:
+        i = bisect.bisect_right(removed_starts, pos)
+        if i > 0 and removed_ends[i - 1] > pos:
+            return 0
+        if i < len(removed_starts):
+            return removed_starts[i] - pos
+        return len(content) - pos
+
+    def fit(positions: List[int], length: int) -> int:
+        """Returns the longest length, up to `length`, with two or more
+        occurrences left."""
+        (first, second) = (0, 0)
+        i = 0
+        while i < len(positions) and second < length:
+            pos = positions[i]
+            j = bisect.bisect_right(removed_starts, pos)
+            if j > 0 and removed_ends[j - 1] > pos:
+                # Positions are sorted, so those in the same removed
+                # occurrence are skipped at once.
+                i = bisect.bisect_left(positions, removed_ends[j - 1], i)
+                continue
+            n = min(max_len(pos), length)
+            if n > first:
+                (first, second) = (n, first)
+            elif n > second:
+                second = n
+            i += 1
+        return second
+
+    while heap:
+        (key, lo, parent_depth, hi, positions) = pop()
+        length = -key
+        fit_length = fit(positions, length)
+        if fit_length <= parent_depth:
+            # Remaining occurrences are covered by the parent.
+            continue
+        if fit_length < length:
+            # Removed occurrences never fit again, so they are dropped.
+            positions = [pos for pos in positions if max_len(pos) > parent_depth]
+            heapq.heappush(heap, (-fit_length, lo, parent_depth, hi, positions))
+            continue
+        if length < min_len_substrings:
             break
 
-        (lrs, new_contents) = parse_contents(contents)
-        contents = new_contents
-        if len(lrs) < min_len_substrings:
-            is_satisfied = False
+        # Ties are taken in lexicographic order, like a suffix array would.
+        candidates = [(key, lo, parent_depth, hi, positions)]
+        shorter = []
+        while heap and heap[0][0] == key:
+            entry = pop()
+            fit_length = fit(entry[4], length)
+            if fit_length == length:
+                candidates.append(entry)
+            elif fit_length > entry[2]:
+                shorter.append((-fit_length,) + entry[1:])
+        substrings = []
+        for _, lo, _, _, positions in candidates:
+            pos = next(pos for pos in positions if max_len(pos) >= length)
+            substrings.append((content[pos : pos + length], lo))
+        i = min(range(len(candidates)), key=substrings.__getitem__)
+        lrs = substrings[i][0]
+        (_, lo, parent_depth, hi, positions) = candidates[i]
+        for j, entry in enumerate(candidates):
+            if j != i:
+                heapq.heappush(heap, entry)
+        for entry in shorter:
+            heapq.heappush(heap, entry)
+
+        count = sum(1 for pos in positions if max_len(pos) >= length)
+        if length <= 1:
+            # Not split on, so it stays the longest.
+            top_substrings.extend(
+                [(lrs, count)] * (max_len_top_substrings + 1 - len(top_substrings))
+            )
             break
 
-        top_substrings.append(lrs)
+        top_substrings.append((lrs, count))
         if len(top_substrings) > max_len_top_substrings:
-            is_satisfied = False
             break
 
+        # Non-overlapping occurrences, from left to right, like `re.split()`.
+        matches = []
+        end = 0
+        for pos in positions:
+            if pos >= end and max_len(pos) >= length:
+                end = pos + length
+                matches.append(pos)
+        len_remaining -= length * len(matches)
+        if len_remaining < min_len_remaining_string:
+            break
+        removed = sorted(
+            list(zip(removed_starts, removed_ends))
+            + [(pos, pos + length) for pos in matches]
+        )
+        removed_starts = [start for start, _ in removed]
+        removed_ends = [end for _, end in removed]
+
+        # Occurrences left between removed ones may still repeat a shorter
+        # prefix, which isn't covered by the parent.
+        positions = [pos for pos in positions if max_len(pos) > parent_depth]
+        fit_length = fit(positions, length)
+        if fit_length > parent_depth:
+            heapq.heappush(heap, (-fit_length, lo, parent_depth, hi, positions))
+
     return top_substrings
 
 
+def _chunk_lrs(args: Tuple[str, int, int, str]) -> List[bytes]:
+    (filename, start, length, engine) = args
+    with open(filename, "rb") as f:
+        f.seek(start)
+        content = f.read(length)
+    return [substring for substring, _ in compute_lrs(content, engine=engine)]
+
+
+def _next_boundary(f, pos: int, size: int, candidates: Tuple[bytes, ...]) -> int:
+    """Returns the first position at or after `pos` that no occurrence of
+    a candidate spans, so that chunks of the file split at such positions
+    can be reduced independently."""
+    (by_length, lengths, pattern) = prepare_variants(candidates)
+    start = max(pos - lengths[0] + 1, 0)
+    while pos < size:
+        # Occurrences starting in [start, pos) may span pos.
+        f.seek(start)
+        content = f.read(pos - start + lengths[0] - 1)
+        reach = pos
+        for m in pattern.finditer(content):
+            if start + m.start() >= pos:
+                break
+            for length in lengths:
+                if content[m.start() : m.start() + length] in by_length[length]:
+                    reach = max(reach, start + m.start() + length)
+                    break
+        if reach == pos:
+            return pos
+        (start, pos) = (pos, reach)
+    return size
+
+
+def _count_occurrences(
+    args: Tuple[str, int, int, Tuple[bytes, ...], List[bool]]
+) -> List[int]:
+    """Returns the number of occurrences of each candidate (including
+    overlapping ones) that are left in a chunk of the file, after removing
+    occurrences of previous candidates that were taken, or undecided (i.e.
+    expected to be taken).
+
+    The chunk is shifted to start and end at positions given by
+    `_next_boundary()`, so that its occurrences never overlap those of
+    other chunks. Occurrences of all candidates are found with a single
+    scan, as in `hexmatch.match_variants()`.
+    """
+    (filename, start, length, candidates, is_taken) = args
+    (by_length, lengths, pattern) = prepare_variants(candidates)
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        lo = _next_boundary(f, start, size, candidates)
+        hi = _next_boundary(f, start + length, size, candidates)
+        f.seek(lo)
+        content = f.read(max(hi - lo, 0))
+
+    index = {candidate: i for i, candidate in enumerate(candidates)}
+    occurrences = [[] for _ in candidates]
+    for m in pattern.finditer(content):
+        pos = m.start()
+        for length in lengths:
+            candidate = content[pos : pos + length]
+            if candidate in by_length[length]:
+                occurrences[index[candidate]].append(pos)
+
+    # Sorted starts and ends of occurrences of previous candidates.
+    removed_starts = []
+    removed_ends = []
+    counts = []
+    for candidate, positions, taken in zip(candidates, occurrences, is_taken):
+        length = len(candidate)
+        remaining = []
+        for pos in positions:
+            i = bisect.bisect_right(removed_starts, pos)
+            if i > 0 and removed_ends[i - 1] > pos:
+                continue
+            if i < len(removed_starts) and removed_starts[i] < pos + length:
+                continue
+            remaining.append(pos)
+        counts.append(len(remaining))
+        if taken is False or len(remaining) == 0:
+            continue
+
+        # Non-overlapping occurrences, from left to right, like `re.split()`.
+        matches = []
+        end = 0
+        for pos in remaining:
+            if pos >= end:
+                end = pos + length
+                matches.append(pos)
+        removed = sorted(
+            list(zip(removed_starts, removed_ends))
+            + [(pos, pos + length) for pos in matches]
+        )
+        removed_starts = [start for start, _ in removed]
+        removed_ends = [end for _, end in removed]
+    return counts
+
+
+def chunked_lrs(
+    filename: str,
+    chunk_size: int,
+    chunk_overlap: int = 4096,
+    engine: str = DEFAULT_CHUNK_ENGINE,
+    processes: int = None,
+) -> List[Tuple[bytes, int]]:
+    """Returns repeated substrings of a file with their number of
+    occurrences, without reading the whole file in one process.
+
+    Chunks of `chunk_size` bytes (extended by `chunk_overlap` bytes over
+    the next chunk) are searched with `compute_lrs()` in a process pool.
+    Occurrences of candidates from all chunks are then counted over the
+    whole file in a second pass, also split in chunks. Like in
+    `compute_lrs()`, the longest candidates are taken first, and
+    occurrences overlapping previous results are discarded.
+
+    Each chunk of the second pass only returns counts: whether a candidate
+    is taken depends on its count over the whole file, so chunks assume
+    that undecided candidates will be taken. When a candidate is left with
+    a single occurrence, later counts of the chunk with that occurrence are
+    wrong, so only that chunk is counted again, with the candidate
+    discarded.
+
+    Occurrences are exact, but only substrings repeated inside a single
+    chunk are candidates: a substring whose occurrences are all in
+    different chunks, or which spans more than `chunk_overlap` bytes after
+    a chunk boundary, is only found if it also repeats within a chunk.
+    """
+    max_len_top_substrings = 10
+    size = os.path.getsize(filename)
+    starts = range(0, max(size, 1), chunk_size)
+    with multiprocessing.Pool(processes) as pool:
+        candidates = set()
+        for substrings in pool.imap_unordered(
+            _chunk_lrs,
+            [(filename, start, chunk_size + chunk_overlap, engine) for start in starts],
+        ):
+            candidates.update(substrings)
+        if len(candidates) == 0:
+            return []
+
+        candidates = tuple(sorted(candidates, key=lambda x: (-len(x), x)))
+        # None for undecided candidates.
+        is_taken = [None] * len(candidates)
+        chunk_args = [
+            (filename, start, chunk_size, candidates, is_taken) for start in starts
+        ]
+        chunk_counts = pool.map(_count_occurrences, chunk_args)
+        counts = [sum(x) for x in zip(*chunk_counts)]
+
+        top_substrings = []
+        for i in range(len(candidates)):
+            if is_taken[i] is None:
+                is_taken[i] = counts[i] > 1
+                if counts[i] == 1:
+                    # Counts of later candidates removed its occurrence.
+                    chunk = next(j for j, x in enumerate(chunk_counts) if x[i] > 0)
+                    new_counts = pool.apply(_count_occurrences, (chunk_args[chunk],))
+                    counts = [
+                        x - y + z
+                        for x, y, z in zip(counts, chunk_counts[chunk], new_counts)
+                    ]
+                    chunk_counts[chunk] = new_counts
+            if is_taken[i]:
+                top_substrings.append((candidates[i], counts[i]))
+                if len(top_substrings) > max_len_top_substrings:
+                    break
+        return top_substrings
+
+
+def stream_lrs(f, interval: int) -> Iterator[Tuple[int, bytes]]:
+    """Reads blocks of `interval` bytes, extending a suffix tree online,
+    and yields the number of bytes read so far with their longest
+    repeated substring, which the tree tracks as it is extended."""
+    st = STree.STree()
+    offset = 0
+    while True:
+        block = f.read(interval)
+        if not block:
+            break
+        st.append(block)
+        offset += len(block)
+        yield (offset, st.lrs())
+
+
 def clean_lrs(content: bytes, substrings: List[bytes]) -> List[bytes]:
     clean_substrings = []
     for substring in substrings:
@@ -104,15 +440,95 @@ def clean_lrs(content: bytes, substrings: List[bytes]) -> List[bytes]:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES.keys(),
+        help=f"index used to find repeated substrings (default: {DEFAULT_ENGINE}, or {DEFAULT_CHUNK_ENGINE} with --chunk-size)",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream-interval",
+        type=int,
+        help="output the longest repeated substring after reading each block of given length (e.g. for captures still being written), without waiting for the end of input (only with the stree engine)",
+    )
+    parser.add_argument(
+        "-x",
+        "--index",
+        action="store_true",
+        help="use a suffix array index of the file, built once in a sidecar file (FILE.sa) and memory-mapped in later runs (requires numpy)",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunk-size",
+        type=int,
+        help="search chunks of given length in parallel, then count occurrences of their repeated substrings over the whole file (for files larger than memory)",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=4096,
+        help="length by which each chunk extends over the next one",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of processes used with --chunk-size (default: number of CPUs)",
+    )
+    parser.add_argument("file", type=str, nargs="?", help="file to search in")
+    parsed_args = parser.parse_args()
+    engine = parsed_args.engine or (
+        DEFAULT_CHUNK_ENGINE if parsed_args.chunk_size else DEFAULT_ENGINE
+    )
+
+    if parsed_args.stream_interval:
+        if engine != "stree":
+            raise RuntimeError("Stream requires the stree engine, which is extended online.")
+        if not sys.stdin.isatty():
+            f = sys.stdin.buffer
+        else:
+            f = open(parsed_args.file, "rb")
+        with f:
+            for offset, substring in stream_lrs(f, parsed_args.stream_interval):
+                print(f"{hex(offset)}: {substring}", flush=True)
+        sys.exit(0)
+
+    if parsed_args.chunk_size:
+        if not parsed_args.file:
+            raise RuntimeError("Chunks require a file argument, since it is read in several passes.")
+        top_substrings = chunked_lrs(
+            parsed_args.file,
+            parsed_args.chunk_size,
+            parsed_args.chunk_overlap,
+            engine,
+            parsed_args.jobs,
+        )
+        for substring, count in top_substrings:
+            print(f"{count}: {substring}")
+        print(len(top_substrings))
+        sys.exit(0)
+
+    if parsed_args.index:
+        if open_index is None or not parsed_args.file:
+            raise RuntimeError("Index requires numpy and a file argument.")
+        index = open_index(parsed_args.file)
+        top_substrings = compute_lrs(index.words[0], index=index)
+        for substring, count in top_substrings:
+            print(f"{count}: {substring}")
+        print(len(top_substrings))
+        sys.exit(0)
+
     content = b""
     if not sys.stdin.isatty():
         content = bytes(sys.stdin.read(), encoding="latin-1")
     else:
-        with open(sys.argv[1], "rb") as f:
+        with open(parsed_args.file, "rb") as f:
             content = f.read()
 
-    top_substrings = compute_lrs(content)
-    # clean_substrings = clean_lrs(content, top_substrings)
-    for substring in top_substrings:
-        print(substring)
+    top_substrings = compute_lrs(content, engine=engine)
+    # clean_substrings = clean_lrs(content, [x for x, _ in top_substrings])
+    for substring, count in top_substrings:
+        print(f"{count}: {substring}")
     print(len(top_substrings))
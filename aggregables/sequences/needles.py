@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Matching of many literal needles with a single scan, shared by `hexmatch.py`
+(needle variants) and `lrs.py` (candidate substrings of chunks).
+"""
+
+import functools
+import re
+
+
+def compile_needles(needles):
+    """Returns a pattern matching any of the needles, where alternatives are
+    nested by common prefix (i.e. a trie), so that each position of the data
+    is only compared against needles with a matching prefix."""
+    trie = {}
+    for needle in needles:
+        node = trie
+        for x in needle:
+            node = node.setdefault(x, {})
+        node[None] = {}
+
+    def compile_node(node):
+        alternatives = []
+        for x in sorted(k for k in node if k is not None):
+            prefix = bytearray([x])
+            child = node[x]
+            # Single paths are compiled as literals.
+            while len(child) == 1 and None not in child:
+                (x, child) = next(iter(child.items()))
+                prefix.append(x)
+            alternatives.append(re.escape(bytes(prefix)) + compile_node(child))
+        if len(alternatives) == 0:
+            return b""
+        pattern = b"(?:" + b"|".join(alternatives) + b")"
+        if None in node:
+            pattern += b"?"
+        return pattern
+
+    return re.compile(compile_node(trie))
+
+
+@functools.lru_cache(maxsize=None)
+def prepare_variants(needles):
+    """Returns needles by length, their distinct lengths in decreasing order,
+    and a lookahead pattern for all of them, computed once for each tuple
+    of needles."""
+    by_length = {}
+    for needle in needles:
+        by_length.setdefault(len(needle), set()).add(needle)
+    lengths = sorted(by_length, reverse=True)
+    pattern = re.compile(b"(?=" + compile_needles(set(needles)).pattern + b")")
+    return (by_length, lengths, pattern)
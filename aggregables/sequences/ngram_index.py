@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+"""
+Inverted index of the n-grams of a file, mapping each n-gram to the
+offsets where it occurs, persisted in a sidecar file that is memory-mapped
+on later runs.
+
+Offsets of each n-gram (postings) are delta-encoded as LEB128 varints.
+A needle is found by intersecting the postings of n-grams covering it,
+starting with the rarest, until few candidates are left, which are then
+compared with the file. Needles shorter than an n-gram are found from the
+postings of all n-grams they prefix.
+
+References:
+- Zobel, Justin; Moffat, Alistair. "Inverted files for text search engines." - ACM Computing Surveys, 2006.
+"""
+
+from aggregables.sequences.sidecar import SidecarHeader, file_digest, write_sidecar
+import mmap
+import numpy as np
+import os
+
+NGRAM_LENGTH = 4
+
+# Candidates after which postings are no longer intersected, and are
+# compared with the file instead.
+VERIFY_CANDIDATES = 64
+
+# Sidecar index: magic, source size, source mtime (ns), source digest,
+# n-gram length, number of n-grams and size of postings, then postings,
+# starts and n-grams, starting at `INDEX_HEADER.size`.
+INDEX_HEADER = SidecarHeader(b"AGNGIDX1", "IQQ", 128)
+INDEX_SUFFIX = ".ng"
+
+
+def encode_varints(values):
+    """Returns the LEB128 encoding of an array of unsigned integers, and
+    the position where each value starts in it."""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * k))
+    starts = np.cumsum(lengths) - lengths
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        is_encoded = lengths > k
+        x = (values[is_encoded] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        x |= (lengths[is_encoded] > k + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[is_encoded] + k] = x
+    return (encoded, starts)
+
+
+def decode_varints(encoded):
+    """Returns the array of unsigned integers in a LEB128 encoding."""
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    ends = np.flatnonzero(encoded < 0x80)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    x = (encoded & 0x7F).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.bitwise_or.reduceat(x, starts)
+
+
+def _ngrams(values, positions, n):
+    """Returns the n-grams starting at the given positions, as integers."""
+    grams = np.zeros(len(positions), dtype=np.uint32)
+    for j in range(n):
+        grams = (grams << np.uint32(8)) | values[positions + j]
+    return grams
+
+
+def build_postings(content, n=NGRAM_LENGTH):
+    """Yields tuples `(grams, counts, postings)` of the n-grams of the
+    content, in increasing order, where `postings` are the concatenated
+    varint deltas of the sorted offsets of each n-gram, and `counts` the
+    number of bytes of each n-gram in `postings`.
+
+    n-grams are grouped by their first byte, so that only offsets of a
+    group are sorted at a time.
+    """
+    values = np.frombuffer(content, dtype=np.uint8)
+    count = len(values) - n + 1
+    if count < 1:
+        return
+    by_first_byte = np.argsort(values[:count], kind="stable")
+    first_bytes = np.bincount(values[:count], minlength=256)
+    group_start = 0
+    for size in first_bytes.tolist():
+        if size == 0:
+            continue
+        positions = by_first_byte[group_start : group_start + size]
+        group_start += size
+        grams = _ngrams(values, positions, n)
+        order = np.argsort(grams, kind="stable")
+        grams = grams[order]
+        positions = positions[order]
+
+        is_start = np.empty(len(grams), dtype=bool)
+        is_start[0] = True
+        is_start[1:] = grams[1:] != grams[:-1]
+        deltas = np.diff(positions, prepend=0)
+        deltas[is_start] = positions[is_start]
+        (encoded, starts) = encode_varints(deltas)
+        gram_starts = starts[is_start]
+        counts = np.diff(gram_starts, append=len(encoded))
+        yield (grams[is_start], counts, encoded)
+
+
+class NgramIndex:
+    """Inverted index of the n-grams of bytes.
+
+    `grams` are the distinct n-grams as sorted integers, and the postings
+    of `grams[i]` are `postings[starts[i] : starts[i + 1]]`.
+    """
+
+    def __init__(self, data=b"", n=NGRAM_LENGTH):
+        self.data = data
+        self.n = n
+        self.grams = np.zeros(0, dtype=np.uint32)
+        self.starts = np.zeros(1, dtype=np.uint64)
+        self.postings = np.zeros(0, dtype=np.uint8)
+
+        if len(data) > 0:
+            self.build(data)
+
+    def build(self, data):
+        self.data = data
+        grams = []
+        counts = []
+        postings = []
+        for group_grams, group_counts, group_postings in build_postings(data, self.n):
+            grams.append(group_grams)
+            counts.append(group_counts)
+            postings.append(group_postings)
+        if len(grams) == 0:
+            return
+        self.grams = np.concatenate(grams)
+        self.starts = np.concatenate(([0], np.cumsum(np.concatenate(counts)))).astype(
+            np.uint64
+        )
+        self.postings = np.concatenate(postings)
+
+    def _positions(self, lo, hi):
+        """Returns the sorted offsets of n-grams in range [lo, hi)."""
+        start = int(self.starts[lo])
+        encoded = np.asarray(self.postings[start : int(self.starts[hi])])
+        positions = np.cumsum(decode_varints(encoded))
+        if hi - lo <= 1:
+            return positions
+
+        # The first delta of each n-gram is its first offset, so sums of
+        # previous n-grams are subtracted.
+        value_ends = np.flatnonzero(encoded < 0x80)
+        firsts = np.searchsorted(
+            value_ends, np.asarray(self.starts[lo:hi]).astype(np.int64) - start
+        )
+        bases = np.zeros(len(firsts), dtype=np.uint64)
+        bases[1:] = positions[firsts[1:] - 1]
+        positions -= np.repeat(bases, np.diff(firsts, append=len(positions)))
+        return np.sort(positions)
+
+    def _find_range(self, y):
+        """Returns the range [lo, hi) of n-grams starting with y."""
+        prefix = int.from_bytes(y, "big") << (8 * (self.n - len(y)))
+        lo = np.searchsorted(self.grams, prefix, side="left")
+        hi = np.searchsorted(
+            self.grams, prefix + (1 << (8 * (self.n - len(y)))) - 1, side="right"
+        )
+        return (int(lo), int(hi))
+
+    def find_all(self, y):
+        """Returns the set of starting positions of y in the indexed bytes."""
+        m = len(y)
+        if m == 0 or m > len(self.data):
+            return set()
+
+        if m < self.n:
+            positions = set(self._positions(*self._find_range(y)).tolist())
+            # The last bytes do not start an n-gram.
+            tail_start = max(len(self.data) - self.n + 1, 0)
+            for i in range(tail_start, len(self.data) - m + 1):
+                if self.data[i : i + m] == y:
+                    positions.add(i)
+            return positions
+
+        # n-grams covering y, from the rarest.
+        offsets = sorted(set(range(0, m - self.n + 1, self.n)) | {m - self.n})
+        ranges = []
+        for offset in offsets:
+            (lo, hi) = self._find_range(y[offset : offset + self.n])
+            if lo == hi:
+                return set()
+            ranges.append((int(self.starts[hi] - self.starts[lo]), offset, lo, hi))
+        ranges.sort()
+
+        candidates = None
+        for _, offset, lo, hi in ranges:
+            if candidates is not None and len(candidates) <= VERIFY_CANDIDATES:
+                break
+            positions = self._positions(lo, hi).astype(np.int64) - offset
+            if candidates is None:
+                candidates = positions[positions >= 0]
+            else:
+                candidates = np.intersect1d(candidates, positions, assume_unique=True)
+        return set(
+            x for x in candidates.tolist() if self.data[x : x + m] == y
+        )
+
+    def find_many(self, ys):
+        """Returns the starting positions of each substring in ys, as a list
+        of sets in the same order.
+
+        :param ys: Iterable of bytes
+        """
+        return [self.find_all(y) for y in ys]
+
+
+def _write_index(path, content, n, size, mtime_ns, digest):
+    """Writes postings while they are built, followed by n-grams and the
+    starting position of their postings."""
+
+    def write(f):
+        grams = []
+        counts = []
+        INDEX_HEADER.write(f, size, mtime_ns, digest, n, 0, 0)
+        postings_size = 0
+        for group_grams, group_counts, group_postings in build_postings(content, n):
+            group_postings.tofile(f)
+            postings_size += len(group_postings)
+            grams.append(group_grams)
+            counts.append(group_counts)
+        grams = np.concatenate(grams) if grams else np.zeros(0, dtype=np.uint32)
+        counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.uint64)
+        # Aligned for memory-mapping.
+        f.write(b"\0" * (-postings_size % 8))
+        np.concatenate(([0], np.cumsum(counts))).astype(np.uint64).tofile(f)
+        grams.astype(np.uint32).tofile(f)
+        f.seek(0)
+        INDEX_HEADER.write(f, size, mtime_ns, digest, n, len(grams), postings_size)
+
+    write_sidecar(path, write)
+
+
+def open_index(filename, index_filename=None, n=NGRAM_LENGTH):
+    """Returns an n-gram index over the bytes of a file, memory-mapped from a
+    sidecar index file (by default, `filename` with suffix `.ng4` for
+    4-grams).
+
+    The index is built on first use, and rebuilt when the size or digest
+    of the file changes. The digest is only computed again if the
+    modification time changed, so that an unchanged file is never read
+    in full.
+    """
+    if index_filename is None:
+        index_filename = f"{filename}{INDEX_SUFFIX}{n}"
+
+    with open(filename, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return NgramIndex(b"", n)
+
+        (header, digest) = INDEX_HEADER.read_valid(f, index_filename, (n,))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if header is None:
+            if digest is None:
+                f.seek(0)
+                digest = file_digest(f)
+            _write_index(
+                index_filename, data, n, stat.st_size, stat.st_mtime_ns, digest
+            )
+            header = INDEX_HEADER.read(index_filename)
+
+    (_, _, _, _, grams_count, postings_size) = header
+    index = NgramIndex(b"", n)
+    index.data = data
+    offset = INDEX_HEADER.size
+    if postings_size > 0:
+        index.postings = np.memmap(
+            index_filename, dtype=np.uint8, mode="r", offset=offset, shape=(postings_size,)
+        )
+    offset += postings_size + (-postings_size % 8)
+    index.starts = np.memmap(
+        index_filename, dtype=np.uint64, mode="r", offset=offset, shape=(grams_count + 1,)
+    )
+    offset += (grams_count + 1) * 8
+    if grams_count > 0:
+        index.grams = np.memmap(
+            index_filename, dtype=np.uint32, mode="r", offset=offset, shape=(grams_count,)
+        )
+    return index
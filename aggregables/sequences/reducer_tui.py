@@ -6,11 +6,11 @@ from aggregables.differences.filterdiff import (
     apply_replacements,
     REPLACE_STR_DEFAULT,
 )
-from aggregables.sequences.lrs import compute_lrs, clean_lrs
+from aggregables.sequences.lrs import compute_lrs, clean_lrs, DEFAULT_ENGINE, ENGINES
 
 from collections import OrderedDict
+import argparse
 import re
-import sys
 
 
 try:
@@ -60,10 +60,10 @@ def reduce_repeated_lines(lines):
     return OrderedDict(sorted(collapsed_occurrences.items(), key=lambda x: int(x[0])))
 
 
-def reduce_text(text, lines):
+def reduce_text(text, lines, engine=DEFAULT_ENGINE):
     text = bytes(text, encoding="latin-1")
     newline_positions = [x.span()[0] for x in re.finditer(b"\n", text)]
-    top_substrings = compute_lrs(text)
+    top_substrings = [substring for substring, _ in compute_lrs(text, engine=engine)]
     clean_substrings = clean_lrs(text, top_substrings)
 
     seen_i = None
@@ -101,25 +101,40 @@ def reduce_text(text, lines):
     return OrderedDict(sorted(collapsed_occurrences.items(), key=lambda x: int(x[0])))
 
 
-original_text = open(sys.argv[1], "r").read()
-original_lines = original_text.split("\n")
-texts = [original_text]
-rules = open(sys.argv[2], "r").readlines()
-replacements = compute_replacements(rules, texts)
-replaced_text = apply_replacements(replacements, texts)[0]
-replaced_lines = replaced_text.split("\n")
-
-# collapsed_occurrences = reduce_repeated_lines(replaced_lines)
-collapsed_occurrences = reduce_text(replaced_text, replaced_lines)
-collapsed_lines = []
-for i in collapsed_occurrences.keys():
-    if len(collapsed_occurrences[i]) > 1:
-        line = "+" + replaced_lines[i].replace(REPLACE_STR_DEFAULT, "?")
-    else:
-        line = " " + original_lines[i]
-    line = line.rstrip()
-    if line:
-        collapsed_lines.append(highlight(line))
-
-md = MultiPane("\n".join(collapsed_lines), get_text)
-md.run()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-e",
+        "--engine",
+        default=DEFAULT_ENGINE,
+        choices=ENGINES.keys(),
+        help="index used to find repeated substrings",
+    )
+    parser.add_argument("file", type=str, help="file to read lines from")
+    parser.add_argument("rules", type=str, help="file with one filter rule per line")
+    parsed_args = parser.parse_args()
+
+    with open(parsed_args.file, "r") as f:
+        original_text = f.read()
+    original_lines = original_text.split("\n")
+    texts = [original_text]
+    with open(parsed_args.rules, "r") as f:
+        rules = f.readlines()
+    replacements = compute_replacements(rules, texts)
+    replaced_text = apply_replacements(replacements, texts)[0]
+    replaced_lines = replaced_text.split("\n")
+
+    # collapsed_occurrences = reduce_repeated_lines(replaced_lines)
+    collapsed_occurrences = reduce_text(replaced_text, replaced_lines, parsed_args.engine)
+    collapsed_lines = []
+    for i in collapsed_occurrences.keys():
+        if len(collapsed_occurrences[i]) > 1:
+            line = "+" + replaced_lines[i].replace(REPLACE_STR_DEFAULT, "?")
+        else:
+            line = " " + original_lines[i]
+        line = line.rstrip()
+        if line:
+            collapsed_lines.append(highlight(line))
+
+    md = MultiPane("\n".join(collapsed_lines), get_text)
+    md.run()
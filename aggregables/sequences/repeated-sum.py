@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 
-from lrs import parse_contents
-from suffix_trees.suffix_trees import STree
+from lrs import parse_contents, ENGINES, DEFAULT_ENGINE
+import argparse
 import colorama
 import re
 import sys
 
 colorama.init()
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-e",
+    "--engine",
+    default=DEFAULT_ENGINE,
+    choices=ENGINES.keys(),
+    help="index used to find repeated substrings",
+)
+parser.add_argument("file", type=str, nargs="?", help="file to read lines from")
+parsed_args = parser.parse_args()
+
 lines = None
 if not sys.stdin.isatty():
     lines = [x.strip() for x in sys.stdin.readlines()]
 else:
-    with open(sys.argv[1], "r") as f:
+    with open(parsed_args.file, "r") as f:
         lines = [x.strip() for x in f.readlines()]
 
 delimiter = " "
@@ -31,7 +42,7 @@ while is_satisfied:
         is_satisfied = False
         break
 
-    (lrs, new_contents) = parse_contents(contents)
+    (lrs, new_contents) = parse_contents(contents, parsed_args.engine)
     contents = new_contents
     if len(lrs) < min_len_substrings:
         is_satisfied = False
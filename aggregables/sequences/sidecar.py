@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+Sidecar files of indexes built over a file, which are memory-mapped on later
+runs. Each sidecar starts with a header identifying the contents of the file
+it was built from: magic, source size, source mtime (ns) and source digest,
+followed by fields specific to the index.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+
+
+class SidecarHeader:
+    """Header of a sidecar index, padded to `size` bytes, where `fields` is
+    the struct format of the fields specific to the index."""
+
+    def __init__(self, magic, fields, size):
+        self.magic = magic
+        self.struct = struct.Struct("<8sQq32s" + fields)
+        self.size = size
+
+    def write(self, f, size, mtime_ns, digest, *fields):
+        header = self.struct.pack(self.magic, size, mtime_ns, digest, *fields)
+        f.write(header.ljust(self.size, b"\0"))
+
+    def read(self, path):
+        """Returns a tuple `(size, mtime_ns, digest, *fields)`, or `None` if
+        the sidecar is missing or not an index of this kind."""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(self.struct.size)
+        except OSError:
+            return None
+        if len(header) < self.struct.size:
+            return None
+        (magic, *values) = self.struct.unpack(header)
+        if magic != self.magic:
+            return None
+        return tuple(values)
+
+    def read_valid(self, f, path, fields=()):
+        """Returns a tuple `(header, digest)`, where `header` is as returned
+        by `read()` if the sidecar was built from the current contents of the
+        open file `f` and starts with the given index fields, otherwise
+        `None`, and `digest` is the digest of `f` if it was computed.
+
+        The digest is only computed again if the modification time changed,
+        so that an unchanged file is never read in full. If only the
+        modification time changed, it is updated in the header.
+        """
+        stat = os.fstat(f.fileno())
+        header = self.read(path)
+        if (
+            header is None
+            or header[0] != stat.st_size
+            or header[3 : 3 + len(fields)] != tuple(fields)
+        ):
+            return (None, None)
+        if header[1] == stat.st_mtime_ns:
+            return (header, None)
+        f.seek(0)
+        digest = file_digest(f)
+        if header[2] != digest:
+            return (None, digest)
+        with open(path, "r+b") as index_f:
+            self.write(index_f, stat.st_size, stat.st_mtime_ns, digest, *header[3:])
+        return ((stat.st_size, stat.st_mtime_ns, digest, *header[3:]), digest)
+
+
+def file_digest(f):
+    digest = hashlib.blake2b(digest_size=32)
+    while True:
+        block = f.read(2 ** 20)
+        if not block:
+            break
+        digest.update(block)
+    return digest.digest()
+
+
+def write_sidecar(path, write):
+    """Calls `write(f)` with a new temporary file in the same directory as
+    `path`, which then replaces it, so that concurrent runs neither share a
+    partial file nor replace the index with one.
+    """
+    (fd, tmp_path) = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # Same permissions as files created by `open()`.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(f.fileno(), 0o666 & ~umask)
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
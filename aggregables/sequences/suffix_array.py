@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+
+"""
+Suffix array with LCP array, answering the same queries as
+`suffix_trees.STree` (find, find_all, lrs, lcs) in a fraction of its memory.
+
+The suffix array is built by prefix doubling, where each round sorts all
+suffixes by their first 2^k symbols with vectorized NumPy operations.
+The LCP array is computed by comparing the first symbols of adjacent
+suffixes with vectorized operations, then finishing the remaining long
+common prefixes with Kasai's algorithm.
+
+For files that are queried repeatedly, `open_index()` persists both arrays
+in a sidecar file, which is memory-mapped on later runs, along with the
+file itself. The sidecar is built out of core by the same algorithms, where
+arrays are memory-mapped files, and suffixes are sorted a batch of groups
+at a time.
+
+References:
+- Manber, Udi; Myers, Gene. "Suffix arrays: a new method for on-line string searches." - SIAM Journal on Computing, 1993.
+- Kasai, Toru et al. "Linear-Time Longest-Common-Prefix Computation in Suffix Arrays and Its Applications." - CPM, 2001.
+"""
+
+from aggregables.sequences.sidecar import SidecarHeader, file_digest, write_sidecar
+from bisect import bisect_right
+from collections import deque
+import mmap
+import numpy as np
+import os
+import tempfile
+
+
+# Number of symbols compared with vectorized operations before computing
+# the remaining longer common prefixes one by one.
+LCP_VECTORIZED_LENGTH = 32
+
+# Suffixes sorted (or positions compared) at a time when building a sidecar
+# index, which bounds the memory used by the build, except for groups of
+# suffixes with the same sort key.
+BUILD_BATCH_SIZE = 2 ** 20
+
+# Sidecar index: magic, source size, source mtime (ns), source digest,
+# array item size, then the suffix array and LCP array, each with
+# `size + 1` items, starting at `INDEX_HEADER.size`.
+INDEX_HEADER = SidecarHeader(b"AGSAIDX1", "I", 64)
+INDEX_SUFFIX = ".sa"
+
+
+def build_suffix_array(text):
+    """Returns the suffix array of an integer array, where the last symbol is unique.
+
+    Each suffix's rank is the position in the suffix array where its group
+    (suffixes with the same prefix of the current length) starts, and only
+    groups with more than one suffix are sorted in the next round.
+    """
+    n = len(text)
+    dtype = np.int32 if n < 2 ** 31 else np.int64
+    sa = np.argsort(text, kind="stable").astype(dtype)
+    rank = np.empty(n, dtype=dtype)
+    slots = np.arange(n, dtype=dtype)
+    keys = (text[sa],)
+    k = 1
+    while len(slots) > 0:
+        is_group_start = np.empty(len(slots), dtype=bool)
+        is_group_start[0] = True
+        is_group_start[1:] = slots[1:] != slots[:-1] + 1
+        for key in keys:
+            is_group_start[1:] |= key[1:] != key[:-1]
+        group_start = np.maximum.accumulate(np.where(is_group_start, slots, 0))
+        rank[sa[slots]] = group_start
+
+        # Keep groups with more than one suffix.
+        group_ids = np.cumsum(is_group_start) - 1
+        group_sizes = np.bincount(group_ids)
+        slots = slots[group_sizes[group_ids] > 1]
+        if len(slots) == 0 or k >= n:
+            break
+
+        suffixes = sa[slots]
+        first = rank[suffixes]
+        second = np.full(len(slots), -1, dtype=dtype)
+        has_second = suffixes + k < n
+        second[has_second] = rank[suffixes[has_second] + k]
+        order = np.lexsort((second, first))
+        sa[slots] = suffixes[order]
+        keys = (first[order], second[order])
+        k *= 2
+    return sa
+
+
+def build_lcp_array(text, sa):
+    """Returns `lcp`, where `lcp[i]` is the length of the longest common
+    prefix of suffixes `sa[i - 1]` and `sa[i]` (and `lcp[0] == 0`)."""
+    n = len(sa)
+    lcp = np.zeros(n, dtype=sa.dtype)
+    if n < 2:
+        return lcp
+
+    # Permuted LCP: plcp[i] is the LCP of suffix i and its predecessor in sa.
+    prev = np.full(n, -1, dtype=sa.dtype)
+    prev[sa[1:]] = sa[:-1]
+    plcp = np.zeros(n, dtype=sa.dtype)
+    a = np.flatnonzero(prev >= 0)
+    b = prev[a]
+    for length in range(LCP_VECTORIZED_LENGTH):
+        # Comparisons never go past the end, since the last symbol is unique.
+        is_equal = text[a + length] == text[b + length]
+        plcp[a[~is_equal]] = length
+        a = a[is_equal]
+        b = b[is_equal]
+        if len(a) == 0:
+            break
+
+    # Kasai's algorithm for the remaining suffixes, using that
+    # plcp[i] >= plcp[i - 1] - 1.
+    symbols = memoryview(np.ascontiguousarray(text))
+    plcp_view = memoryview(plcp)
+    prev_view = memoryview(prev)
+    for i in a.tolist():
+        h = LCP_VECTORIZED_LENGTH
+        if i > 0:
+            h = max(h, plcp_view[i - 1] - 1)
+        j = prev_view[i]
+        while symbols[i + h] == symbols[j + h]:
+            h += 1
+        plcp_view[i] = h
+
+    lcp[1:] = plcp[sa[1:]]
+    return lcp
+
+
+class SuffixArray:
+    """Suffix array over a string, bytes or a list of those types.
+
+    Inputs are concatenated in an array of integer symbols, each followed by
+    a distinct terminal symbol that is greater than any input symbol.
+    """
+
+    def __init__(self, input=""):
+        self.input_type = None
+        self.words = []
+        self.word_starts = []
+        self.text = np.zeros(0, dtype=np.int64)
+        self.sa = np.zeros(0, dtype=np.int64)
+        self.lcp = np.zeros(0, dtype=np.int64)
+
+        if not input == "":
+            self.build(input)
+
+    def _check_input(self, input):
+        """Checks the validity of the input.
+
+        In case of an invalid input throws ValueError.
+        """
+        if isinstance(input, str):
+            return (str, [input])
+        elif isinstance(input, bytes):
+            return (bytes, [input])
+        elif isinstance(input, (list, tuple)):
+            if all(isinstance(item, str) for item in input):
+                return (str, list(input))
+            elif all(isinstance(item, bytes) for item in input):
+                return (bytes, list(input))
+
+        raise ValueError(
+            "String argument should be of type 'Bytes' or 'String' or a list of those types"
+        )
+
+    def _symbols(self, x):
+        if self.input_type == bytes and isinstance(x, str):
+            x = bytes(x, "UTF8")
+        if isinstance(x, str):
+            return np.frombuffer(x.encode("utf-32-le"), dtype="<u4").astype(np.int32)
+        return np.frombuffer(x, dtype=np.uint8).astype(np.int32)
+
+    def build(self, x):
+        """Builds the suffix array and LCP array on the given input.
+
+        :param x: String or List of Strings
+        """
+        (self.input_type, self.words) = self._check_input(x)
+        terminal_start = 0x110000 if self.input_type == str else 0x100
+
+        parts = []
+        self.word_starts = []
+        i = 0
+        for n, word in enumerate(self.words):
+            self.word_starts.append(i)
+            parts.append(self._symbols(word))
+            parts.append(np.array([terminal_start + n], dtype=np.int32))
+            i += len(word) + 1
+        self.text = np.concatenate(parts).astype(np.int32)
+        self.sa = build_suffix_array(self.text)
+        self.lcp = build_lcp_array(self.text, self.sa)
+
+    def _get_word_start_index(self, idx):
+        """Helper method that returns the index of the string based on
+        the starting index of a suffix"""
+        return bisect_right(self.word_starts, idx) - 1
+
+    def _substring(self, start, end):
+        i = self._get_word_start_index(start)
+        offset = self.word_starts[i]
+        return self.words[i][start - offset : end - offset]
+
+    def _empty(self):
+        return b"" if self.input_type == bytes else ""
+
+    def _compare(self, pos, y):
+        """Compares the suffix at `pos`, truncated to the length of `y`, with `y`."""
+        candidate = self.text[pos : pos + len(y)]
+        mismatches = np.flatnonzero(candidate != y[: len(candidate)])
+        if len(mismatches) > 0:
+            i = mismatches[0]
+            return -1 if candidate[i] < y[i] else 1
+        # Only when the text is mapped without its terminal symbol, which
+        # is greater than any input symbol.
+        return 1 if len(candidate) < len(y) else 0
+
+    def _find_range(self, y):
+        """Returns the range [lo, hi) of suffixes starting with y."""
+        y = self._symbols(y)
+        lo = 0
+        hi = len(self.sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(self.sa[mid], y) < 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        hi = len(self.sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(self.sa[mid], y) <= 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return (start, lo)
+
+    def find(self, y):
+        """Returns starting position of the substring y in the string used for
+        building the suffix array.
+
+        :param y: String
+        :return: Index of the starting position of string y in the string used for building the suffix array
+                 -1 if y is not a substring.
+        """
+        (lo, hi) = self._find_range(y)
+        if lo == hi:
+            return -1
+        return int(self.sa[lo:hi].min())
+
+    def find_all(self, y):
+        (lo, hi) = self._find_range(y)
+        if lo == hi:
+            return {}
+        return set(self.sa[lo:hi].tolist())
+
+    def find_many(self, ys):
+        """Returns the starting positions of each substring in ys, as a list
+        of sets in the same order.
+
+        :param ys: Iterable of Strings
+        """
+        positions = []
+        for y in ys:
+            (lo, hi) = self._find_range(y)
+            positions.append(set(self.sa[lo:hi].tolist()))
+        return positions
+
+    def lrs(self, count_occurrences=2):
+        """Returns the Longest Repeated Substring, occurring at least
+        `count_occurrences` times."""
+        window = max(count_occurrences, 2) - 1
+        if len(self.lcp) <= window:
+            return self._empty()
+        if window == 1:
+            lengths = self.lcp[1:]
+        else:
+            lengths = np.lib.stride_tricks.sliding_window_view(
+                self.lcp[1:], window
+            ).min(axis=1)
+        i = int(np.argmax(lengths))
+        length = int(lengths[i])
+        if length == 0:
+            return self._empty()
+        start = int(self.sa[i + 1])
+        return self._substring(start, start + length)
+
+    def repeats(self):
+        """Returns the suffix array, and an iterator of tuples
+        `(depth, parent_depth, lo, hi)` for each LCP interval, where
+        `sa[lo:hi]` are the starting indexes of a right-maximal repeat of
+        length `depth`.
+
+        References:
+        - Abouelhoda, Mohamed Ibrahim et al. "Replacing suffix trees with enhanced suffix arrays." - Journal of Discrete Algorithms, 2004.
+        """
+        return (memoryview(self.sa), self._lcp_intervals())
+
+    def _lcp_intervals(self):
+        lcp = memoryview(np.append(self.lcp, 0))
+        stack = [(0, 0)]
+        for i in range(1, len(lcp)):
+            length = lcp[i]
+            lo = i - 1
+            while length < stack[-1][0]:
+                (depth, lo) = stack.pop()
+                yield (depth, max(length, stack[-1][0]), lo, i)
+            if length > stack[-1][0]:
+                stack.append((length, lo))
+
+    def lcs(self, stringIdxs=-1):
+        """Returns the Largest Common Substring of Strings provided in stringIdxs.
+        If stringIdxs is not provided, the LCS of all strings is returned.
+
+        ::param stringIdxs: Optional: List of indexes of strings.
+        """
+        if stringIdxs == -1 or not isinstance(stringIdxs, list):
+            stringIdxs = list(range(len(self.words)))
+        required = set(stringIdxs)
+        if len(required) == 0:
+            return self._empty()
+        if len(required) == 1:
+            return self.words[required.pop()]
+
+        word_idxs = np.searchsorted(self.word_starts, self.sa, side="right") - 1
+        kept = np.flatnonzero(np.isin(word_idxs, list(required)))
+        # LCP between consecutive kept suffixes is the minimum over the
+        # skipped suffixes in between.
+        kept_lcp = [0] + np.minimum.reduceat(
+            np.append(self.lcp, 0), kept + 1
+        )[:-1].tolist()
+        kept_words = word_idxs[kept].tolist()
+
+        # Sliding window over kept suffixes covering all required strings,
+        # tracking the minimum LCP inside the window.
+        best_length = 0
+        best_start = 0
+        counts = {}
+        window_min = deque()
+        lo = 0
+        for hi in range(len(kept_words)):
+            counts[kept_words[hi]] = counts.get(kept_words[hi], 0) + 1
+            if hi > lo:
+                while window_min and kept_lcp[window_min[-1]] >= kept_lcp[hi]:
+                    window_min.pop()
+                window_min.append(hi)
+            while len(counts) == len(required):
+                length = kept_lcp[window_min[0]]
+                if length > best_length:
+                    best_length = length
+                    best_start = int(self.sa[kept[hi]])
+                counts[kept_words[lo]] -= 1
+                if counts[kept_words[lo]] == 0:
+                    del counts[kept_words[lo]]
+                lo += 1
+                while window_min and window_min[0] <= lo:
+                    window_min.popleft()
+
+        if best_length == 0:
+            return self._empty()
+        return self._substring(best_start, best_start + best_length)
+
+
+def _temporary_array(tmp_dir, dtype, shape):
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+
+def _symbols_at(values, positions):
+    """Returns the symbols at the given positions of bytes followed by a
+    terminal symbol (0x100)."""
+    symbols = np.full(len(positions), 0x100, dtype=np.int16)
+    is_inside = positions < len(values)
+    symbols[is_inside] = values[positions[is_inside]]
+    return symbols
+
+
+def _sort_by_first_symbol(values, sa, rank, batch_size):
+    """Sorts suffixes by their first symbol, a batch of positions at a
+    time, where the rank of each suffix is the start of its group."""
+    n = len(values)
+    counts = np.zeros(0x101, dtype=np.int64)
+    for start in range(0, n, batch_size):
+        counts[:0x100] += np.bincount(values[start : start + batch_size], minlength=0x100)
+    counts[0x100] = 1
+    starts = np.cumsum(counts) - counts
+    cursors = starts.copy()
+    for start in range(0, n, batch_size):
+        symbols = np.asarray(values[start : start + batch_size])
+        order = np.argsort(symbols, kind="stable")
+        sorted_symbols = symbols[order]
+        symbol_counts = np.bincount(symbols, minlength=0x100)
+        # Positions of this batch go after those of previous batches.
+        batch_starts = np.cumsum(symbol_counts) - symbol_counts
+        offsets = np.arange(len(order)) - batch_starts[sorted_symbols]
+        sa[cursors[sorted_symbols] + offsets] = order + start
+        cursors[:0x100] += symbol_counts
+        rank[start : start + len(symbols)] = starts[symbols]
+    sa[n] = n
+    rank[n] = n
+
+
+def _second_keys(rank, suffixes, k, n):
+    second = np.full(len(suffixes), -1, dtype=rank.dtype)
+    has_second = suffixes + k <= n
+    second[has_second] = rank[suffixes[has_second] + k]
+    return second
+
+
+def _sort_groups(sa, rank, lo, hi, groups, k, n):
+    """Sorts groups of suffixes in `sa[lo:hi]` by the rank of their suffix
+    at `k`, as in `build_suffix_array()`, and returns the number of suffixes
+    left in groups with more than one suffix."""
+    is_group_start = np.empty(len(groups), dtype=bool)
+    is_group_start[0] = True
+    is_group_start[1:] = groups[1:] != groups[:-1]
+    group_ids = np.cumsum(is_group_start) - 1
+    group_sizes = np.bincount(group_ids)
+    slots = np.flatnonzero(group_sizes[group_ids] > 1)
+    if len(slots) == 0:
+        return 0
+
+    suffixes = np.asarray(sa[lo:hi])[slots]
+    first = groups[slots]
+    second = _second_keys(rank, suffixes, k, n)
+    order = np.lexsort((second, first))
+    (suffixes, first, second) = (suffixes[order], first[order], second[order])
+    slots += lo
+    # Groups keep their slots, which are contiguous.
+    sa[slots] = suffixes
+    is_group_start = np.empty(len(slots), dtype=bool)
+    is_group_start[0] = True
+    is_group_start[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+    rank[suffixes] = np.maximum.accumulate(np.where(is_group_start, slots, 0))
+    group_ids = np.cumsum(is_group_start) - 1
+    group_sizes = np.bincount(group_ids)
+    return int(group_sizes[group_sizes > 1].sum())
+
+
+def _sort_large_group(sa, rank, lo, hi, k, n, batch_size, tmp_dir):
+    """Sorts a group of suffixes `sa[lo:hi]` larger than a batch, as
+    `_sort_groups()` would, by distributing them in ranges of keys that
+    are each sorted in memory.
+
+    Keys are read before any rank of the group is updated, since suffixes
+    at `k` may be in the same group.
+    """
+    size = hi - lo
+    batches = range(lo, hi, batch_size)
+
+    # Splitters between ranges of keys, from a sample of each batch.
+    samples = []
+    for start in batches:
+        suffixes = np.asarray(sa[start : min(start + batch_size, hi)])
+        keys = np.sort(_second_keys(rank, suffixes, k, n))
+        samples.append(keys[:: max(len(keys) // 64, 1)])
+    samples = np.sort(np.concatenate(samples))
+    n_ranges = -(-2 * size // batch_size)
+    splitters = np.unique(samples[len(samples) * np.arange(1, n_ranges) // n_ranges])
+
+    range_counts = np.zeros(len(splitters) + 1, dtype=np.int64)
+    for start in batches:
+        suffixes = np.asarray(sa[start : min(start + batch_size, hi)])
+        keys = _second_keys(rank, suffixes, k, n)
+        range_counts += np.bincount(
+            np.searchsorted(splitters, keys, side="right"), minlength=len(range_counts)
+        )
+    range_starts = np.cumsum(range_counts) - range_counts
+
+    distributed = _temporary_array(tmp_dir, rank.dtype, (2, size))
+    cursors = range_starts.copy()
+    for start in batches:
+        suffixes = np.asarray(sa[start : min(start + batch_size, hi)])
+        keys = _second_keys(rank, suffixes, k, n)
+        ranges = np.searchsorted(splitters, keys, side="right")
+        order = np.argsort(ranges, kind="stable")
+        sorted_ranges = ranges[order]
+        batch_counts = np.bincount(ranges, minlength=len(range_counts))
+        batch_starts = np.cumsum(batch_counts) - batch_counts
+        offsets = np.arange(len(order)) - batch_starts[sorted_ranges]
+        destinations = cursors[sorted_ranges] + offsets
+        distributed[0, destinations] = suffixes[order]
+        distributed[1, destinations] = keys[order]
+        cursors += batch_counts
+
+    unresolved = 0
+    for range_start, range_count in zip(range_starts.tolist(), range_counts.tolist()):
+        if range_count == 0:
+            continue
+        suffixes = np.asarray(distributed[0, range_start : range_start + range_count])
+        keys = np.asarray(distributed[1, range_start : range_start + range_count])
+        order = np.argsort(keys, kind="stable")
+        (suffixes, keys) = (suffixes[order], keys[order])
+        slots = lo + range_start + np.arange(range_count, dtype=rank.dtype)
+        sa[slots] = suffixes
+        # Ranges split groups at different keys.
+        is_group_start = np.empty(range_count, dtype=bool)
+        is_group_start[0] = True
+        is_group_start[1:] = keys[1:] != keys[:-1]
+        rank[suffixes] = np.maximum.accumulate(np.where(is_group_start, slots, 0))
+        group_sizes = np.bincount(np.cumsum(is_group_start) - 1)
+        unresolved += int(group_sizes[group_sizes > 1].sum())
+    del distributed
+    return unresolved
+
+
+def _group_end(sa, rank, lo, start, batch_size):
+    """Returns the end of the group starting at `lo`, from slot `start`."""
+    total = len(sa)
+    while start < total:
+        groups = rank[sa[start : min(start + batch_size, total)]]
+        (ends,) = np.nonzero(groups != lo)
+        if len(ends) > 0:
+            return start + int(ends[0])
+        start += batch_size
+    return total
+
+
+def build_suffix_array_file(values, sa, rank, batch_size, tmp_dir):
+    """Builds the suffix array of bytes followed by a terminal symbol in
+    `sa`, as `build_suffix_array()` would, where `rank` is left with the
+    inverse suffix array. Both arrays may be memory-mapped files.
+
+    Each round goes through the suffix array in batches of whole groups,
+    where ranks are updated after sorting each batch. Ranks of other
+    groups then only get refined during a round, which keeps sorting
+    correct, as in Larsson and Sadakane's algorithm.
+
+    References:
+    - Larsson, N. Jesper; Sadakane, Kunihiko. "Faster suffix sorting." - Theoretical Computer Science, 2007.
+    """
+    n = len(values)
+    total = n + 1
+    _sort_by_first_symbol(values, sa, rank, batch_size)
+    k = 1
+    while k < total:
+        unresolved = 0
+        lo = 0
+        while lo < total:
+            hi = min(lo + batch_size, total)
+            groups = np.asarray(rank[sa[lo:hi]])
+            if hi < total and rank[sa[hi]] == groups[-1]:
+                # The last group goes on after the batch.
+                if groups[-1] > lo:
+                    hi = int(groups[-1])
+                    groups = groups[: hi - lo]
+                else:
+                    hi = _group_end(sa, rank, lo, hi, batch_size)
+                    unresolved += _sort_large_group(
+                        sa, rank, lo, hi, k, n, batch_size, tmp_dir
+                    )
+                    lo = hi
+                    continue
+            unresolved += _sort_groups(sa, rank, lo, hi, groups, k, n)
+            lo = hi
+        if unresolved == 0:
+            break
+        k *= 2
+
+
+def build_lcp_array_file(values, sa, rank, lcp, batch_size, tmp_dir):
+    """Builds the LCP array of bytes followed by a terminal symbol in `lcp`,
+    as `build_lcp_array()` would, from their suffix array and its inverse
+    `rank`, a batch of positions at a time."""
+    n = len(values)
+    total = n + 1
+    plcp = _temporary_array(tmp_dir, sa.dtype, (total,))
+    symbols = memoryview(values)
+    previous = 0
+    for start in range(0, total, batch_size):
+        end = min(start + batch_size, total)
+        lengths = np.zeros(end - start, dtype=sa.dtype)
+        ranks = np.asarray(rank[start:end])
+        (idx,) = np.nonzero(ranks > 0)
+        a = idx + start
+        b = np.asarray(sa[ranks[idx] - 1])
+        for length in range(LCP_VECTORIZED_LENGTH):
+            # Comparisons never go past the terminal symbol, which is unique.
+            is_equal = _symbols_at(values, a + length) == _symbols_at(values, b + length)
+            lengths[idx[~is_equal]] = length
+            (idx, a, b) = (idx[is_equal], a[is_equal], b[is_equal])
+            if len(a) == 0:
+                break
+
+        # Kasai's algorithm for the remaining suffixes, in increasing
+        # positions, using that plcp[i] >= plcp[i - 1] - 1.
+        lengths_view = memoryview(lengths)
+        for x, i, j in zip(idx.tolist(), a.tolist(), b.tolist()):
+            h = LCP_VECTORIZED_LENGTH
+            if i > 0:
+                h = max(h, (lengths_view[x - 1] if x > 0 else previous) - 1)
+            while i + h < n and j + h < n and symbols[i + h] == symbols[j + h]:
+                h += 1
+            lengths_view[x] = h
+        plcp[start:end] = lengths
+        previous = int(lengths[-1])
+
+    lcp[0] = 0
+    for start in range(1, total, batch_size):
+        end = min(start + batch_size, total)
+        lcp[start:end] = plcp[sa[start:end]]
+    del plcp
+
+
+def _write_index(path, values, size, mtime_ns, digest):
+    dtype = np.int32 if size + 1 < 2 ** 31 else np.int64
+    itemsize = np.dtype(dtype).itemsize
+    tmp_dir = os.path.dirname(os.path.abspath(path))
+
+    def write(f):
+        INDEX_HEADER.write(f, size, mtime_ns, digest, itemsize)
+        f.flush()
+        sa = np.memmap(
+            f, dtype=dtype, mode="r+", offset=INDEX_HEADER.size, shape=(size + 1,)
+        )
+        lcp = np.memmap(
+            f,
+            dtype=dtype,
+            mode="r+",
+            offset=INDEX_HEADER.size + (size + 1) * itemsize,
+            shape=(size + 1,),
+        )
+        rank = _temporary_array(tmp_dir, dtype, (size + 1,))
+        build_suffix_array_file(values, sa, rank, BUILD_BATCH_SIZE, tmp_dir)
+        build_lcp_array_file(values, sa, rank, lcp, BUILD_BATCH_SIZE, tmp_dir)
+        sa.flush()
+        lcp.flush()
+
+    write_sidecar(path, write)
+
+
+def open_index(filename, index_filename=None):
+    """Returns a suffix array over the bytes of a file, memory-mapped from a
+    sidecar index file (by default, `filename` with suffix `.sa`).
+
+    The index is built on first use, and rebuilt when the size or digest
+    of the file changes. The digest is only computed again if the
+    modification time changed, so that an unchanged file is never read
+    in full.
+
+    The index is built out of core (see `build_suffix_array_file()`), with
+    a temporary file of the same size as the index next to it.
+    """
+    if index_filename is None:
+        index_filename = filename + INDEX_SUFFIX
+
+    with open(filename, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return SuffixArray(b"")
+
+        (header, digest) = INDEX_HEADER.read_valid(f, index_filename)
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if header is None:
+            if digest is None:
+                f.seek(0)
+                digest = file_digest(f)
+            _write_index(
+                index_filename,
+                np.frombuffer(data, dtype=np.uint8),
+                stat.st_size,
+                stat.st_mtime_ns,
+                digest,
+            )
+            header = INDEX_HEADER.read(index_filename)
+
+    (size, _, _, itemsize) = header
+    dtype = np.int32 if itemsize == 4 else np.int64
+    sa = SuffixArray()
+    sa.input_type = bytes
+    sa.words = [data]
+    sa.word_starts = [0]
+    sa.text = np.frombuffer(data, dtype=np.uint8)
+    sa.sa = np.memmap(
+        index_filename, dtype=dtype, mode="r", offset=INDEX_HEADER.size, shape=(size + 1,)
+    )
+    sa.lcp = np.memmap(
+        index_filename,
+        dtype=dtype,
+        mode="r",
+        offset=INDEX_HEADER.size + (size + 1) * itemsize,
+        shape=(size + 1,),
+    )
+    return sa
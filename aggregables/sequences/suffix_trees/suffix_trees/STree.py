@@ -1,4 +1,5 @@
-import re
+from array import array
+from bisect import bisect_left, bisect_right
 
 class STree():
     """Class representing the suffix tree."""
@@ -12,6 +13,12 @@ class STree():
         self.input_type = None
         self.terminal_symbol_length = 1
         self.terminal_symbols = set()
+        # Positions of terminal symbols in a Suffix tree built over bytes,
+        # see `_build_bytes()`.
+        self._terminals = None
+        # Whether the Suffix tree is built online, see `append()`.
+        self._is_online = False
+        self._stats = None
 
         if not input == '':
             self.build(input)
@@ -42,7 +49,10 @@ class STree():
         """
         (input_type, tree_type) = self._check_input(x)
         self.input_type = input_type
-        if tree_type == 'st':
+        self._stats = None
+        if input_type == bytes:
+            self._build_bytes([x] if tree_type == 'st' else x)
+        elif tree_type == 'st':
             terminal_symbol = next(self._terminalSymbolsGenerator())
             if self.input_type == bytes and isinstance(terminal_symbol, str):
                 terminal_symbol = bytes(terminal_symbol, 'UTF8')
@@ -53,6 +63,35 @@ class STree():
         elif tree_type == 'gst':
             self._build_generalized(x)
 
+    def _build_bytes(self, xs):
+        """Builds a Suffix tree over bytes, with symbols as integers, so
+        that each string can be followed by a distinct terminal symbol above
+        255, which is never part of the input. Terminal symbols are kept in
+        the word as a placeholder byte, at the positions in `_terminals`.
+        """
+        word = bytearray()
+        symbols = array('i')
+        self._terminals = array('q')
+        for i, x in enumerate(xs):
+            word += x
+            symbols.extend(x)
+            self._terminals.append(len(word))
+            word.append(0)
+            symbols.append(256 + i)
+        self.word = bytes(word)
+        if len(xs) > 1:
+            self._generalized_word_starts(xs)
+        self._build_McCreight(symbols)
+        if len(xs) > 1:
+            for node in reversed(self._preorder()):
+                self._label_generalized(node)
+
+    def _next_terminal(self, start):
+        """Helper method that returns the position of the first terminal
+        symbol at or after start, in a Suffix tree built over bytes."""
+        i = bisect_left(self._terminals, start)
+        return self._terminals[i] if i < len(self._terminals) else len(self.word)
+
     def _build(self, x):
         """Builds a Suffix tree."""
         self.word = x
@@ -69,8 +108,11 @@ class STree():
         u = self.root
         d = 0
         for i in range(len(x) - (self.terminal_symbol_length - 1)):
-            while u.depth == d and u._has_transition(x[d + i]):
-                u = u._get_transition_link(x[d + i])
+            while u.depth == d:
+                v = u.transition_links.get(x[d + i])
+                if v is None:
+                    break
+                u = v
                 d = d + 1
                 while d < u.depth and x[u.idx + d] == x[i + d]:
                     d = d + 1
@@ -87,7 +129,7 @@ class STree():
     def _create_node(self, x, u, d):
         i = u.idx
         p = u.parent
-        v = _SNode(idx=i, depth=d, input_type=self.input_type)
+        v = _SNode(idx=i, depth=d)
         v._add_transition_link(u, x[i + d])
         u.parent = v
         p._add_transition_link(v, x[i + p.depth])
@@ -95,7 +137,7 @@ class STree():
         return v
 
     def _create_leaf(self, x, i, u, d):
-        w = _SNode(input_type=self.input_type)
+        w = _SNode()
         w.idx = i
         w.depth = len(x) - i
         u._add_transition_link(w, x[i + d])
@@ -114,11 +156,111 @@ class STree():
     def _build_Ukkonen(self, x):
         """Builds a Suffix tree using Ukkonen's online O(n) algorithm.
 
+        Unlike McCreight's algorithm, symbols can be appended later with
+        `append()`. No terminal symbol is added, so until the input ends with
+        a unique symbol, suffixes that also occur earlier in the input are
+        implicit (i.e. they don't end at a leaf).
+
         Algorithm based on:
         Ukkonen, Esko. "On-line construction of suffix trees." - Algorithmica, 1995.
         """
-        # TODO.
-        raise NotImplementedError()
+        self.word = bytearray() if self.input_type == bytes else []
+        self._is_online = True
+        # Deepest internal node, whose depths never change once created.
+        self._deepest = self.root
+        self._active_node = self.root
+        self._active_edge = 0
+        self._active_length = 0
+        self._remainder = 0
+        self._extend_Ukkonen(x)
+
+    def append(self, x):
+        """Appends symbols to the input, extending the Suffix tree online.
+
+        :param x: String
+        """
+        if self.input_type is None:
+            (input_type, tree_type) = self._check_input(x)
+            if tree_type != 'st':
+                raise ValueError("Online construction is only supported for a single string")
+            self.input_type = input_type
+            self._build_Ukkonen(x)
+        elif not self._is_online:
+            raise ValueError("Suffix tree was not built online")
+        else:
+            self._extend_Ukkonen(x)
+
+    def _extend_Ukkonen(self, x):
+        start = len(self.word)
+        self.word += x
+        word = self.word
+        for i in range(start, len(word)):
+            c = word[i]
+            self._remainder += 1
+            last_new_node = None
+            while self._remainder > 0:
+                if self._active_length == 0:
+                    self._active_edge = i
+                node = self._active_node
+                child = node._get_transition_link(word[self._active_edge])
+                if not child:
+                    self._create_online_leaf(i - node.depth, node, c)
+                    if last_new_node:
+                        last_new_node._add_suffix_link(node)
+                        last_new_node = None
+                else:
+                    # Leaves grow with the input, up to the current symbol.
+                    child_depth = i + 1 - child.idx if child.is_leaf() else child.depth
+                    edge_length = child_depth - node.depth
+                    if self._active_length >= edge_length:
+                        self._active_edge += edge_length
+                        self._active_length -= edge_length
+                        self._active_node = child
+                        continue
+                    if word[child.idx + node.depth + self._active_length] == c:
+                        if last_new_node and node is not self.root:
+                            last_new_node._add_suffix_link(node)
+                            last_new_node = None
+                        self._active_length += 1
+                        break
+                    split = _SNode(idx=child.idx, depth=node.depth + self._active_length)
+                    split.parent = node
+                    node._add_transition_link(split, word[self._active_edge])
+                    split._add_transition_link(child, word[child.idx + split.depth])
+                    child.parent = split
+                    self._create_online_leaf(i - split.depth, split, c)
+                    if last_new_node:
+                        last_new_node._add_suffix_link(split)
+                    last_new_node = split
+                    if split.depth > self._deepest.depth:
+                        self._deepest = split
+                self._remainder -= 1
+                if node is self.root and self._active_length > 0:
+                    self._active_length -= 1
+                    self._active_edge = i - self._remainder + 1
+                elif node is not self.root:
+                    self._active_node = node._get_suffix_link() or self.root
+        self._stats = None
+
+    def _create_online_leaf(self, i, u, symbol):
+        w = _OnlineLeaf(i, self.word)
+        u._add_transition_link(w, symbol)
+        w.parent = u
+        return w
+
+    def _online_lrs(self):
+        """Helper method that returns the Longest Repeated Substring of a
+        Suffix tree built online, in O(1).
+
+        A repeated substring either ends at an internal node, or extends to
+        the end of the input, where the longest one is the longest implicit
+        suffix, of length `_remainder`.
+        """
+        n = len(self.word)
+        deepest = self._deepest
+        if deepest.depth >= self._remainder:
+            return self._substring(deepest.idx, deepest.idx + deepest.depth)
+        return self._substring(n - self._remainder, n)
 
     def _build_generalized(self, xs):
         """Builds a Generalized Suffix Tree (GST) from the array of strings provided.
@@ -138,31 +280,32 @@ class STree():
         self.word = _xs
         self._generalized_word_starts(xs)
         self._build(_xs)
-        self.root._traverse(self._label_generalized)
+        for node in reversed(self._preorder()):
+            self._label_generalized(node)
 
     def _label_generalized(self, node):
-        """Helper method that labels the nodes of GST with indexes of strings
-        found in their descendants.
+        """Helper method that labels the nodes of GST with the bitset of
+        indexes of strings found in their descendants.
         """
         if node.is_leaf():
-            x = {self._get_word_start_index(node.idx)}
+            x = 1 << self._get_word_start_index(node.idx)
         else:
-            x = {n for ns in node.transition_links.values() for n in ns.generalized_idxs}
+            x = 0
+            for n in node.transition_links.values():
+                x |= n.generalized_idxs
         node.generalized_idxs = x
 
     def _get_word_start_index(self, idx):
         """Helper method that returns the index of the string based on node's
         starting index"""
-        i = 0
-        for _idx in self.word_starts[1:]:
-            if idx < _idx:
-                return i
-            else:
-                i += 1
-        return i
+        return bisect_right(self.word_starts, idx) - 1
 
     def _suffix_contains_terminal_symbol(self, start, end):
         """Validates if suffix was composed with multi-byte terminal symbol"""
+        if self._terminals is not None:
+            return self._next_terminal(start) < end
+        if not self.terminal_symbols:
+            return False
         for i in range(0, self.terminal_symbol_length):
             if end+i <= len(self.word):
                 candidate_substring = None
@@ -181,70 +324,188 @@ class STree():
         ::param stringIdxs: Optional: List of indexes of strings.
         """
         if stringIdxs == -1 or not isinstance(stringIdxs, list):
-            stringIdxs = set(range(len(self.word_starts)))
-        else:
-            stringIdxs = set(stringIdxs)
-
-        deepestNode = self._find_lcs(self.root, stringIdxs)
-        start = deepestNode.idx
-        end = deepestNode.idx + deepestNode.depth
-        return self.word[start:end]
-
-    def _find_lcs(self, node, stringIdxs):
-        """Helper method that finds LCS by traversing the labeled GSD."""
-        nodes = [self._find_lcs(n, stringIdxs)
-                 for n in node.transition_links.values()
-                 if n.generalized_idxs.issuperset(stringIdxs)]
-
-        if nodes == []:
-            return node
-
-        candidates = sorted(nodes, key=lambda x: x.depth, reverse=True)
-        for deepestNode in candidates:
-            start = deepestNode.idx
-            end = deepestNode.idx + deepestNode.depth
-            if self._suffix_contains_terminal_symbol(start, end):
+            stringIdxs = range(len(self.word_starts))
+        required = 0
+        for i in stringIdxs:
+            required |= 1 << i
+
+        return self._find_lcs(lambda mask: mask & required == required)
+
+    def lcs_k(self, k):
+        """Returns the Largest Common Substring of at least k of the Strings
+        used for building the Generalized Suffix tree."""
+        return self._find_lcs(lambda mask: bin(mask).count('1') >= k)
+
+    def _find_lcs(self, is_common):
+        """Helper method that returns the label of the deepest node of the
+        GST whose bitset of strings satisfies is_common."""
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        (lcs_start, lcs_end) = (0, 0)
+        for deepestNode in by_depth:
+            if deepestNode.depth <= lcs_end - lcs_start:
+                break
+            if not is_common(deepestNode.generalized_idxs):
                 continue
+            # Labels of leaves are cut at the terminal symbol of their string.
+            start = deepestNode.idx
+            end = min(deepestNode.idx + deepestNode.depth, self._word_end(start))
+            if end - start > lcs_end - lcs_start:
+                (lcs_start, lcs_end) = (start, end)
+        return self._substring(lcs_start, lcs_end)
+
+    def _word_end(self, start):
+        """Helper method that returns the position of the terminal symbol
+        that ends the string containing start, in a Generalized Suffix tree."""
+        if self._terminals is not None:
+            return self._next_terminal(start)
+        i = self._get_word_start_index(start)
+        if i + 1 < len(self.word_starts):
+            return self.word_starts[i + 1] - 1
+        return len(self.word) - 1
+
+    def _preorder(self):
+        """Returns the list of nodes in depth-first order, visiting children
+        in insertion order."""
+        nodes = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(reversed(list(node.transition_links.values())))
+        return nodes
+
+    def _get_stats(self):
+        """Computes once, for each node, the range [lo, hi) of its leaves in
+        the array of suffix starting indexes sorted in depth-first order.
+        Nodes other than the root are also sorted by decreasing depth.
+
+        Arrays are indexed by the `preorder` number of each node.
+        """
+        if self._stats is not None:
+            return self._stats
+
+        nodes = self._preorder()
+        leaves = array('q')
+        lo = array('q', [0]) * len(nodes)
+        hi = array('q', [0]) * len(nodes)
+        for i, node in enumerate(nodes):
+            node.preorder = i
+            lo[i] = len(leaves)
+            if node.is_leaf() and node is not self.root:
+                leaves.append(node.idx)
+        for i in range(len(nodes) - 1, -1, -1):
+            node = nodes[i]
+            if node.is_leaf():
+                hi[i] = lo[i] + 1 if node is not self.root else 0
             else:
-                return deepestNode
-        return node
-
-    def _dfs_recursive(self, v, state):
-        if v not in state:
-            state[v] = {'count_leaves': 0}
-        for i in v.transition_links.values():
-            if i not in state:
-                self._dfs_recursive(i, state)
-                if i.is_leaf():
-                    state[i]['count_leaves'] = 1
-                state[v]['count_leaves'] += state[i]['count_leaves']
-
-    def _dfs(self, v):
-        state = {}
-        self._dfs_recursive(v, state)
-        return state
+                hi[i] = max(hi[n.preorder] for n in node.transition_links.values())
+        by_depth = sorted(nodes[1:], key=lambda x: x.depth, reverse=True)
+        self._stats = (leaves, lo, hi, by_depth)
+        return self._stats
 
     def lrs(self, count_occurrences=2):
-        state = self._dfs(self.root)
-        candidates = []
-        for n in state:
-            if state[n]['count_leaves'] >= count_occurrences:
-                candidates.append(n)
-
-        if candidates == []:
-            return b'' if self.input_type == bytes else ''
-
-        candidates = sorted(candidates, key=lambda x: x.depth, reverse=True)
-        for deepestNode in candidates:
+        if self._is_online and count_occurrences <= 2:
+            return self._online_lrs()
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        if self._is_online:
+            (counts, implicit_counts) = self._get_online_counts()
+        else:
+            counts = [h - l for (l, h) in zip(lo, hi)]
+            implicit_counts = []
+        lrs = b'' if self.input_type == bytes else ''
+        for deepestNode in by_depth:
+            i = deepestNode.preorder
+            if counts[i] < count_occurrences:
+                continue
             start = deepestNode.idx
             end = deepestNode.idx + deepestNode.depth
             if self._suffix_contains_terminal_symbol(start, end):
                 continue
             else:
-                start = deepestNode.idx
-                end = deepestNode.idx + deepestNode.depth
-                return self.word[start:end]
-        return b'' if self.input_type == bytes else ''
+                lrs = self._substring(start, end)
+                break
+
+        # When built online, suffixes that also occur earlier in the input
+        # are still implicit, and may end inside an edge instead of at a node.
+        n = len(self.word)
+        for (start, count) in implicit_counts:
+            if count >= count_occurrences and n - start > len(lrs):
+                lrs = self._substring(start, n)
+                break
+        return lrs
+
+    def _implicit_loci(self):
+        """Helper method that yields, for each suffix that doesn't end at a
+        leaf since the Suffix tree was built online, from longest to shortest,
+        a tuple `(start, node, child)`, where `node` is the deepest node in
+        the path of the suffix, and `child` the node below the edge where the
+        suffix ends (or None if it ends at `node`).
+
+        As in Ukkonen's algorithm, each suffix is reached from the previous
+        one by following a suffix link, then descending edges by their length.
+        """
+        word = self.word
+        n = len(word)
+        node = self.root
+        for start in range(n - self._remainder, n):
+            m = n - start
+            child = None
+            while node.depth < m:
+                child = node.transition_links[word[start + node.depth]]
+                if child.depth > m:
+                    break
+                node = child
+                child = None
+            yield (start, node, child)
+            node = node._get_suffix_link() or self.root
+
+    def _get_online_counts(self):
+        """Helper method that returns the number of occurrences of the path
+        label of each node, indexed by its `preorder` number, including those
+        in implicit suffixes of a Suffix tree built online, along with a list
+        of tuples `(start, count)` for each implicit suffix that ends inside
+        an edge, from longest to shortest."""
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        implicit = array('q', [0]) * len(lo)
+        suffixes = []
+        for (start, node, child) in self._implicit_loci():
+            implicit[node.preorder] += 1
+            if child is not None:
+                suffixes.append((start, child))
+        # Nodes are sorted by decreasing depth, so descendants come first.
+        for node in by_depth:
+            implicit[node.parent.preorder] += implicit[node.preorder]
+        counts = [h - l + c for (l, h, c) in zip(lo, hi, implicit)]
+        # Occurrences in the subtree of `child`, along with the suffix itself
+        # and longer implicit suffixes that end inside the same edge.
+        implicit_counts = []
+        on_edge = {}
+        for (start, child) in suffixes:
+            on_edge[child.preorder] = on_edge.get(child.preorder, 0) + 1
+            implicit_counts.append((start, counts[child.preorder] + on_edge[child.preorder]))
+        return (counts, implicit_counts)
+
+    def repeats(self):
+        """Returns the starting indexes of suffixes in depth-first order,
+        and an iterator of tuples `(depth, parent_depth, lo, hi)` for each
+        internal node, where `leaves[lo:hi]` are the starting indexes of the
+        node's path label (a right-maximal repeat of length `depth`)."""
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        intervals = ((node.depth, node.parent.depth, lo[node.preorder], hi[node.preorder])
+                     for node in by_depth
+                     if not node.is_leaf())
+        return (leaves, intervals)
+
+    def _substring(self, start, end):
+        """Helper method that returns the input substring at [start, end)"""
+        if self._terminals is not None:
+            end = min(end, self._next_terminal(start))
+        substring = self.word[start:end]
+        if isinstance(substring, bytearray):
+            return bytes(substring)
+        elif isinstance(substring, list):
+            return ''.join(substring)
+        return substring
 
     def _generalized_word_starts(self, xs):
         """Helper method returns the starting indexes of strings in GST"""
@@ -254,14 +515,37 @@ class STree():
             self.word_starts.append(i)
             i += len(xs[n]) + 1
 
-    def _startswith(self, edge, prefix):
-        if self.input_type == bytes and isinstance(prefix, str):
-            prefix = bytes(prefix, 'UTF8')
-        if isinstance(prefix, str):
-            regex = r'^' + prefix
-        else:
-            regex = bytes(r'^', 'UTF8') + prefix
-        return re.match(regex, edge)
+    def _symbols(self, y):
+        if self.input_type == bytes and isinstance(y, str):
+            y = bytes(y, 'UTF8')
+        return y
+
+    def _find_node(self, y):
+        """Helper method that returns the node at or below the end of the
+        path spelling y, or None if y is not a substring.
+
+        Edge labels are compared by index in the input, so each lookup takes
+        time proportional to the length of y.
+        """
+        x = self.word
+        m = len(y)
+        node = self.root
+        d = 0
+        while d < m:
+            node = node.transition_links.get(y[d])
+            if node is None:
+                return None
+            i = node.idx
+            end = min(node.depth, m)
+            if self._terminals is not None and self._next_terminal(i) < i + end:
+                # Placeholder bytes of terminal symbols never match.
+                return None
+            d += 1
+            while d < end:
+                if x[i + d] != y[d]:
+                    return None
+                d += 1
+        return node
 
     def find(self, y):
         """Returns starting position of the substring y in the string used for
@@ -271,55 +555,63 @@ class STree():
         :return: Index of the starting position of string y in the string used for building the Suffix tree
                  -1 if y is not a substring.
         """
-        node = self.root
-        while True:
-            edge = self._edgeLabel(node, node.parent)
-            if self._startswith(edge, y):
-                return node.idx
-
-            i = 0
-            while (i < len(edge) and edge[i] == y[0]):
-                y = y[1:]
-                i += 1
-
-            if i != 0:
-                if i == len(edge) and y != '':
-                    pass
-                else:
-                    return -1
-
-            node = node._get_transition_link(y[0])
-            if not node:
-                return -1
+        node = self._find_node(self._symbols(y))
+        if node is None:
+            return -1
+        return node.idx
 
     def find_all(self, y):
-        node = self.root
-        while True:
-            edge = self._edgeLabel(node, node.parent)
-            if self._startswith(edge, y):
-                break
+        y = self._symbols(y)
+        node = self._find_node(y)
+        if node is None:
+            return {}
 
-            i = 0
-            while (i < len(edge) and edge[i] == y[0]):
-                y = y[1:]
-                i += 1
-
-            if i != 0:
-                if i == len(edge) and y != '':
-                    pass
-                else:
-                    return {}
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        i = node.preorder
+        return set(leaves[lo[i]:hi[i]]) | self._find_all_implicit(y)
 
-            node = node._get_transition_link(y[0])
-            if not node:
-                return {}
+    def find_many(self, ys):
+        """Returns the starting positions of each substring in ys, as a list
+        of sets in the same order.
 
-        leaves = node._get_leaves()
-        return {n.idx for n in leaves}
+        :param ys: Iterable of Strings
+        """
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        positions = []
+        for y in ys:
+            y = self._symbols(y)
+            node = self._find_node(y)
+            if node is None:
+                positions.append(set())
+            else:
+                i = node.preorder
+                positions.append(set(leaves[lo[i]:hi[i]]) | self._find_all_implicit(y))
+        return positions
+
+    def count(self, y):
+        """Returns the number of occurrences of the substring y, including
+        overlapping ones."""
+        y = self._symbols(y)
+        node = self._find_node(y)
+        if node is None:
+            return 0
+
+        (leaves, lo, hi, by_depth) = self._get_stats()
+        i = node.preorder
+        return hi[i] - lo[i] + len(self._find_all_implicit(y))
+
+    def _find_all_implicit(self, y):
+        """Helper method that returns starting positions of y in suffixes that
+        don't end at a leaf, since the Suffix tree was built online."""
+        if not self._is_online:
+            return set()
+        n = len(self.word)
+        return {i for i in range(n - self._remainder, n)
+                if self._substring(i, i + len(y)) == y}
 
     def _edgeLabel(self, node, parent):
         """Helper method, returns the edge label between a node and it's parent"""
-        return self.word[node.idx + parent.depth: node.idx + node.depth]
+        return self._substring(node.idx + parent.depth, node.idx + node.depth)
 
     def _terminalSymbolsGenerator(self):
         """Generator of unique terminal symbols used for building the Generalized Suffix Tree.
@@ -335,11 +627,11 @@ class STree():
 
 
 class _SNode():
-    __slots__ = ['_suffix_link', 'transition_links', 'idx', 'depth', 'parent', 'generalized_idxs', 'input_type']
+    __slots__ = ['_suffix_link', 'transition_links', 'idx', 'depth', 'parent', 'generalized_idxs', 'preorder']
 
     """Class representing a Node in the Suffix tree."""
 
-    def __init__(self, idx=-1, parentNode=None, depth=-1, input_type=None):
+    def __init__(self, idx=-1, parentNode=None, depth=-1):
         # Links
         self._suffix_link = None
         self.transition_links = {}
@@ -347,8 +639,9 @@ class _SNode():
         self.idx = idx
         self.depth = depth
         self.parent = parentNode
-        self.generalized_idxs = {}
-        self.input_type = input_type
+        self.generalized_idxs = None
+        # Index in the arrays of `STree._get_stats()`.
+        self.preorder = -1
 
     def __str__(self):
         return ("SNode: idx:" + str(self.idx) + " depth:" + str(self.depth) +
@@ -364,9 +657,7 @@ class _SNode():
             return False
 
     def _get_transition_link(self, suffix):
-        if self.input_type == bytes and isinstance(suffix, str):
-            suffix = bytes(suffix, 'UTF8')
-        return False if suffix not in self.transition_links else self.transition_links[suffix]
+        return self.transition_links.get(suffix, False)
 
     def _add_transition_link(self, snode, suffix):
         self.transition_links[suffix] = snode
@@ -378,15 +669,46 @@ class _SNode():
         return len(self.transition_links) == 0
 
     def _traverse(self, f):
-        for node in self.transition_links.values():
-            node._traverse(f)
-        f(self)
+        # Nodes are pushed again to be visited after their descendants.
+        stack = [(self, False)]
+        while stack:
+            (node, is_visited) = stack.pop()
+            if is_visited:
+                f(node)
+            else:
+                stack.append((node, True))
+                stack.extend((n, False) for n in reversed(list(node.transition_links.values())))
 
     def _get_leaves(self):
         # Python <3.6 dicts don't perserve insertion order (and even after, we
         # shouldn't rely on dicts perserving the order) therefore these can be
         # out-of-order, so we return a set of leaves.
-        if self.is_leaf():
-            return {self}
-        else:
-            return {x for n in self.transition_links.values() for x in n._get_leaves()}
+        leaves = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf():
+                leaves.add(node)
+            else:
+                stack.extend(node.transition_links.values())
+        return leaves
+
+
+class _OnlineLeaf(_SNode):
+    """Leaf of a Suffix tree built online, which extends up to the end of
+    the input, as with the global end of Ukkonen's algorithm."""
+
+    __slots__ = ['_word']
+
+    def __init__(self, idx, word):
+        self._word = word
+        super().__init__(idx=idx)
+
+    @property
+    def depth(self):
+        return len(self._word) - self.idx
+
+    @depth.setter
+    def depth(self, depth):
+        # Only set by `_SNode.__init__()`, since the depth follows the input.
+        pass
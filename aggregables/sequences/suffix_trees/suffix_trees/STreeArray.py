@@ -0,0 +1,472 @@
+from array import array
+from bisect import bisect_right
+
+from .STree import STree
+
+
+class STreeArray():
+    """Class representing the suffix tree, with nodes stored in parallel
+    integer arrays instead of one object per node.
+
+    Node `0` is the root. Each node `v` is described by `idx[v]` (starting
+    index of one of the suffixes below it), `depth[v]` (string depth),
+    `parent[v]`, `slink[v]` (suffix link) and a first-child / next-sibling
+    list (`child[v]`, `sibling[v]`). The first symbol of an edge is read
+    from the text, so transitions are not stored, except for nodes with many
+    children (e.g. the root), whose children are also found in an edge
+    table: a hash table keyed by `(node, symbol)`, with open addressing over
+    integer arrays.
+
+    The input is kept as an array of integer symbols, where each terminal
+    symbol is a distinct negative integer, therefore it can never be part
+    of the input.
+    """
+
+    _check_input = STree._check_input
+
+    # Number of children after which lookups use the edge table instead of
+    # scanning the children list.
+    WIDE_NODE_DEGREE = 8
+
+    # Initial number of slots of the edge table, doubled when half full.
+    EDGE_TABLE_SIZE = 1024
+
+    def __init__(self, input=''):
+        self.input_type = None
+        self.size = 0
+        self._stats = None
+        self._generalized_masks = None
+
+        if not input == '':
+            self.build(input)
+
+    def build(self, x):
+        """Builds the Suffix tree on the given input.
+        If the input is of type List of Strings:
+        Generalized Suffix Tree is built.
+
+        :param x: String or List of Strings
+        """
+        (input_type, tree_type) = self._check_input(x)
+        self.input_type = input_type
+        if tree_type == 'st':
+            xs = [x]
+        elif tree_type == 'gst':
+            xs = x
+        self.words = xs
+        self._generalized_word_starts(xs)
+
+        n = sum(len(x) for x in xs) + len(xs)
+        typecode = 'i' if 2 * n + 2 < 2 ** 31 else 'q'
+        self.text = array(typecode)
+        for i, x in enumerate(xs):
+            if input_type == str:
+                self.text.extend(map(ord, x))
+            else:
+                self.text.extend(x)
+            self.text.append(-(i + 1))
+
+        max_nodes = 2 * n + 1
+        self.idx = array(typecode, [0]) * max_nodes
+        self.depth = array(typecode, [0]) * max_nodes
+        self.parent = array(typecode, [0]) * max_nodes
+        self.slink = array(typecode, [-1]) * max_nodes
+        self.child = array(typecode, [-1]) * max_nodes
+        self.sibling = array(typecode, [-1]) * max_nodes
+        self.degree = bytearray(max_nodes)
+        self._init_edges(self.EDGE_TABLE_SIZE)
+        self.slink[0] = 0
+        self.size = 1
+        self._stats = None
+        self._generalized_masks = None
+
+        self._build_McCreight()
+        self._link_wide_children()
+
+    def _build_McCreight(self):
+        """Builds a Suffix tree using McCreight O(n) algorithm.
+
+        Same algorithm as `STree._build_McCreight`, operating on node numbers.
+        """
+        x = self.text
+        idx = self.idx
+        depth = self.depth
+        slink = self.slink
+        u = 0
+        d = 0
+        for i in range(len(x)):
+            while depth[u] == d:
+                v = self._get_child(u, x[d + i])
+                if v < 0:
+                    break
+                u = v
+                d = d + 1
+                while d < depth[u] and x[idx[u] + d] == x[i + d]:
+                    d = d + 1
+            if d < depth[u]:
+                u = self._create_node(u, d)
+            self._create_leaf(i, u)
+            if slink[u] < 0:
+                self._compute_slink(u)
+            u = slink[u]
+            d = d - 1
+            if d < 0:
+                d = 0
+
+    def _new_node(self, i, d, p):
+        v = self.size
+        self.size += 1
+        self.idx[v] = i
+        self.depth[v] = d
+        self.parent[v] = p
+        return v
+
+    def _init_edges(self, size):
+        typecode = self.idx.typecode
+        self.edge_nodes = array(typecode, [-1]) * size
+        self.edge_symbols = array(typecode, [0]) * size
+        self.edge_children = array(typecode, [0]) * size
+        self.edge_count = 0
+
+    def _set_edge(self, u, symbol, v):
+        """Sets the child of u starting with symbol in the edge table.
+
+        Slots are probed linearly from a multiplicative hash of `(u, symbol)`
+        (inlined here and in `_get_child`, which are hot paths).
+        """
+        nodes = self.edge_nodes
+        symbols = self.edge_symbols
+        mask = len(nodes) - 1
+        h = (u * 0x9E3779B1 ^ symbol * 0x85EBCA6B) & mask
+        while True:
+            w = nodes[h]
+            if w < 0:
+                nodes[h] = u
+                symbols[h] = symbol
+                self.edge_count += 1
+                break
+            if w == u and symbols[h] == symbol:
+                break
+            h = (h + 1) & mask
+        self.edge_children[h] = v
+        if 2 * self.edge_count > len(nodes):
+            self._resize_edges(2 * len(self.edge_nodes))
+
+    def _resize_edges(self, size):
+        edges = zip(self.edge_nodes, self.edge_symbols, self.edge_children)
+        self._init_edges(size)
+        nodes = self.edge_nodes
+        symbols = self.edge_symbols
+        children = self.edge_children
+        mask = size - 1
+        count = 0
+        for (u, symbol, child) in edges:
+            if u < 0:
+                continue
+            h = (u * 0x9E3779B1 ^ symbol * 0x85EBCA6B) & mask
+            while nodes[h] >= 0:
+                h = (h + 1) & mask
+            nodes[h] = u
+            symbols[h] = symbol
+            children[h] = child
+            count += 1
+        self.edge_count = count
+
+    def _is_wide(self, u):
+        return self.degree[u] > self.WIDE_NODE_DEGREE
+
+    def _link_wide_children(self):
+        """Children of wide nodes are only found in the edge table while
+        building, so that splitting their edges does not scan their children
+        list. Lists are rebuilt once built."""
+        degree = self.degree
+        child = self.child
+        sibling = self.sibling
+        wide_degree = self.WIDE_NODE_DEGREE
+        for u in range(self.size):
+            if degree[u] > wide_degree:
+                child[u] = -1
+        for (w, p) in enumerate(self.parent[1:self.size], 1):
+            if degree[p] > wide_degree:
+                sibling[w] = child[p]
+                child[p] = w
+
+    def _get_child(self, u, symbol):
+        if self.degree[u] > self.WIDE_NODE_DEGREE:
+            nodes = self.edge_nodes
+            mask = len(nodes) - 1
+            h = (u * 0x9E3779B1 ^ symbol * 0x85EBCA6B) & mask
+            while True:
+                w = nodes[h]
+                if w == u and self.edge_symbols[h] == symbol:
+                    return self.edge_children[h]
+                if w < 0:
+                    return -1
+                h = (h + 1) & mask
+        x = self.text
+        idx = self.idx
+        sibling = self.sibling
+        d = self.depth[u]
+        v = self.child[u]
+        while v >= 0:
+            if x[idx[v] + d] == symbol:
+                return v
+            v = sibling[v]
+        return -1
+
+    def _create_node(self, u, d):
+        p = self.parent[u]
+        v = self._new_node(self.idx[u], d, p)
+        self.child[v] = u
+        self.parent[u] = v
+        self.degree[v] = 1
+        if self._is_wide(p):
+            self._set_edge(p, self.text[self.idx[u] + self.depth[p]], v)
+            self.sibling[u] = -1
+            return v
+        # Replace u by v in the children list of p.
+        w = self.child[p]
+        if w == u:
+            self.child[p] = v
+        else:
+            while self.sibling[w] != u:
+                w = self.sibling[w]
+            self.sibling[w] = v
+        self.sibling[v] = self.sibling[u]
+        self.sibling[u] = -1
+        return v
+
+    def _create_leaf(self, i, u):
+        w = self._new_node(i, len(self.text) - i, u)
+        degree = self.degree[u]
+        if degree > self.WIDE_NODE_DEGREE:
+            self._set_edge(u, self.text[i + self.depth[u]], w)
+            return w
+        self.sibling[w] = self.child[u]
+        self.child[u] = w
+        self.degree[u] = degree + 1
+        if degree == self.WIDE_NODE_DEGREE:
+            for v in self._children(u):
+                self._set_edge(u, self.text[self.idx[v] + self.depth[u]], v)
+        return w
+
+    def _compute_slink(self, u):
+        x = self.text
+        d = self.depth[u]
+        v = self.slink[self.parent[u]]
+        while self.depth[v] < d - 1:
+            v = self._get_child(v, x[self.idx[u] + self.depth[v] + 1])
+        if self.depth[v] > d - 1:
+            v = self._create_node(v, d - 1)
+        self.slink[u] = v
+
+    def _generalized_word_starts(self, xs):
+        """Helper method returns the starting indexes of strings in GST"""
+        self.word_starts = []
+        i = 0
+        for n in range(len(xs)):
+            self.word_starts.append(i)
+            i += len(xs[n]) + 1
+
+    def _get_word_start_index(self, idx):
+        """Helper method that returns the index of the string based on
+        the starting index of a suffix"""
+        return bisect_right(self.word_starts, idx) - 1
+
+    def _substring(self, start, end):
+        """Helper method that returns the input substring at [start, end),
+        which must not contain a terminal symbol."""
+        i = self._get_word_start_index(start)
+        offset = self.word_starts[i]
+        return self.words[i][start - offset:end - offset]
+
+    def _empty(self):
+        return b'' if self.input_type == bytes else ''
+
+    def is_leaf(self, v):
+        return self.child[v] < 0
+
+    def _children(self, v):
+        children = []
+        w = self.child[v]
+        while w >= 0:
+            children.append(w)
+            w = self.sibling[w]
+        return children
+
+    def _preorder(self):
+        """Returns an array of nodes in depth-first pre-order, built without
+        recursion."""
+        child = self.child
+        sibling = self.sibling
+        nodes = array(self.idx.typecode)
+        stack = array(self.idx.typecode, [0])
+        while stack:
+            v = stack.pop()
+            nodes.append(v)
+            w = child[v]
+            while w >= 0:
+                stack.append(w)
+                w = sibling[w]
+        return nodes
+
+    def _get_stats(self):
+        """Computes once, for each node, the range [lo, hi) of its leaves in
+        the array of suffix starting indexes sorted in depth-first order."""
+        if self._stats is not None:
+            return self._stats
+
+        typecode = self.idx.typecode
+        leaves = array(typecode)
+        lo = array(typecode, [0]) * self.size
+        hi = array(typecode, [0]) * self.size
+        nodes = self._preorder()
+        for v in nodes:
+            lo[v] = len(leaves)
+            if self.child[v] < 0:
+                leaves.append(self.idx[v])
+                hi[v] = lo[v] + 1
+        # Leaves of a node end with the leaves of its last child in pre-order.
+        parent = self.parent
+        for v in reversed(nodes[1:]):
+            if hi[v] > hi[parent[v]]:
+                hi[parent[v]] = hi[v]
+        self._stats = (leaves, lo, hi)
+        return self._stats
+
+    def _get_generalized_masks(self):
+        """Labels nodes with the bitset of indexes of strings found in
+        their descendants."""
+        if self._generalized_masks is not None:
+            return self._generalized_masks
+
+        masks = [0] * self.size
+        parent = self.parent
+        nodes = self._preorder()
+        for v in reversed(nodes):
+            if self.child[v] < 0:
+                masks[v] = 1 << self._get_word_start_index(self.idx[v])
+            if v != 0:
+                masks[parent[v]] |= masks[v]
+        self._generalized_masks = masks
+        return masks
+
+    def lcs(self, stringIdxs=-1):
+        """Returns the Largest Common Substring of Strings provided in stringIdxs.
+        If stringIdxs is not provided, the LCS of all strings is returned.
+
+        ::param stringIdxs: Optional: List of indexes of strings.
+        """
+        if stringIdxs == -1 or not isinstance(stringIdxs, list):
+            stringIdxs = range(len(self.word_starts))
+        required = 0
+        for i in stringIdxs:
+            required |= 1 << i
+
+        masks = self._get_generalized_masks()
+        deepest = 0
+        for v in range(1, self.size):
+            if self.child[v] >= 0 and \
+                    self.depth[v] > self.depth[deepest] and \
+                    masks[v] & required == required:
+                deepest = v
+        if deepest == 0:
+            return self._empty()
+        return self._substring(self.idx[deepest], self.idx[deepest] + self.depth[deepest])
+
+    def lcs_k(self, k):
+        """Returns the Largest Common Substring of at least k of the Strings
+        used for building the Generalized Suffix tree."""
+        masks = self._get_generalized_masks()
+        (lcs_start, lcs_length) = (0, 0)
+        for v in range(1, self.size):
+            length = self.depth[v]
+            if length <= lcs_length or bin(masks[v]).count('1') < k:
+                continue
+            if self.child[v] < 0:
+                # Labels of leaves are cut at the terminal symbol of their string.
+                i = self._get_word_start_index(self.idx[v])
+                length = min(length, self.word_starts[i] + len(self.words[i]) - self.idx[v])
+            if length > lcs_length:
+                (lcs_start, lcs_length) = (self.idx[v], length)
+        if lcs_length == 0:
+            return self._empty()
+        return self._substring(lcs_start, lcs_start + lcs_length)
+
+    def lrs(self, count_occurrences=2):
+        """Returns the Longest Repeated Substring, occurring at least
+        `count_occurrences` times.
+
+        Leaves are never candidates, since their label ends with a terminal symbol.
+        """
+        (leaves, lo, hi) = self._get_stats()
+        deepest = 0
+        for v in range(1, self.size):
+            if self.child[v] >= 0 and \
+                    self.depth[v] > self.depth[deepest] and \
+                    hi[v] - lo[v] >= count_occurrences:
+                deepest = v
+        if deepest == 0:
+            return self._empty()
+        return self._substring(self.idx[deepest], self.idx[deepest] + self.depth[deepest])
+
+    def repeats(self):
+        """Returns the starting indexes of suffixes in depth-first order,
+        and an iterator of tuples `(depth, parent_depth, lo, hi)` for each
+        internal node, where `leaves[lo:hi]` are the starting indexes of the
+        node's path label (a right-maximal repeat of length `depth`)."""
+        (leaves, lo, hi) = self._get_stats()
+        depth = self.depth
+        parent = self.parent
+        intervals = ((depth[v], depth[parent[v]], lo[v], hi[v])
+                     for v in range(1, self.size)
+                     if self.child[v] >= 0)
+        return (leaves, intervals)
+
+    def _symbols(self, y):
+        if self.input_type == bytes and isinstance(y, str):
+            y = bytes(y, 'UTF8')
+        if isinstance(y, str):
+            return [ord(c) for c in y]
+        return y
+
+    def _find_node(self, y):
+        """Returns the node at or below the end of the path spelling y,
+        or -1 if y is not a substring."""
+        y = self._symbols(y)
+        x = self.text
+        m = len(y)
+        node = 0
+        d = 0
+        while d < m:
+            node = self._get_child(node, y[d])
+            if node < 0:
+                return -1
+            i = self.idx[node]
+            end = min(self.depth[node], m)
+            d += 1
+            while d < end:
+                if x[i + d] != y[d]:
+                    return -1
+                d += 1
+        return node
+
+    def find(self, y):
+        """Returns starting position of the substring y in the string used for
+        building the Suffix tree.
+
+        :param y: String
+        :return: Index of the starting position of string y in the string used for building the Suffix tree
+                 -1 if y is not a substring.
+        """
+        node = self._find_node(y)
+        if node < 0:
+            return -1
+        return self.idx[node]
+
+    def find_all(self, y):
+        node = self._find_node(y)
+        if node < 0:
+            return {}
+        (leaves, lo, hi) = self._get_stats()
+        return set(leaves[lo[node]:hi[node]])
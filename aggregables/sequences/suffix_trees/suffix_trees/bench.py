@@ -0,0 +1,252 @@
+"""
+Measures build time, query latency and peak memory of STree over
+reproducible synthetic corpora, and compares them against a stored baseline,
+each in a new process (see `suffix_trees.isolated`). Measurements that time
+out or fail (e.g. when running out of memory) are reported as regressions.
+
+Usage:
+    python -m suffix_trees.bench --sizes 0.1 0.5
+    python -m suffix_trees.bench --save
+"""
+
+from . import isolated
+from .STree import STree
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bench_baseline.json")
+
+# Number of fragments of the Generalized Suffix tree used for lcs.
+LCS_FRAGMENTS = 4
+
+# Number of patterns searched with find and find_all.
+FIND_PATTERNS = 1000
+
+# Keys that must be equal to the baseline, otherwise results changed.
+RESULT_KEYS = ["lrs_len", "lcs_len", "find_hits", "find_all_count"]
+
+# Keys that must not exceed the baseline by more than the tolerance.
+COST_KEYS = ["build_s", "lrs_s", "lcs_s", "find_ms", "find_all_ms", "peak_rss_mb"]
+
+
+def random_corpus(rng, size):
+    return rng.randbytes(size)
+
+
+def log_corpus(rng, size):
+    """Low entropy lines, where only a few fields vary."""
+    users = [f"user{i}".encode() for i in range(8)]
+    actions = [b"login", b"logout", b"GET /index.html", b"POST /api/v1/items"]
+    corpus = bytearray()
+    t = 0
+    while len(corpus) < size:
+        t += rng.randint(0, 3)
+        corpus += b"2020-08-06 %02d:%02d:%02d INFO %s %s status=%d\n" % (
+            t // 3600 % 24,
+            t // 60 % 60,
+            t % 60,
+            rng.choice(users),
+            rng.choice(actions),
+            rng.choice([200, 200, 200, 302, 404]),
+        )
+    return bytes(corpus[:size])
+
+
+def trace_corpus(rng, size):
+    """Instruction trace, where basic blocks are repeated, sometimes in loops."""
+    mnemonics = [b"mov", b"add", b"sub", b"cmp", b"jne", b"call", b"push", b"pop"]
+    registers = [b"eax", b"ebx", b"ecx", b"edx", b"esi", b"edi"]
+    blocks = []
+    for _ in range(32):
+        address = rng.randrange(0x401000, 0x480000, 16)
+        block = bytearray()
+        for i in range(rng.randint(2, 12)):
+            block += b"0x%x: %s %s, %s\n" % (
+                address + 4 * i,
+                rng.choice(mnemonics),
+                rng.choice(registers),
+                rng.choice(registers),
+            )
+        blocks.append(bytes(block))
+    corpus = bytearray()
+    while len(corpus) < size:
+        corpus += rng.choice(blocks) * rng.choice([1, 1, 1, 2, 8])
+    return bytes(corpus[:size])
+
+
+def zeros_corpus(rng, size):
+    """Long zero runs (e.g. padding in binaries) between random bytes."""
+    corpus = bytearray()
+    while len(corpus) < size:
+        corpus += rng.randbytes(rng.randint(1, 256))
+        corpus += b"\x00" * rng.randint(256, 65536)
+    return bytes(corpus[:size])
+
+
+CORPORA = {
+    "random": random_corpus,
+    "log": log_corpus,
+    "trace": trace_corpus,
+    "zeros": zeros_corpus,
+}
+
+
+def generate_corpus(corpus, size, seed=0):
+    return CORPORA[corpus](random.Random(seed), size)
+
+
+def generate_patterns(rng, content, count):
+    """Substrings of the corpus, and as many that are likely absent."""
+    patterns = []
+    for _ in range(count // 2):
+        length = rng.randint(4, 32)
+        start = rng.randint(0, max(len(content) - length, 0))
+        patterns.append(content[start : start + length])
+    for _ in range(count - len(patterns)):
+        patterns.append(rng.randbytes(rng.randint(4, 32)))
+    return patterns
+
+
+def measure(corpus, size):
+    content = generate_corpus(corpus, size)
+    patterns = generate_patterns(random.Random(1), content, FIND_PATTERNS)
+    fragment_size = len(content) // LCS_FRAGMENTS + 1
+    fragments = [
+        content[i : i + fragment_size] for i in range(0, len(content), fragment_size)
+    ]
+
+    start = time.perf_counter()
+    st = STree(content)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lrs = st.lrs()
+    lrs_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    find_hits = sum(st.find(y) >= 0 for y in patterns)
+    find_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    find_all_count = sum(len(st.find_all(y)) for y in patterns)
+    find_all_time = time.perf_counter() - start
+
+    del st
+    gst = STree(fragments)
+    start = time.perf_counter()
+    lcs = gst.lcs()
+    lcs_time = time.perf_counter() - start
+
+    return {
+        "corpus": corpus,
+        "size_mb": size / 2 ** 20,
+        "lrs_len": len(lrs),
+        "lcs_len": len(lcs),
+        "find_hits": find_hits,
+        "find_all_count": find_all_count,
+        "build_s": round(build_time, 3),
+        "lrs_s": round(lrs_time, 3),
+        "lcs_s": round(lcs_time, 3),
+        "find_ms": round(find_time * 1000 / len(patterns), 3),
+        "find_all_ms": round(find_all_time * 1000 / len(patterns), 3),
+        "peak_rss_mb": isolated.peak_rss_mb(),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Returns the differences of a result with its baseline."""
+    differences = []
+    for key in RESULT_KEYS:
+        if result[key] != baseline[key]:
+            differences.append(f"{key} changed: {baseline[key]} -> {result[key]}")
+    for key in COST_KEYS:
+        # Small absolute values are dominated by noise.
+        limit = max(baseline[key] * tolerance, baseline[key] + 0.05)
+        if result[key] > limit:
+            differences.append(f"{key} regressed: {baseline[key]} -> {result[key]}")
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--corpora",
+        nargs="+",
+        default=list(CORPORA.keys()),
+        choices=CORPORA.keys(),
+        help="corpora to measure",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        type=float,
+        default=[0.1, 0.5],
+        help="input sizes in MB",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        default=BASELINE,
+        help="JSON file with results to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="ratio over the baseline after which times and memory are reported as regressions",
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="store results as the new baseline, instead of comparing against it",
+    )
+    isolated.add_arguments(parser, 2)
+    parsed_args = parser.parse_args()
+    isolated.run_if_requested(
+        parsed_args, lambda corpus, size: measure(corpus, int(size))
+    )
+
+    baselines = {}
+    if not parsed_args.save and os.path.exists(parsed_args.baseline):
+        with open(parsed_args.baseline) as f:
+            baselines = json.load(f)
+
+    results = {}
+    regressions = 0
+    print(
+        f"{'corpus':<8} {'size (MB)':>10} {'build (s)':>10} {'lrs (s)':>8} {'lcs (s)':>8} "
+        f"{'find (ms)':>10} {'find_all (ms)':>14} {'peak RSS (MB)':>14}"
+    )
+    for size in parsed_args.sizes:
+        for corpus in parsed_args.corpora:
+            key = f"{corpus}:{size}"
+            (result, error) = isolated.measure_isolated(
+                __spec__.name, [corpus, int(size * 2 ** 20)], parsed_args.timeout
+            )
+            if error is not None:
+                print(f"{corpus:<8} {size:>10} {error:>10}")
+                regressions += 1
+                continue
+            results[key] = result
+            print(
+                f"{corpus:<8} {size:>10} {result['build_s']:>10} {result['lrs_s']:>8} "
+                f"{result['lcs_s']:>8} {result['find_ms']:>10} {result['find_all_ms']:>14} "
+                f"{result['peak_rss_mb']:>14}"
+            )
+            if key in baselines:
+                for difference in compare(result, baselines[key], parsed_args.tolerance):
+                    print(f"  {difference}")
+                    regressions += 1
+
+    if parsed_args.save and regressions == 0:
+        with open(parsed_args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif regressions > 0:
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+Benchmark scaffolding shared by `suffix_trees.bench` and
+`aggregables.sequences.bench_lrs_engines`.
+
+Each measurement runs in a new process, so that peak RSS only accounts for
+the measured index: the benchmark runs itself as `python -m MODULE --run
+ARGS...`, and the measurement is printed as JSON.
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+
+def add_arguments(parser, run_args, timeout=3600):
+    """Adds the timeout option, and the hidden option with the `run_args`
+    arguments of a single measurement."""
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=int,
+        default=timeout,
+        help="seconds after which a measurement is reported as failed",
+    )
+    parser.add_argument("--run", nargs=run_args, help=argparse.SUPPRESS)
+
+
+def run_if_requested(parsed_args, measure):
+    """When run for a single measurement, prints `measure(*args)` as JSON
+    and exits."""
+    if parsed_args.run:
+        print(json.dumps(measure(*parsed_args.run)))
+        sys.exit(0)
+
+
+def measure_isolated(module, args, timeout):
+    """Returns a tuple `(result, error)`, where `result` is the measurement
+    of a new process running the module with the given arguments, or `None`
+    with a short description of the error (e.g. a timeout, or being killed
+    when running out of memory)."""
+    try:
+        output = subprocess.run(
+            [sys.executable, "-m", module, "--run"] + [str(x) for x in args],
+            capture_output=True,
+            check=True,
+            timeout=timeout,
+        ).stdout
+    except subprocess.TimeoutExpired:
+        return (None, "timeout")
+    except subprocess.CalledProcessError as e:
+        return (None, f"failed ({e.returncode})")
+    return (json.loads(output), None)
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
@@ -0,0 +1,75 @@
+from suffix_trees import STree, STreeArray
+import random
+
+
+def test_lcs():
+    a = ["abeceda", "abecednik", "abeabecedabeabeced",
+         "abecedaaaa", "aaabbbeeecceeeddaaaaabeceda"]
+    st = STreeArray.STreeArray(a)
+    assert st.lcs() == "abeced", "LCS test"
+
+
+def test_missing():
+    text = "name language w en url http w namelanguage en url http"
+    stree = STreeArray.STreeArray(text)
+    assert stree.find("law") == -1
+    assert stree.find("ptth") == -1
+    assert stree.find("name language w en url http w namelanguage en url httpp") == -1
+
+
+def test_find():
+    st = STreeArray.STreeArray("abcdefghab")
+    assert st.find("abc") == 0
+    assert st.find_all("ab") == {0, 8}
+    st = STreeArray.STreeArray(b"abc\x00defghab")
+    assert st.find(b"def") == 4
+    assert st.find_all(b"ab") == {0, 9}
+
+
+def test_same_as_stree():
+    random.seed(42)
+    for _ in range(50):
+        x = bytes(random.getrandbits(3) for _ in range(random.randint(1, 300)))
+        st = STree.STree(x)
+        sta = STreeArray.STreeArray(x)
+        for k in range(2, 5):
+            assert len(st.lrs(k)) == len(sta.lrs(k))
+        for i in range(len(x)):
+            y = x[i:i + 3]
+            assert sta.find(y) == x.find(y)
+            assert sta.find_all(y) == st.find_all(y)
+
+
+def test_wide_nodes():
+    random.seed(42)
+    x = bytes(random.getrandbits(8) for _ in range(5000))
+    st = STreeArray.STreeArray(x)
+    for i in range(0, len(x), 7):
+        y = x[i:i + 2]
+        assert st.find_all(y) == {j for j in range(len(x)) if x.startswith(y, j)}
+
+
+def test_repeats_same_as_stree():
+    random.seed(42)
+    for _ in range(20):
+        # 8-bit symbols give wide nodes, found in the edge table.
+        bits = random.choice([2, 8])
+        x = bytes(random.getrandbits(bits) for _ in range(random.randint(1, 2000)))
+        results = []
+        for st in [STree.STree(x), STreeArray.STreeArray(x)]:
+            (leaves, intervals) = st.repeats()
+            results.append(sorted(
+                (depth, parent_depth, sorted(leaves[lo:hi]))
+                for depth, parent_depth, lo, hi in intervals))
+        assert results[0] == results[1]
+
+
+def test_lcs_k():
+    a = ["xabcdy", "zabcdw", "qbcdr", "abq"]
+    st = STreeArray.STreeArray(a)
+    assert st.lcs_k(2) == "abcd"
+    assert st.lcs_k(3) == "bcd"
+    assert st.lcs_k(4) == "b"
+    assert st.lcs_k(1) == "xabcdy"
+    st = STreeArray.STreeArray([b"ab", b"b", b"abcd"])
+    assert st.lcs_k(1) == b"abcd"
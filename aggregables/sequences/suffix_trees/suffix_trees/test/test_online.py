@@ -0,0 +1,78 @@
+import random
+
+from suffix_trees import STree
+
+
+def test_append():
+    st = STree.STree()
+    st.append("abcd")
+    st.append("efghab")
+    assert st.find("abc") == 0
+    assert st.find("cde") == 2
+    assert st.find("ba") == -1
+    assert st.find_all("ab") == {0, 8}
+
+
+def test_lrs_implicit_suffix():
+    st = STree.STree()
+    for chunk in [b"xabc", b"yab", b"c"]:
+        st.append(chunk)
+    # "abc" is still an implicit suffix, not ending at a leaf.
+    assert st.lrs() == b"abc"
+    st.append(b"z")
+    assert st.lrs() == b"abc"
+    assert st.find_all(b"abc") == {1, 5}
+
+
+def test_same_as_McCreight():
+    text = "mississippi" * 3
+    st = STree.STree()
+    for i in range(0, len(text), 4):
+        st.append(text[i:i + 4])
+    st.append("$")
+    mc = STree.STree(text)
+    assert st.lrs() == mc.lrs()
+    for i in range(len(text)):
+        assert st.find_all(text[i:i + 3]) == mc.find_all(text[i:i + 3])
+
+
+def test_lrs_k_implicit_suffix():
+    st = STree.STree()
+    st.append(b"abacbb")
+    # The third "b" is an implicit suffix.
+    assert st.lrs(3) == b"b"
+
+
+def test_lrs_k_same_as_McCreight():
+    rng = random.Random(0)
+    for _ in range(200):
+        text = bytes(rng.choice(b"ab") for _ in range(rng.randint(1, 40)))
+        st = STree.STree()
+        i = 0
+        while i < len(text):
+            j = i + rng.randint(1, 5)
+            st.append(text[i:j])
+            i = j
+        mc = STree.STree(text)
+        for k in range(2, 6):
+            lrs = st.lrs(k)
+            assert len(lrs) == len(mc.lrs(k))
+            if lrs:
+                assert mc.count(lrs) >= k
+
+
+def test_lrs_after_each_append():
+    rng = random.Random(0)
+    for _ in range(100):
+        st = STree.STree()
+        text = b""
+        for _ in range(rng.randint(1, 10)):
+            chunk = bytes(rng.choice(b"abc") for _ in range(rng.randint(1, 6)))
+            st.append(chunk)
+            text += chunk
+            # Leaves extend up to the end of the input.
+            assert st.find_all(text[-2:]) == STree.STree(text).find_all(text[-2:])
+            lrs = st.lrs()
+            assert len(lrs) == len(STree.STree(text).lrs())
+            if lrs:
+                assert STree.STree(text).count(lrs) >= 2
@@ -20,3 +20,53 @@ def test_find():
     st = STree.STree("abcdefghab")
     assert st.find("abc") == 0
     assert st.find_all("ab") == {0, 8}
+
+
+def test_count():
+    st = STree.STree("abcabcab")
+    assert st.count("ab") == 3
+    assert st.count("abca") == 2
+    assert st.count("x") == 0
+    assert st.lrs(3) == "ab"
+
+
+def test_deep_tree():
+    x = b"\x00" * 5000
+    st = STree.STree(x)
+    assert st.lrs() == x[1:]
+    assert st.lrs(100) == x[99:]
+    assert st.count(b"\x00" * 10) == len(x) - 9
+    assert len(st.find_all(b"\x00" * 4990)) == 11
+
+
+def test_bytes_terminals():
+    st = STree.STree([b"xxab\xee\x80", b"ab\xee\x80yy", b"\x00ab"])
+    assert st.lcs() == b"ab"
+    assert st.lcs([0, 1]) == b"ab\xee\x80"
+    assert st.lrs() == b"ab\xee\x80"
+    assert st.find(b"ab\x00") == -1
+    assert st.find_all(b"ab") == {2, 7, 15}
+
+
+def test_find_many():
+    st = STree.STree(b"a.b*a.b(a")
+    assert st.find(b"a.b(") == 4
+    assert st.find(b"a.c") == -1
+    assert st.find_many([b"a.b", b"(a", b"*", b"a.ba", b"a.b(a\x00"]) == \
+        [{0, 4}, {7}, {3}, set(), set()]
+
+
+def test_lcs_k():
+    a = ["xabcdy", "zabcdw", "qbcdr", "abq"]
+    st = STree.STree(a)
+    assert st.lcs_k(2) == "abcd"
+    assert st.lcs_k(3) == "bcd"
+    assert st.lcs_k(4) == "b"
+    assert st.lcs_k(5) == ""
+    assert st.lcs_k(1) == "xabcdy"
+    st = STree.STree([x.encode() for x in a])
+    assert st.lcs_k(3) == b"bcd"
+    assert st.lcs_k(1) == b"xabcdy"
+    assert st.lcs([0, 3]) == b"ab"
+    st = STree.STree(["ab", "b", "abcd"])
+    assert st.lcs_k(1) == "abcd"
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+
+from hexmatch import (
+    Disassembler,
+    file_results,
+    index_based_pattern,
+    iter_matches,
+    match,
+    match_index_based,
+    match_ranges,
+    match_variants,
+    matched_variant,
+    needle_ranges,
+    needle_variants,
+    search_files,
+)
+import argparse
+import hexmatch
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+
+def make_options(**kwargs):
+    options = {
+        "count": False,
+        "index": False,
+        "index_based": False,
+        "ngram_index": False,
+        "regex": False,
+        "tree": False,
+    }
+    options.update(kwargs)
+    return argparse.Namespace(**options)
+
+
+def flatten(blocks):
+    return [match for matches in blocks for match in matches]
+
+
+def scan(data, variants, is_regex=False):
+    """Returns matches of each variant with the plain scan, as `iter_matches()`
+    would yield them."""
+    matches = [
+        (start, n, data[start:end])
+        for n, (_, _, needle) in enumerate(variants)
+        for start, end in match(data, needle, is_regex)
+    ]
+    return sorted(matches, key=lambda x: x[:2])
+
+
+def scan_index_based(data, pattern):
+    """Returns offsets where each byte differs from the first symbol's byte as
+    much as its alphabet index does, and padding bytes are null."""
+    symbols = [(j, x) for j, x in enumerate(pattern) if x is not None]
+    (j0, x0) = symbols[0]
+    return [
+        (i, i + len(pattern))
+        for i in range(len(data) - len(pattern) + 1)
+        if all(data[i + j] - data[i + j0] == x - x0 for j, x in symbols)
+        and all(data[i + j] == 0 for j, x in enumerate(pattern) if x is None)
+    ]
+
+
+def random_content(rng, size, alphabet=b"ab\x00c"):
+    return bytes(rng.choice(alphabet) for _ in range(size))
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write(self, name, content):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, "wb") as f:
+            f.write(content)
+        return filename
+
+    def test_match_variants(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            data = random_content(rng, 200)
+            # Needles sharing prefixes, of different lengths, some repeated.
+            needles = [random_content(rng, rng.randint(1, 4)) for _ in range(6)]
+            needles.append(needles[0])
+            self.assertListEqual(
+                match_variants(data, needles),
+                [match(data, needle, False) for needle in needles],
+            )
+
+    def test_match_variants_special_bytes(self):
+        data = b"a.b*c(d)a\\x00a.b*"
+        needles = [b".", b"a.b*", b"*c(", b"\\", b"(d)"]
+        self.assertListEqual(
+            match_variants(data, needles),
+            [match(data, needle, False) for needle in needles],
+        )
+
+    def test_read_blocks(self):
+        rng = random.Random(0)
+        content = random_content(rng, 1000)
+        filename = self.write("f", content)
+        variants = [
+            (0, "be", b"abca"),
+            (0, "be", b"a\x00"),
+            (0, "be", b"c"),
+            (0, "be", b"aaaaa"),
+        ]
+        expected = scan(content, variants)
+        options = make_options()
+        # Blocks shorter than needles, so that matches straddle them.
+        for block_size in [1, 3, 7, 64, 4096]:
+            with unittest.mock.patch.object(hexmatch, "BLOCK_SIZE", block_size):
+                self.assertListEqual(flatten(file_results(filename, variants, options)), expected)
+                with unittest.mock.patch.object(
+                    sys, "stdin", io.TextIOWrapper(io.BytesIO(content))
+                ):
+                    self.assertListEqual(flatten(file_results("-", variants, options)), expected)
+                # Non-overlapping matches of the same needle, across blocks.
+                with unittest.mock.patch.object(
+                    sys, "stdin", io.TextIOWrapper(io.BytesIO(b"a" * 23))
+                ):
+                    self.assertListEqual(
+                        flatten(file_results("-", [(0, "be", b"aaaaa")], options)),
+                        scan(b"a" * 23, [(0, "be", b"aaaaa")]),
+                    )
+
+    def test_read_blocks_empty(self):
+        filename = self.write("f", b"")
+        variants = [(0, "be", b"ab")]
+        self.assertListEqual(flatten(file_results(filename, variants, make_options())), [])
+
+    def test_match_index_based(self):
+        rng = random.Random(0)
+        data = random_content(rng, 2000, b"\x00\x01\x02\x03ABCD")
+        for needle in ["ACDC", "AB", "DA", "BBB"]:
+            for padding in range(3):
+                for e in ["be", "le"]:
+                    pattern = index_based_pattern(needle, padding, e)
+                    expected = scan_index_based(data, pattern)
+                    self.assertListEqual(match_index_based(data, pattern), expected)
+                    with unittest.mock.patch.object(hexmatch, "np", None):
+                        self.assertListEqual(match_index_based(data, pattern), expected)
+        self.assertGreater(len(scan_index_based(data, index_based_pattern("AB"))), 0)
+
+    def test_match_index_based_file(self):
+        rng = random.Random(0)
+        # With padded matches in both endianness.
+        content = b"\x00\x01\x00\x02\x00\x01".join(
+            random_content(rng, 100, b"\x00\x01\x02ABC") for _ in range(10)
+        )
+        content += b"B\x00C\x00B\x00"
+        filename = self.write("f", content)
+        variants = [
+            (0, e, index_based_pattern("ABA", p, e))
+            for e in ["be", "le"]
+            for p in range(2)
+        ]
+        expected = [
+            (start, n, content[start:end])
+            for n, (_, _, pattern) in enumerate(variants)
+            for start, end in scan_index_based(content, pattern)
+        ]
+        expected.sort(key=lambda x: x[:2])
+        self.assertSetEqual({n for _, n, _ in expected}, {0, 1, 2, 3})
+        options = make_options(index_based=True)
+        self.assertListEqual(flatten(file_results(filename, variants, options)), expected)
+        with unittest.mock.patch.object(hexmatch, "np", None):
+            self.assertListEqual(flatten(file_results(filename, variants, options)), expected)
+
+    def test_disassemble_r2pipe(self):
+        r2p = unittest.mock.Mock()
+        # `pad` output ends with an extra newline, unlike `rasm2`.
+        r2p.cmd.side_effect = lambda command: {
+            "pad 9090": "nop\nnop\n\n",
+            "pad c3": "ret\n",
+        }.get(command, "")
+        cache_filename = os.path.join(self.tmp_dir.name, "cache", "disassembly")
+        with unittest.mock.patch.object(hexmatch, "r2pipe") as r2pipe:
+            r2pipe.open.return_value = r2p
+            disassembler = Disassembler(["x86"], cache_filename)
+            disassembly = disassembler.disassemble(
+                [b"\x90\x90", b"\xc3", b"\x90\x90"]
+            )
+            disassembler.close()
+            self.assertDictEqual(
+                disassembly,
+                {("x86", b"\x90\x90"): "nop\nnop\n", ("x86", b"\xc3"): "ret\n"},
+            )
+            # Distinct bytes are disassembled once, by the same process.
+            r2pipe.open.assert_called_once_with("-")
+            self.assertListEqual(
+                [x.args[0] for x in r2p.cmd.call_args_list],
+                ["e asm.arch=x86", "pad 9090", "pad c3"],
+            )
+            r2p.quit.assert_called_once_with()
+
+            # Cached across runs.
+            r2p.cmd.reset_mock()
+            disassembler = Disassembler(["x86"], cache_filename)
+            self.assertDictEqual(
+                disassembler.disassemble([b"\x90\x90", b"\xc3"]), disassembly
+            )
+            disassembler.close()
+            r2p.cmd.assert_not_called()
+
+    def test_disassemble_bits(self):
+        r2p = unittest.mock.Mock()
+        r2p.cmd.return_value = "nop\n"
+        cache_filename = os.path.join(self.tmp_dir.name, "cache", "disassembly")
+        with unittest.mock.patch.object(hexmatch, "r2pipe") as r2pipe:
+            r2pipe.open.return_value = r2p
+            disassembler = Disassembler(["x86"], cache_filename, bits=16)
+            disassembler.disassemble([b"\x90"])
+            disassembler.close()
+            self.assertListEqual(
+                [x.args[0] for x in r2p.cmd.call_args_list],
+                ["e asm.arch=x86", "e asm.bits=16", "pad 90"],
+            )
+
+            # Not cached with the default bits.
+            r2p.cmd.reset_mock()
+            disassembler = Disassembler(["x86"], cache_filename)
+            disassembler.disassemble([b"\x90"])
+            disassembler.close()
+            self.assertListEqual(
+                [x.args[0] for x in r2p.cmd.call_args_list],
+                ["e asm.arch=x86", "pad 90"],
+            )
+
+    def test_disassemble_script(self):
+        delimiter = hexmatch.DISASSEMBLY_DELIMITER
+
+        def check_output(args, **kwargs):
+            with open(args[args.index("-i") + 1]) as f:
+                script = f.read()
+            self.assertEqual(
+                script, f"pad 9090\n?e {delimiter}\npad c3\n?e {delimiter}\n"
+            )
+            return f"nop\nnop\n\n{delimiter}\nret\n{delimiter}\n".encode()
+
+        with unittest.mock.patch.object(
+            hexmatch, "r2pipe", None
+        ), unittest.mock.patch.object(
+            hexmatch.subprocess, "check_output", side_effect=check_output
+        ) as run:
+            disassembler = Disassembler(["x86"], None, bits=32)
+            disassembly = disassembler.disassemble(
+                [b"\x90\x90", b"\xc3", b"\x90\x90"]
+            )
+            disassembler.close()
+        self.assertDictEqual(
+            disassembly,
+            {("x86", b"\x90\x90"): "nop\nnop\n", ("x86", b"\xc3"): "ret\n"},
+        )
+        # A single process for all byte strings.
+        run.assert_called_once()
+        self.assertListEqual(
+            run.call_args.args[0][:7],
+            ["radare2", "-N", "-q", "-a", "x86", "-b", "32"],
+        )
+
+    @unittest.skipUnless(
+        shutil.which("radare2") and shutil.which("rasm2"), "requires radare2"
+    )
+    def test_disassemble_same_as_rasm2(self):
+        matches = [b"\x90\x90", b"\xc3", b"\x55\x48\x89\xe5", b"\xff"]
+        for bits in [None, 32]:
+            expected = {}
+            for x in matches:
+                options = [] if bits is None else ["-b", str(bits)]
+                expected[("x86", x)] = subprocess.check_output(
+                    ["rasm2", "-a", "x86"] + options + ["-d", x.hex()]
+                ).decode("latin-1")
+            r2pipes = [None] + ([hexmatch.r2pipe] if hexmatch.r2pipe else [])
+            for r2pipe in r2pipes:
+                with unittest.mock.patch.object(hexmatch, "r2pipe", r2pipe):
+                    disassembler = Disassembler(["x86"], None, bits=bits)
+                    disassembly = disassembler.disassemble(matches)
+                    disassembler.close()
+                self.assertDictEqual(disassembly, expected)
+
+    @unittest.skipIf(hexmatch.np is None, "requires numpy")
+    def test_match_ranges(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            # Values close to the needle, some of them padded.
+            data = random_content(rng, 500, b"\x00\x00\x01\x02\x03\xfe\xff")
+            raw_bytes = random_content(rng, rng.randint(1, 3), b"\x00\x01\x02\xff")
+            endianness = rng.choice([["be"], ["le"], ["be", "le"]])
+            k = rng.randint(0, 4)
+            variants = needle_ranges(raw_bytes, endianness, k, 3)
+            # Each variant matches its values together.
+            expected = [[] for _ in variants]
+            for i, e, needle in needle_variants(raw_bytes, endianness, k, 3):
+                n = [(e, len(x)) for _, e, x in variants].index((e, len(needle)))
+                expected[n] += match(data, needle, False)
+            self.assertListEqual(
+                match_ranges(data, variants), [sorted(x) for x in expected]
+            )
+
+    @unittest.skipIf(hexmatch.np is None, "requires numpy")
+    def test_match_ranges_large_k(self):
+        # Values aren't enumerated, so this doesn't depend on k.
+        rng = random.Random(0)
+        data = random_content(rng, 2000, b"\x00\x00\x00\x01\x02\xff")
+        (k, raw_bytes) = (10 ** 12, (2 ** 40).to_bytes(8, "big"))
+        variants = needle_ranges(raw_bytes, ["be", "le"], k, 1)
+        self.assertListEqual([len(i) for i, _, _ in variants], [2 * k + 1] * 2)
+        expected = []
+        for start in range(len(data) - 7):
+            for e in ["be", "le"]:
+                value = hexmatch.window_value(data[start : start + 8], 0, e)
+                if abs(value - 2 ** 40) <= k:
+                    expected.append((start, value - 2 ** 40, e, data[start : start + 8]))
+        self.assertGreater(len(expected), 0)
+        self.assertListEqual(
+            [
+                (start, *matched_variant(variants, n, x))
+                for start, n, x in iter_matches(data, match_ranges(data, variants))
+            ],
+            expected,
+        )
+
+    def test_match_ranges_file(self):
+        rng = random.Random(0)
+        content = random_content(rng, 1000, b"\x00\x00\x01\x02\x03")
+        filename = self.write("f", content)
+        variants = needle_ranges(b"\x01\x02", ["be", "le"], 2, 2)
+        explicit_variants = needle_variants(b"\x01\x02", ["be", "le"], 2, 2)
+        expected = scan(content, explicit_variants)
+        self.assertGreater(len(expected), 0)
+        expected_variants = sorted(
+            (start, *explicit_variants[n][:2], x) for start, n, x in expected
+        )
+        options = make_options()
+        for block_size in [1, 5, 4096]:
+            with unittest.mock.patch.object(hexmatch, "BLOCK_SIZE", block_size):
+                # Without numpy, values are expanded, then merged by variant.
+                for np in [hexmatch.np, None]:
+                    with unittest.mock.patch.object(hexmatch, "np", np):
+                        matches = flatten(file_results(filename, variants, options))
+                    self.assertListEqual(
+                        sorted(
+                            (start, *matched_variant(variants, n, x))
+                            for start, n, x in matches
+                        ),
+                        expected_variants,
+                    )
+                    self.assertListEqual(
+                        matches, sorted(matches, key=lambda x: x[:2])
+                    )
+
+    def test_iter_matches(self):
+        # Data starting at offset 10, with matches of b"ab", b"bc" and b"abc".
+        data = b"xabcabcab"
+        variants_offsets = [
+            [(11, 13), (14, 16), (17, 19)],
+            [(12, 14), (15, 17)],
+            [(11, 14), (14, 17)],
+        ]
+        self.assertListEqual(
+            list(iter_matches(data, variants_offsets, 10)),
+            [
+                (11, 0, b"ab"),
+                (11, 2, b"abc"),
+                (12, 1, b"bc"),
+                (14, 0, b"ab"),
+                (14, 2, b"abc"),
+                (15, 1, b"bc"),
+                (17, 0, b"ab"),
+            ],
+        )
+
+    def test_match_count(self):
+        rng = random.Random(0)
+        data = random_content(rng, 1000, b"\x00\x00\x01\x02ab")
+        variants = needle_variants(b"\x01\x02", ["be", "le"], 1, 2)
+        needles = [needle for _, _, needle in variants]
+        counts = [len(offsets) for offsets in match_variants(data, needles)]
+        self.assertListEqual(match_variants(data, needles, is_count=True), counts)
+        self.assertListEqual(
+            [match(data, needle, False, True) for needle in needles], counts
+        )
+        if hexmatch.np is not None:
+            ranges = needle_ranges(b"\x01\x02", ["be", "le"], 1, 2)
+            self.assertEqual(
+                sum(match_ranges(data, ranges, is_count=True)), sum(counts)
+            )
+            self.assertListEqual(
+                match_ranges(data, ranges, is_count=True),
+                [len(offsets) for offsets in match_ranges(data, ranges)],
+            )
+
+    def test_file_results_count(self):
+        rng = random.Random(0)
+        content = random_content(rng, 1000, b"\x00\x00\x01\x02ab")
+        filename = self.write("f", content)
+        literal_variants = needle_variants(b"\x01\x02", ["be", "le"], 1, 2)
+        for variants, options in [
+            (literal_variants, make_options()),
+            (literal_variants[:1], make_options()),
+            (literal_variants, make_options(tree=True)),
+            ([(0, "be", b"a.")], make_options(regex=True)),
+            (
+                [(0, "be", index_based_pattern("ab", p)) for p in range(2)],
+                make_options(index_based=True),
+            ),
+        ]:
+            for block_size in [3, 4096]:
+                with unittest.mock.patch.object(hexmatch, "BLOCK_SIZE", block_size):
+                    matches = flatten(file_results(filename, variants, options))
+                    # In increasing offsets, then in the order of variants.
+                    self.assertListEqual(
+                        matches, sorted(matches, key=lambda x: x[:2])
+                    )
+                    options.count = True
+                    self.assertEqual(
+                        sum(file_results(filename, variants, options)), len(matches)
+                    )
+                    options.count = False
+                self.assertGreater(len(matches), 0)
+
+    def test_search_files(self):
+        rng = random.Random(0)
+        contents = [random_content(rng, 20000) for _ in range(5)]
+        filenames = [self.write(f"f{i}", x) for i, x in enumerate(contents)]
+        # Stdin is searched in the main process, between other files.
+        filenames[2] = "-"
+        variants = [(0, "be", b"abca"), (0, "be", b"a\x00")]
+        for count in [False, True]:
+            options = make_options(count=count)
+            expected = []
+            for filename, content in zip(filenames, contents):
+                with unittest.mock.patch.object(
+                    sys, "stdin", io.TextIOWrapper(io.BytesIO(content))
+                ):
+                    expected.append((filename, list(file_results(filename, variants, options))))
+            with unittest.mock.patch.object(
+                sys, "stdin", io.TextIOWrapper(io.BytesIO(contents[2]))
+            ), unittest.mock.patch.object(hexmatch, "RESULT_BATCH_SIZE", 16):
+                # More files than processes, with results in small batches.
+                results = [
+                    (filename, list(blocks))
+                    for filename, blocks in search_files(filenames, variants, options, 2)
+                ]
+            if count:
+                self.assertListEqual(
+                    [(x, sum(blocks)) for x, blocks in results],
+                    [(x, sum(blocks)) for x, blocks in expected],
+                )
+            else:
+                self.assertListEqual(
+                    [(x, flatten(blocks)) for x, blocks in results],
+                    [(x, flatten(blocks)) for x, blocks in expected],
+                )
+                self.assertGreater(len(results[0][1]), 1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+from lrs import _chunk_lrs, _count_occurrences, chunked_lrs, compute_lrs, ENGINES
+import collections
+import os
+import random
+import re
+import tempfile
+import unittest
+
+
+def split_lrs(content):
+    """Reference for `compute_lrs()`, splitting the content on each result,
+    like repeated calls to `parse_contents()`, with ties taken in
+    lexicographic order."""
+    contents = [content]
+    top_substrings = []
+    while sum(len(x) for x in contents) >= 10 and len(top_substrings) <= 10:
+        lrs = None
+        for length in range(max(len(x) for x in contents), 1, -1):
+            counts = collections.Counter(
+                x[i : i + length] for x in contents for i in range(len(x) - length + 1)
+            )
+            repeated = [x for x, count in counts.items() if count > 1]
+            if repeated:
+                lrs = min(repeated)
+                break
+        if lrs is None:
+            break
+        top_substrings.append((lrs, counts[lrs]))
+        contents = [
+            candidate
+            for x in contents
+            for candidate in re.split(re.escape(lrs), x)
+            if len(candidate) > 0
+        ]
+    return top_substrings
+
+
+class Tests(unittest.TestCase):
+    def test_compute_lrs(self):
+        content = b"xyz\nabc\nabc\nfoo 123\nbar baz\nfoo 456\nbar baz\n123\n"
+        for engine in ENGINES:
+            self.assertListEqual(
+                compute_lrs(content, engine=engine),
+                [(b"\nbar baz\n", 2), (b"\nabc\n", 2), (b"foo ", 2), (b"123", 2)],
+            )
+
+    def test_same_as_split(self):
+        contents = [
+            b"ab\nabab\nbab\n\nbaab\nabbbba\nab\nabab\n" * 3,
+            # Shorter repeats are left in occurrences of "\nbc".
+            b"cc\ncc\ncc\nbc\nca\nca\ncc\nca\ncb\ncc\ncb\ncb\nbc\ncb\nca\nbc\nbc",
+        ]
+        rng = random.Random(0)
+        for _ in range(100):
+            alphabet = b"abc\n"[: rng.randint(2, 4)]
+            contents.append(bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 60))))
+        for content in contents:
+            expected = split_lrs(content)
+            for engine in ENGINES:
+                self.assertListEqual(compute_lrs(content, engine=engine), expected)
+
+    def test_chunked_lrs(self):
+        content = b"xyz\nabc\nabc\nfoo 123\nbar baz\nfoo 456\nbar baz\n123\n"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            with open(filename, "wb") as f:
+                f.write(content)
+            self.assertListEqual(
+                chunked_lrs(filename, 40, chunk_overlap=16, processes=2),
+                [(b"\nbar baz\n", 2), (b"\nabc\n", 2), (b"foo ", 2), (b"123", 2)],
+            )
+
+    def test_chunked_lrs_recount(self):
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            for _ in range(10):
+                content = bytes(rng.choice(b"ab\n") for _ in range(rng.randint(50, 300)))
+                with open(filename, "wb") as f:
+                    f.write(content)
+                chunk_size = rng.randint(20, 80)
+                candidates = set()
+                for start in range(0, len(content), chunk_size):
+                    candidates.update(
+                        _chunk_lrs((filename, start, chunk_size + 8, "stree"))
+                    )
+                candidates = tuple(sorted(candidates, key=lambda x: (-len(x), x)))
+                # Each candidate decided with counts over the whole file.
+                is_taken = [None] * len(candidates)
+                expected = []
+                for i, candidate in enumerate(candidates):
+                    count = _count_occurrences(
+                        (filename, 0, len(content), candidates, is_taken)
+                    )[i]
+                    is_taken[i] = count > 1
+                    if is_taken[i]:
+                        expected.append((candidate, count))
+                        if len(expected) > 10:
+                            break
+                self.assertListEqual(
+                    chunked_lrs(filename, chunk_size, 8, processes=2), expected
+                )
+
+    def test_count_occurrences(self):
+        rng = random.Random(0)
+        content = b"".join(
+            b"\x00" * rng.randint(1, 64) + bytes(rng.choice(b"ab") for _ in range(32))
+            for _ in range(16)
+        )
+        candidates = (b"\x00" * 9, b"\x00\x00ab", b"abab", b"\x00\x00", b"ba")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            with open(filename, "wb") as f:
+                f.write(content)
+            for is_taken in [[None] * 5, [True, False, None, False, None]]:
+                expected = _count_occurrences(
+                    (filename, 0, len(content), candidates, is_taken)
+                )
+                # Chunks are shifted to positions that no occurrence spans,
+                # such as the end of runs of zeros.
+                for chunk_size in [7, 16, 100]:
+                    counts = [0] * len(candidates)
+                    for start in range(0, len(content), chunk_size):
+                        chunk_counts = _count_occurrences(
+                            (filename, start, chunk_size, candidates, is_taken)
+                        )
+                        counts = [x + y for x, y in zip(counts, chunk_counts)]
+                    self.assertListEqual(counts, expected)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+from ngram_index import NgramIndex, decode_varints, encode_varints, open_index
+import numpy as np
+import os
+import random
+import tempfile
+import unittest
+
+
+def find_all_naive(content, y):
+    return {
+        i for i in range(len(content) - len(y) + 1) if content[i : i + len(y)] == y
+    }
+
+
+class Tests(unittest.TestCase):
+    def test_varints(self):
+        values = np.array([0, 1, 127, 128, 300, 2 ** 35, 2 ** 63 + 5], dtype=np.uint64)
+        (encoded, starts) = encode_varints(values)
+        self.assertEqual(len(encoded), 1 + 1 + 1 + 2 + 2 + 6 + 10)
+        self.assertListEqual(starts.tolist(), [0, 1, 2, 3, 5, 7, 13])
+        self.assertListEqual(decode_varints(encoded).tolist(), values.tolist())
+
+    def test_find_all(self):
+        index = NgramIndex(b"abcdefghab")
+        self.assertSetEqual(index.find_all(b"abcde"), {0})
+        self.assertSetEqual(index.find_all(b"ab"), {0, 8})
+        self.assertSetEqual(index.find_all(b"b"), {1, 9})
+        self.assertSetEqual(index.find_all(b"x"), set())
+        self.assertSetEqual(index.find_all(b"habx"), set())
+
+        rng = random.Random(0)
+        for _ in range(100):
+            content = bytes(rng.choice(b"ab\x00\xff") for _ in range(rng.randint(0, 200)))
+            index = NgramIndex(content, rng.choice([2, 3, 4]))
+            for _ in range(10):
+                start = rng.randint(0, len(content))
+                y = content[start : start + rng.randint(1, 12)] or b"a"
+                self.assertSetEqual(index.find_all(y), find_all_naive(content, y))
+
+    def test_open_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            with open(filename, "wb") as f:
+                f.write(b"pq\xa4/pqpqm\x14\x0ci\x96\xaa")
+            index = open_index(filename)
+            self.assertTrue(os.path.exists(filename + ".ng4"))
+            self.assertSetEqual(index.find_all(b"pq"), {0, 4, 6})
+            self.assertSetEqual(index.find_all(b"pqpqm"), {4})
+            self.assertSetEqual(index.find_all(b"\xaa"), {13})
+
+            # Same size, different contents.
+            with open(filename, "r+b") as f:
+                f.write(b"\xaa")
+            index = open_index(filename)
+            self.assertSetEqual(index.find_all(b"\xaa"), {0, 13})
+            self.assertSetEqual(index.find_all(b"pq"), {4, 6})
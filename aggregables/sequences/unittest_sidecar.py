@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+from aggregables.sequences.sidecar import SidecarHeader, file_digest, write_sidecar
+import io
+import os
+import tempfile
+import unittest
+
+HEADER = SidecarHeader(b"TESTIDX1", "I", 64)
+
+
+class Tests(unittest.TestCase):
+    def test_write_sidecar(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "input.idx")
+            write_sidecar(path, lambda f: f.write(b"old"))
+            write_sidecar(path, lambda f: f.write(b"new"))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"new")
+            self.assertListEqual(os.listdir(tmp_dir), ["input.idx"])
+
+            # A failed write keeps the previous index.
+            def write(f):
+                f.write(b"partial")
+                raise ValueError()
+
+            with self.assertRaises(ValueError):
+                write_sidecar(path, write)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"new")
+            self.assertListEqual(os.listdir(tmp_dir), ["input.idx"])
+
+    def test_read_valid(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            path = filename + ".idx"
+            with open(filename, "wb") as f:
+                f.write(b"abcd")
+            self.assertEqual(HEADER.read(path), None)
+
+            with open(filename, "rb") as f:
+                stat = os.fstat(f.fileno())
+                digest = file_digest(f)
+                self.assertEqual(digest, file_digest(io.BytesIO(b"abcd")))
+                write_sidecar(
+                    path,
+                    lambda index_f: HEADER.write(
+                        index_f, stat.st_size, stat.st_mtime_ns, digest, 7
+                    ),
+                )
+                self.assertEqual(os.path.getsize(path), 64)
+                self.assertEqual(
+                    HEADER.read_valid(f, path, (7,)),
+                    ((4, stat.st_mtime_ns, digest, 7), None),
+                )
+                self.assertEqual(HEADER.read_valid(f, path, (8,)), (None, None))
+
+            # Same contents, different modification time.
+            os.utime(filename, ns=(0, 0))
+            with open(filename, "rb") as f:
+                self.assertEqual(
+                    HEADER.read_valid(f, path), ((4, 0, digest, 7), digest)
+                )
+            self.assertEqual(HEADER.read(path), (4, 0, digest, 7))
+
+            # Same size, different contents.
+            with open(filename, "r+b") as f:
+                f.write(b"x")
+            with open(filename, "rb") as f:
+                (header, new_digest) = HEADER.read_valid(f, path)
+            self.assertEqual(header, None)
+            self.assertNotEqual(new_digest, digest)
+
+            self.assertEqual(SidecarHeader(b"OTHERIDX", "I", 64).read(path), None)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+from suffix_array import SuffixArray, open_index
+import os
+import random
+import suffix_array
+import tempfile
+import unittest
+import unittest.mock
+
+
+class Tests(unittest.TestCase):
+    def test_find(self):
+        sa = SuffixArray("abcdefghab")
+        self.assertEqual(sa.find("abc"), 0)
+        self.assertEqual(sa.find("x"), -1)
+        self.assertSetEqual(sa.find_all("ab"), {0, 8})
+        sa = SuffixArray(b"abc\x00defghab")
+        self.assertEqual(sa.find(b"def"), 4)
+        self.assertSetEqual(sa.find_all(b"ab"), {0, 9})
+
+    def test_lrs(self):
+        sa = SuffixArray(b"pq\xa4/pqpqm\x14\x0ci\x96\xaa")
+        self.assertEqual(sa.lrs(), b"pq")
+        self.assertEqual(sa.lrs(3), b"pq")
+        self.assertEqual(sa.lrs(4), b"")
+        sa = SuffixArray(b"\x00" * 100)
+        self.assertEqual(sa.lrs(), b"\x00" * 99)
+        self.assertEqual(sa.lrs(50), b"\x00" * 51)
+
+    def test_lcs(self):
+        a = ["abeceda", "abecednik", "abeabecedabeabeced",
+             "abecedaaaa", "aaabbbeeecceeeddaaaaabeceda"]
+        sa = SuffixArray(a)
+        self.assertEqual(sa.lcs(), "abeced")
+        sa = SuffixArray([b"xxxa", b"adsaabc", b"ytysabcrew", b"aqqqqqqw", b"aaabc"])
+        self.assertEqual(sa.lcs(), b"a")
+        self.assertEqual(sa.lcs([1, 2, 4]), b"abc")
+
+    def test_open_index(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            with open(filename, "wb") as f:
+                f.write(b"pq\xa4/pqpqm\x14\x0ci\x96\xaa")
+            sa = open_index(filename)
+            self.assertEqual(sa.lrs(), b"pq")
+            self.assertSetEqual(sa.find_all(b"pq"), {0, 4, 6})
+            self.assertEqual(sa.find(b"\xaa"), 13)
+            self.assertEqual(sa.find(b"\xaa\x00"), -1)
+
+            # Same size, different contents.
+            with open(filename, "r+b") as f:
+                f.write(b"\xaa")
+            sa = open_index(filename)
+            self.assertSetEqual(sa.find_all(b"\xaa"), {0, 13})
+            self.assertSetEqual(sa.find_all(b"pq"), {4, 6})
+
+    def test_open_index_batches(self):
+        rng = random.Random(0)
+        contents = [b"\x00" * 100, b"ab" * 50 + b"\x00" * 30 + b"ab" * 20]
+        for _ in range(10):
+            content = bytes(rng.choice(b"ab\x00") for _ in range(rng.randint(1, 300)))
+            contents.append(content + b"\x00" * rng.randint(0, 50) + content)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "input")
+            for content in contents:
+                with open(filename, "wb") as f:
+                    f.write(content)
+                expected = SuffixArray(content)
+                # Groups larger than a batch are sorted by ranges of keys.
+                for batch_size in [1, 3, 64, 4096]:
+                    with unittest.mock.patch.object(
+                        suffix_array, "BUILD_BATCH_SIZE", batch_size
+                    ):
+                        if os.path.exists(filename + ".sa"):
+                            os.remove(filename + ".sa")
+                        sa = open_index(filename)
+                    self.assertListEqual(sa.sa.tolist(), expected.sa.tolist())
+                    self.assertListEqual(sa.lcp.tolist(), expected.lcp.tolist())
+                    del sa
+                # Temporary files are removed.
+                self.assertListEqual(sorted(os.listdir(tmp_dir)), ["input", "input.sa"])